@@ -5,7 +5,11 @@ HOST="redman.xyz"
 DESTDIR="/home/enneract/szachy"
 
 ssh "$HOST" systemctl --user stop szachy
-ssh "$HOST" rm -r "$DESTDIR"
-ssh "$HOST" mkdir "$DESTDIR"
-tar -czf - -T <(git ls-tree -r --name-only HEAD) | ssh "$HOST" tar -C "$DESTDIR" -xzf -
+# Keep the database, the server picks up imported games by itself when run
+# with --reload.
+ssh "$HOST" mkdir -p "$DESTDIR"
+ssh "$HOST" find "$DESTDIR" -mindepth 1 -maxdepth 1 ! -name "'szachy.db*'" -exec rm -r {} +
+# Assets are built here, where fontTools and Pillow are installed.
+python3 -m szachy assets
+tar -czf - -T <(git ls-tree -r --name-only HEAD; find szachy/build -type f) | ssh "$HOST" tar -C "$DESTDIR" -xzf -
 ssh "$HOST" systemctl --user start szachy
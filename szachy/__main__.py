@@ -1,5 +1,23 @@
-from szachy.web import main
+import importlib
+import sys
+import time
+
+# Subcommands, each a module with a main(argv) function. Without one, the
+# web server is started.
+COMMANDS = {
+    'assets': 'szachy.assets',
+    'import': 'szachy.importer',
+    'pair': 'szachy.pairing',
+    'simulate': 'szachy.simulation',
+    'snapshot': 'szachy.snapshot',
+    'validate': 'szachy.validate',
+}
 
 
 if __name__ == '__main__':
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        importlib.import_module(COMMANDS[sys.argv[1]]).main(sys.argv[2:])
+    else:
+        start = time.perf_counter()
+        from szachy.web import main
+        main(time.perf_counter() - start)
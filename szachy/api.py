@@ -0,0 +1,209 @@
+"""
+JSON and NDJSON representations served under /api.
+
+Collections are streamed one record per line and paginated with cursors, the
+last gid or tournament id seen: a response cut short by a limit carries a Link
+header pointing at the next page.
+"""
+from bisect import bisect_right
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+import json
+
+from aiohttp import web
+import numpy as np
+import numpy.typing as npt
+
+from szachy.chess import Score, TotalScore, Tournament, compute_ranking
+from szachy.games import Game
+from szachy.headtohead import HeadToHead, Meeting
+from szachy.timeline import PlayerEvent
+
+Record = Dict[str, Any]
+
+RESULTS = {0: '0-1', 1: '1/2-1/2', 2: '1-0'}
+STREAM_BATCH = 256  # Lines per write to the socket
+
+
+def ranking_records(
+    ratings: Dict[str, int],
+    total_scores: Dict[str, TotalScore],
+    established: Callable[[str], bool],
+    deviations: Optional[Dict[str, int]] = None,
+) -> List[Record]:
+    """
+    Players with an established rating by rank, followed by the others
+    without one, as on the index page. Deviations are null without them.
+    """
+    def record(rank: Optional[int], player: str, rating: int) -> Record:
+        return {
+            'rank': rank,
+            'player': player,
+            'rating': rating,
+            'deviation': deviations.get(player) if deviations is not None else None,
+            'wins': total_scores[player].wins,
+            'draws': total_scores[player].draws,
+            'losses': total_scores[player].losses,
+        }
+
+    ranked = {player: rating for player, rating in ratings.items() if established(player)}
+    unranked = {player: rating for player, rating in ratings.items() if player not in ranked}
+    return [
+        *(record(rank, player, rating) for rank, player, rating in compute_ranking(ranked, lambda rating: rating)),
+        *(record(None, player, rating) for _, player, rating in compute_ranking(unranked, lambda rating: rating)),
+    ]
+
+
+def _score_record(score: Score, initial_rating: int) -> Record:
+    return {
+        'games': score.games_played,
+        'score': score.actual / 2,
+        'expected': round(score.expected / 2, 3),
+        'initial_rating': initial_rating,
+        'adjustment': score.adjustment,
+    }
+
+
+def tournament_record(tournament: Tournament) -> Record:
+    return {
+        'id': tournament.tid,
+        'date': tournament.date.isoformat(),
+        'location': tournament.location,
+        'ranked': tournament.ranked,
+        'scores': {
+            player: _score_record(score, tournament.initial_ratings[player])
+            for player, score in tournament.scores.items()
+        },
+        'games': [game.gid for game in tournament.games],
+    }
+
+
+def game_record(game: Game, tournament: Tournament) -> Record:
+    return {
+        'gid': game.gid,
+        'tournament': tournament.tid,
+        'date': tournament.date.isoformat(),
+        'white': game.white,
+        'white_rating': game.white_rating,
+        'black': game.black,
+        'black_rating': game.black_rating,
+        'result': RESULTS[game.score],
+        'termination': game.termination.name.lower(),
+        'pgn': game.pgn,
+        'chess_com_embed': game.chess_com_embed,
+    }
+
+
+def player_records(events: Iterable[PlayerEvent], tournaments: Sequence[Tournament]) -> Iterator[Record]:
+    for event in events:
+        yield {
+            'tournament': tournaments[event.tid].tid,
+            'date': event.date.isoformat(),
+            'location': tournaments[event.tid].location,
+            'ranked': tournaments[event.tid].ranked,
+            'games': event.games_played,
+            'score': event.actual / 2,
+            'rating_before': event.rating_before,
+            'rating_after': event.rating_after,
+            'adjustment': event.adjustment,
+            'gids': event.gids,
+        }
+
+
+def head_to_head_record(record: HeadToHead, meetings: Iterable[Meeting], tournaments: Sequence[Tournament]) -> Record:
+    return {
+        'player': record.player,
+        'opponent': record.opponent,
+        'games': record.games,
+        'wins': record.wins,
+        'draws': record.draws,
+        'losses': record.losses,
+        'white_games': record.white_games,
+        'black_games': record.black_games,
+        'meetings': [
+            {
+                'gid': meeting.gid,
+                'tournament': tournaments[meeting.tid].tid,
+                'date': meeting.date.isoformat(),
+                'location': tournaments[meeting.tid].location,
+                'white': meeting.white,
+                'white_rating': meeting.white_rating,
+                'black': meeting.black,
+                'black_rating': meeting.black_rating,
+                'result': RESULTS[meeting.score],
+            }
+            for meeting in meetings
+        ],
+    }
+
+
+def chronological_key(tournament: Tournament) -> int:
+    """
+    Cursor of a tournament in lists in chronological order, increasing like
+    the order of the store (by date, then id). Unlike a position in the list,
+    it does not change when an earlier tournament is added.
+    """
+    assert tournament.tid is not None, 'tournament not from the store'
+    return tournament.date.toordinal() << 32 | tournament.tid
+
+
+def parse_page(request: web.Request) -> Tuple[Optional[int], Optional[int]]:
+    """
+    The cursor and limit query parameters. Raises HTTPBadRequest.
+    """
+    try:
+        cursor = int(request.query['po']) if 'po' in request.query else None
+        limit = int(request.query['limit']) if 'limit' in request.query else None
+    except ValueError:
+        raise web.HTTPBadRequest
+    if limit is not None and limit <= 0:
+        raise web.HTTPBadRequest
+    return cursor, limit
+
+
+def page(
+    keys: Union[Sequence[int], npt.NDArray[np.int64]],
+    cursor: Optional[int],
+    limit: Optional[int],
+) -> Tuple[range, Optional[int]]:
+    """
+    Indices of the items with keys (in increasing order) after the cursor, and
+    the cursor of the next page if there is one.
+    """
+    start = 0 if cursor is None else bisect_right(keys, cursor)
+    end = len(keys) if limit is None else min(len(keys), start + limit)
+    return range(start, end), int(keys[end - 1]) if end < len(keys) else None
+
+
+def dumps(data: Any) -> str:
+    return json.dumps(data, ensure_ascii=False)
+
+
+async def stream_ndjson(
+    request: web.Request,
+    records: Iterable[Record],
+    next_page: Optional[str] = None,
+) -> web.StreamResponse:
+    """
+    Write records as newline-delimited JSON while they are produced.
+    """
+    response = web.StreamResponse(headers={'Cache-Control': 'no-cache'})
+    response.content_type = 'application/x-ndjson'
+    response.charset = 'utf-8'
+    if next_page is not None:
+        response.headers['Link'] = f'<{next_page}>; rel="next"'
+    response.enable_compression()
+    await response.prepare(request)
+
+    lines: List[str] = []
+    for record in records:
+        lines.append(dumps(record))
+        if len(lines) >= STREAM_BATCH:
+            lines.append('')
+            await response.write('\n'.join(lines).encode())
+            lines.clear()
+    if lines:
+        lines.append('')
+        await response.write('\n'.join(lines).encode())
+
+    await response.write_eof()
+    return response
@@ -0,0 +1,277 @@
+"""
+Build of the static assets for long-lived caching.
+
+Every asset referenced by style.css or listed in IMAGES is written to the
+build directory under a name with a hash of its content, so it can be cached
+forever and a changed one gets a new URL. Fonts are subsetted to the
+characters pages use and converted to WOFF2, images get WebP versions in
+several widths, and style.css is rendered once and precompressed.
+
+Subsetting needs fontTools and WebP conversion Pillow. Without them fonts and
+images are only fingerprinted.
+
+Usage: python -m szachy assets [--output PATH]
+"""
+from importlib import resources
+from typing import Any, Dict, List, Optional, Set, Tuple
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from jinja2 import Environment, PackageLoader
+
+try:
+    import brotli  # type: ignore
+except ImportError:
+    brotli = None
+
+try:
+    from fontTools import subset  # type: ignore
+except ImportError:
+    subset = None
+
+try:
+    from PIL import Image  # type: ignore[import-not-found, unused-ignore]
+except ImportError:
+    Image = None  # type: ignore[assignment, unused-ignore]
+
+FORMAT_VERSION = 1
+BUILD_PATH = str(resources.files('szachy') / 'build')
+MANIFEST = 'manifest.json'
+
+STYLESHEET = 'style.css'  # Template rendered into an asset
+IMAGES = ('background.jpg', 'riczart.jpg')  # Referenced by pages
+IMAGE_WIDTHS = (480, 960, 1440)  # Of WebP versions, the original one is always made too
+WEBP_QUALITY = 80
+
+# Characters kept in subsetted fonts: ASCII, Latin-1 (with ½ and ±), Latin
+# Extended-A (with the Polish letters) and general punctuation (with dashes).
+FONT_UNICODES = [*range(0x20, 0x7f), *range(0xa0, 0x180), *range(0x2000, 0x2070)]
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+Variants = List[Tuple[int, str]]  # WebP versions of an image: width and file name
+
+
+def _read_source(path: str) -> bytes:
+    return (resources.files('szachy') / path).read_bytes()
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class _Builder:
+    def __init__(self, output: str) -> None:
+        self.output = output
+        self.files: Dict[str, str] = {}  # Asset name -> built file name
+        self.variants: Dict[str, Variants] = {}
+        self.sources: Dict[str, str] = {}  # Path in the package -> SHA-256 of its content
+
+    def _emit(self, name: str, data: bytes) -> str:
+        stem, extension = os.path.splitext(name)
+        file_name = f'{stem}.{_digest(data)[:16]}{extension}'
+        with open(os.path.join(self.output, file_name), 'wb') as file:
+            file.write(data)
+        return file_name
+
+    def _source(self, path: str) -> bytes:
+        data = _read_source(path)
+        self.sources[path] = _digest(data)
+        return data
+
+    def url(self, name: str) -> str:
+        """
+        Built file name of a static asset, building it on first use. Being
+        relative, it works from the built stylesheet.
+        """
+        if name in self.files:
+            return self.files[name]
+
+        data = self._source(f'static/{name}')
+        stem, extension = os.path.splitext(name)
+        built_name = name
+        if extension == '.ttf' and subset is not None:
+            options = subset.Options()
+            options.flavor = 'woff2'
+            font = subset.load_font(io.BytesIO(data), options)
+            subsetter = subset.Subsetter(options)
+            subsetter.populate(unicodes=FONT_UNICODES)
+            subsetter.subset(font)
+            buffer = io.BytesIO()
+            subset.save_font(font, buffer, options)
+            data, built_name = buffer.getvalue(), f'{stem}.woff2'
+        file_name = self.files[name] = self._emit(built_name, data)
+        return file_name
+
+    def image(self, name: str) -> None:
+        self.url(name)
+        if Image is None:
+            return
+
+        stem, _ = os.path.splitext(name)
+        with Image.open(io.BytesIO(_read_source(f'static/{name}'))) as image:
+            width, height = image.size
+            variants = []
+            for variant_width in sorted({*(w for w in IMAGE_WIDTHS if w < width), width}):
+                resized = image.resize((variant_width, round(height * variant_width / width)), Image.Resampling.LANCZOS)
+                buffer = io.BytesIO()
+                resized.save(buffer, 'WEBP', quality=WEBP_QUALITY)
+                variants.append((variant_width, self._emit(f'{stem}-{variant_width}.webp', buffer.getvalue())))
+        self.variants[name] = variants
+
+    def variants_of(self, name: str) -> Variants:
+        return self.variants.get(name, [])
+
+    def stylesheet(self) -> None:
+        environment = Environment(loader=PackageLoader('szachy'), autoescape=True)
+        environment.globals.update(asset_url=self.url, asset_variants=self.variants_of)
+        self._source(f'templates/{STYLESHEET}')
+        data = environment.get_template(STYLESHEET).render().encode('utf-8')
+
+        file_name = self.files[STYLESHEET] = self._emit(STYLESHEET, data)
+        path = os.path.join(self.output, file_name)
+        # Served in place of the file by aiohttp to clients accepting them.
+        with open(f'{path}.gz', 'wb') as file:
+            file.write(gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(f'{path}.br', 'wb') as file:
+                file.write(brotli.compress(data, quality=11))
+
+
+def build(output: str = BUILD_PATH) -> Dict[str, Any]:
+    """
+    Build the assets into the output directory, replacing an earlier build,
+    and return the manifest written there. Raises FileExistsError for an
+    existing directory that is neither empty nor an earlier build.
+
+    The build is made in a new directory next to the output and renamed into
+    place, so a failed one leaves the previous build as it was.
+    """
+    output = os.path.abspath(output)
+    if os.path.isdir(output) and os.listdir(output) and not os.path.isfile(os.path.join(output, MANIFEST)):
+        raise FileExistsError(f'{output} is not empty and not an asset build')
+
+    parent = os.path.dirname(output)
+    os.makedirs(parent, exist_ok=True)
+    building = tempfile.mkdtemp(dir=parent, prefix='.assets-')
+    try:
+        builder = _Builder(building)
+        for name in IMAGES:
+            builder.image(name)
+        builder.stylesheet()
+
+        manifest = {
+            'version': FORMAT_VERSION,
+            'sources': builder.sources,
+            'files': builder.files,
+            'variants': builder.variants,
+        }
+        with open(os.path.join(building, MANIFEST), 'w') as file:
+            json.dump(manifest, file, indent=2)
+        os.chmod(building, 0o755)  # mkdtemp makes it private
+
+        if os.path.exists(output):
+            previous = tempfile.mkdtemp(dir=parent, prefix='.assets-old-')
+            os.replace(output, previous)
+            os.replace(building, output)
+            shutil.rmtree(previous)
+        else:
+            os.replace(building, output)
+    except BaseException:
+        shutil.rmtree(building, ignore_errors=True)
+        raise
+    return manifest
+
+
+class Assets:
+    """
+    URLs of the static assets for templates: of their build if there is an
+    up to date one, otherwise of the sources.
+    """
+    def __init__(self, webroot: str, directory: str = BUILD_PATH) -> None:
+        self.webroot = webroot
+        self.directory = directory
+        self.files: Dict[str, str] = {}
+        self.variants: Dict[str, Variants] = {}
+        self.built_files: Set[str] = set()  # Served from the directory
+
+        manifest = self._load_manifest()
+        if manifest is not None:
+            self.files = manifest['files']
+            self.variants = {name: [(width, file_name) for width, file_name in variants] for name, variants in manifest['variants'].items()}
+            self.built_files = {*self.files.values(), *(file_name for variants in self.variants.values() for _, file_name in variants)}
+
+    def _load_manifest(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self.directory, MANIFEST)) as file:
+                manifest: Dict[str, Any] = json.load(file)
+        except FileNotFoundError:
+            return None
+
+        if manifest.get('version') != FORMAT_VERSION:
+            return None
+        for path, digest in manifest['sources'].items():
+            try:
+                stale = _digest(_read_source(path)) != digest
+            except FileNotFoundError:
+                stale = True
+            if stale:
+                print(f'Ignoring stale asset build in {self.directory}, {path} has changed', file=sys.stderr)
+                return None
+        return manifest
+
+    @property
+    def built(self) -> bool:
+        return bool(self.files)
+
+    def url(self, name: str) -> str:
+        if name in self.files:
+            return f'{self.webroot}/assets/{self.files[name]}'
+        if name == STYLESHEET:
+            return f'{self.webroot}/{STYLESHEET}'
+        return f'{self.webroot}/static/{name}'
+
+    def variants_of(self, name: str) -> List[Tuple[int, str]]:
+        """
+        Widths and URLs of the WebP versions of an image, empty without a
+        build.
+        """
+        return [(width, f'{self.webroot}/assets/{file_name}') for width, file_name in self.variants.get(name, [])]
+
+    def srcset(self, name: str) -> str:
+        return ', '.join(f'{url} {width}w' for width, url in self.variants_of(name))
+
+    def path(self, file_name: str) -> str:
+        """
+        Path of a built file. Raises KeyError for anything else.
+        """
+        if file_name not in self.built_files:
+            raise KeyError(file_name)
+        return os.path.join(self.directory, file_name)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m szachy assets')
+    parser.add_argument('--output', type=str, default=BUILD_PATH)
+    args = parser.parse_args(argv)
+
+    if subset is None:
+        print('fontTools is not installed, fonts are not subsetted', file=sys.stderr)
+    if Image is None:
+        print('Pillow is not installed, images are not converted to WebP', file=sys.stderr)
+
+    try:
+        manifest = build(args.output)
+    except FileExistsError as error:
+        sys.exit(f'Not building: {error}')
+    source_size = sum(len(_read_source(path)) for path in manifest['sources'])
+    built_names = [*manifest['files'].values(), *(file_name for variants in manifest['variants'].values() for _, file_name in variants)]
+    built_size = sum(os.path.getsize(os.path.join(args.output, file_name)) for file_name in built_names)
+    print(f'{len(built_names)} files, {built_size / 1024:.0f} KiB from {source_size / 1024:.0f} KiB of sources')
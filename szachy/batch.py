@@ -0,0 +1,302 @@
+"""
+Batch Elo replay over integer arrays, for large histories.
+
+Follows the semantics of szachy.chess.compute_ratings exactly: ratings are
+frozen for the duration of a tournament, only adjusted after ranked ones and
+never drop below MINIMUM_RATING. Store.replay_ratings replays everything
+after the last checkpoint with it.
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import DefaultDict, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+from szachy.chess import (
+    K_FACTOR, MINIMUM_RATING, STARTING_RATING, InitialRatings, ScoreColumns, Scores, TotalScore, Tournament,
+    elo_expected_score,
+)
+from szachy.games import GameTable
+from szachy.types import TournamentData
+
+
+@dataclass(frozen=True)
+class History:
+    """
+    Games of consecutive tournaments as flat arrays.
+
+    Games of tournament i are those in range(offsets[i], offsets[i + 1]).
+    Player ids index into players, in order of first appearance.
+    """
+    players: List[str]
+    white: npt.NDArray[np.intp]
+    black: npt.NDArray[np.intp]
+    score: npt.NDArray[np.int8]
+    offsets: npt.NDArray[np.intp]
+    ranked: npt.NDArray[np.bool_]
+
+
+@dataclass(frozen=True)
+class BatchResult:
+    """
+    Scores of tournament i are the rows in range(score_offsets[i],
+    score_offsets[i + 1]), its players in order of their first game in it.
+    """
+    players: List[str]
+    ratings: npt.NDArray[np.int64]  # Final rating of every player
+    white_ratings: npt.NDArray[np.int64]  # Rating of white at the start of each game's tournament
+    black_ratings: npt.NDArray[np.int64]
+    scores: ScoreColumns
+    score_offsets: npt.NDArray[np.intp]
+    wins: npt.NDArray[np.int64]  # Of every player in the games of the history
+    draws: npt.NDArray[np.int64]
+    losses: npt.NDArray[np.int64]
+
+    def ratings_dict(self) -> Dict[str, int]:
+        return dict(zip(self.players, self.ratings.tolist()))
+
+
+def encode_history(tournaments: Iterable[TournamentData], players: Iterable[str] = ()) -> History:
+    """
+    The given players, such as those rated before the history, are numbered
+    first.
+    """
+    player_ids = {player: i for i, player in enumerate(players)}
+    white: List[int] = []
+    black: List[int] = []
+    score: List[int] = []
+    offsets = [0]
+    ranked: List[bool] = []
+
+    for tournament in tournaments:
+        for game in tournament.games:
+            white.append(player_ids.setdefault(game.white, len(player_ids)))
+            black.append(player_ids.setdefault(game.black, len(player_ids)))
+            score.append(game.score)
+        offsets.append(len(white))
+        ranked.append(tournament.ranked)
+
+    return History(
+        players=[*player_ids],
+        white=np.array(white, dtype=np.intp),
+        black=np.array(black, dtype=np.intp),
+        score=np.array(score, dtype=np.int8),
+        offsets=np.array(offsets, dtype=np.intp),
+        ranked=np.array(ranked, dtype=np.bool_),
+    )
+
+
+class _ExpectedScoreTable:
+    """
+    K_FACTOR / 2 times the expected score of white, then of black, for every
+    integer rating difference up to bound, opponent's rating minus own.
+
+    Ratings are integers, so a lookup table computed with the scalar function
+    gives bit-identical results without a float power per game, and scaling
+    by a power of two is exact.
+    """
+    def __init__(self, bound: int) -> None:
+        self.bound = bound
+        differences = range(-bound, bound + 1)
+        self.values = K_FACTOR / 2 * np.array(
+            [elo_expected_score(0, d) for d in differences] + [2 - elo_expected_score(0, -d) for d in differences]
+        )
+
+    def offsets(self, black: npt.NDArray[np.bool_]) -> npt.NDArray[np.intp]:
+        """
+        What to add to the differences of the given sides to index values.
+        """
+        return np.where(black, 3 * self.bound + 1, self.bound)
+
+
+def replay_batch(history: History, ratings: Optional[npt.NDArray[np.int64]] = None) -> BatchResult:
+    """
+    Replay the history from the given ratings of its players, by default
+    STARTING_RATING for everyone.
+    """
+    player_count = len(history.players)
+    tournament_count = len(history.ranked)
+    if ratings is None:
+        ratings = np.full(player_count, STARTING_RATING, dtype=np.int64)
+    else:
+        ratings = ratings.astype(np.int64)
+
+    # White and black of every game interleaved, so that per-player sums are
+    # accumulated in the same order as in the scalar implementation.
+    players = np.stack((history.white, history.black), axis=1).ravel()
+    score = history.score.astype(np.float64)
+    actual = np.stack((score, 2 - score), axis=1).ravel()
+    tournaments = np.repeat(np.arange(tournament_count), 2 * np.diff(history.offsets))
+
+    # Number the (tournament, player) pairs once for the whole history, in
+    # order of their first game. Pairs of tournament i occupy the slots in
+    # range(slot_offsets[i], slot_offsets[i + 1]).
+    _, first, pairs = np.unique(tournaments * player_count + players, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    slot_count = len(order)
+    pair_slots = np.empty(slot_count, dtype=np.intp)
+    pair_slots[order] = np.arange(slot_count)
+    slots = pair_slots[pairs.ravel()]
+    participants = players[first[order]]
+    slot_offsets = np.searchsorted(tournaments[first[order]], np.arange(tournament_count + 1))
+    local_slots = slots - slot_offsets[tournaments]
+    opponent_slots = local_slots.reshape(-1, 2)[:, ::-1].ravel()
+    black = np.arange(len(players)) % 2 == 1
+
+    # Only the ratings depend on earlier tournaments, everything else is
+    # summed over the slots of the whole history at once.
+    games_played = np.bincount(slots, minlength=slot_count)
+    actual_sums = np.bincount(slots, weights=actual, minlength=slot_count)
+    scaled_actual_sums = K_FACTOR / 2 * actual_sums
+
+    # A rating rises by at most K_FACTOR per game, which bounds the rating
+    # differences the table has to cover without looking at every rating.
+    gains = np.zeros(tournament_count, dtype=np.int64)
+    played = slot_offsets[:-1] < slot_offsets[1:]
+    gains[played] = K_FACTOR * np.maximum.reduceat(games_played, slot_offsets[:-1][played])
+    gains[~history.ranked] = 0
+
+    initial_ratings = np.empty(slot_count, dtype=np.int64)
+    scaled_expected_sums = np.zeros(slot_count)
+    ranked = history.ranked.tolist()
+    offsets = (2 * history.offsets).tolist()
+    slot_bounds = slot_offsets.tolist()
+
+    lowest = min(int(ratings.min(initial=STARTING_RATING)), MINIMUM_RATING)
+    highest = int(ratings.max(initial=STARTING_RATING))
+    table = _ExpectedScoreTable(max(1024, 2 * (highest - lowest)))
+    table_offsets = table.offsets(black)
+
+    for i, gain in enumerate(gains.tolist()):
+        start, end = offsets[i], offsets[i + 1]
+        first_slot, last_slot = slot_bounds[i], slot_bounds[i + 1]
+        if start == end:
+            continue
+
+        if highest - lowest > table.bound:
+            highest = int(ratings.max())
+            if highest - lowest > table.bound // 2:
+                table = _ExpectedScoreTable(2 * (highest - lowest))
+                table_offsets = table.offsets(black)
+        highest += gain
+
+        tournament_players = participants[first_slot:last_slot]
+        tournament_ratings = initial_ratings[first_slot:last_slot]
+        ratings.take(tournament_players, out=tournament_ratings)
+        differences = tournament_ratings[opponent_slots[start:end]] - tournament_ratings[local_slots[start:end]]
+        differences += table_offsets[start:end]
+        expected_sums = np.bincount(local_slots[start:end], table.values[differences], last_slot - first_slot)
+        scaled_expected_sums[first_slot:last_slot] = expected_sums
+        if ranked[i]:
+            updated = np.rint(scaled_actual_sums[first_slot:last_slot] - expected_sums + tournament_ratings)
+            ratings.put(tournament_players, np.maximum(updated, MINIMUM_RATING))
+
+    # The same arithmetic again for the adjustments, all tournaments at once.
+    new_ratings = np.maximum(np.rint(scaled_actual_sums - scaled_expected_sums + initial_ratings), MINIMUM_RATING)
+    slot_ranked = np.repeat(history.ranked, np.diff(slot_offsets))
+    adjustments = np.where(slot_ranked, new_ratings - initial_ratings, 0).astype(np.int32)
+
+    wins = np.bincount(history.white[history.score == 2], minlength=player_count)
+    wins += np.bincount(history.black[history.score == 0], minlength=player_count)
+    draws = np.bincount(history.white[history.score == 1], minlength=player_count)
+    draws += np.bincount(history.black[history.score == 1], minlength=player_count)
+    losses = np.bincount(history.white[history.score == 0], minlength=player_count)
+    losses += np.bincount(history.black[history.score == 2], minlength=player_count)
+
+    return BatchResult(
+        players=history.players,
+        ratings=ratings,
+        white_ratings=initial_ratings[slots[0::2]],
+        black_ratings=initial_ratings[slots[1::2]],
+        scores=ScoreColumns(
+            history.players,
+            participants.astype(np.int32),
+            initial_ratings,
+            games_played.astype(np.int32),
+            actual_sums.astype(np.int32),
+            scaled_expected_sums / (K_FACTOR / 2),
+            adjustments,
+        ),
+        score_offsets=slot_offsets,
+        wins=wins,
+        draws=draws,
+        losses=losses,
+    )
+
+
+def replay_tournaments(
+    tournament_data: List[TournamentData],
+    ratings: DefaultDict[str, int],
+    total_scores: DefaultDict[str, TotalScore],
+    table: Optional[GameTable] = None,
+) -> List[Tournament]:
+    """
+    Same as szachy.chess.replay_tournament for consecutive tournaments, but
+    with replay_batch.
+    """
+    if table is None:
+        table = GameTable()
+    history = encode_history(tournament_data, ratings)
+    result = replay_batch(
+        history,
+        np.array([ratings.get(player, STARTING_RATING) for player in history.players], dtype=np.int64),
+    )
+
+    for player, rating, wins, draws, losses in zip(
+        history.players,
+        result.ratings.tolist(),
+        result.wins.tolist(),
+        result.draws.tolist(),
+        result.losses.tolist(),
+    ):
+        ratings[player] = rating
+        if wins or draws or losses:
+            total_scores[player].wins += wins
+            total_scores[player].draws += draws
+            total_scores[player].losses += losses
+
+    white_ratings = iter(result.white_ratings.tolist())
+    black_ratings = iter(result.black_ratings.tolist())
+    score_offsets = result.score_offsets.tolist()
+    tournaments = []
+    for i, tournament in enumerate(tournament_data):
+        start = len(table)
+        for game, white_rating, black_rating in zip(tournament.games, white_ratings, black_ratings):
+            table.append(
+                game.gid,
+                game.white,
+                white_rating,
+                game.black,
+                black_rating,
+                game.pgn,
+                game.score,
+                game.termination,
+                game.chess_com_embed,
+            )
+        tournaments.append(Tournament(
+            tournament.date,
+            tournament.location,
+            table.games(start),
+            tournament.ranked,
+            InitialRatings(result.scores, score_offsets[i], score_offsets[i + 1]),
+            Scores(result.scores, score_offsets[i], score_offsets[i + 1]),
+        ))
+
+    return tournaments
+
+
+def compute_ratings_batch(
+    tournament_data: Iterable[TournamentData],
+) -> Tuple[Dict[str, int], List[Tournament], Dict[str, TotalScore]]:
+    """
+    Same as szachy.chess.compute_ratings, with replay_tournaments.
+    """
+    ratings: DefaultDict[str, int] = defaultdict(lambda: STARTING_RATING)
+    total_scores: DefaultDict[str, TotalScore] = defaultdict(TotalScore)
+    table = GameTable()
+
+    tournaments = replay_tournaments([*tournament_data], ratings, total_scores, table)
+    table.compact()
+
+    return ratings, tournaments, total_scores
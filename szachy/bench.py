@@ -0,0 +1,398 @@
+"""
+Benchmarks on synthetic league histories.
+
+Usage: python -m szachy.bench [--players N] [--games N] [--plies N] [--legacy]
+                              [--perft DEPTH] [--json PATH] [--compare PATH]
+
+Prints the best time and peak memory of every benchmark. --json writes them
+in a machine-readable form, and --compare prints the time ratios against such
+a file from an earlier commit.
+"""
+from collections import defaultdict
+from dataclasses import asdict, dataclass, replace
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Type
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+
+from aiohttp.test_utils import TestClient, TestServer
+import numpy as np
+
+from szachy.batch import History, compute_ratings_batch, replay_batch
+from szachy.board import START_FEN, Board, perft
+from szachy.chess import Tournament, compute_ranking, compute_ratings, elo_expected_score
+from szachy.games import GameTable
+from szachy.rating import Glicko2Engine
+from szachy.simulation import simulate
+from szachy.snapshot import load_snapshot, write_snapshot
+from szachy.store import Store
+from szachy.types import GameData, Termination, TournamentData
+from szachy.web import PlannerView, TournamentView, _abbreviate_name, _make_initials, make_app
+
+KIWIPETE = 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1'
+
+
+class LegacyPlannerView:
+    """
+    PlannerView as it was before it moved to NumPy, kept for comparison.
+    """
+    def __init__(self, ratings: Dict[str, int], tournaments: List[Tournament]) -> None:
+        players = [*ratings.keys()]
+        names = [*map(_abbreviate_name, players)]
+        self.initials = [*map(_make_initials, players)]
+
+        game_counts: Dict[str, int] = defaultdict(int)
+        for tournament in tournaments:
+            for game in tournament.games:
+                game_counts[game.white] += 1
+                game_counts[game.black] += 1
+
+        self.least_played = [
+            (player, count)
+            for rank, player, count in compute_ranking(game_counts, lambda x: -x)
+        ]
+
+        def probability(a: str, a_rating: int, b: str, b_rating: int) -> str:
+            if a == b:
+                return ''
+
+            score = elo_expected_score(a_rating, b_rating)
+            return f'{50 * score:.0f}'
+
+        probability_matrix = [
+            [
+                probability(a, a_rating, b, b_rating)
+                for b, b_rating in ratings.items()
+            ]
+            for a, a_rating in ratings.items()
+        ]
+        self.names_and_probabilities = zip(names, probability_matrix)
+
+        color_counts = [[0 for b in ratings] for a in ratings]
+        for tournament in tournaments:
+            for game in tournament.games:
+                i = players.index(game.white)
+                j = players.index(game.black)
+                color_counts[i][j] += 1
+                color_counts[j][i] -= 1
+
+        self.unpaired_games: List[Tuple[str, str, int]] = []
+        for i, row in enumerate(color_counts):
+            for j, count in enumerate(row):
+                if count <= 0:
+                    continue
+                self.unpaired_games.append((
+                    names[i],
+                    names[j],
+                    count,
+                ))
+
+
+def synthetic_results(
+    players: int,
+    games: int,
+    games_per_tournament: int = 50,
+    seed: int = 0,
+) -> Tuple[Dict[str, int], List[Tournament]]:
+    """
+    Random ratings and already scored tournaments, without replaying them.
+    """
+    rng = random.Random(seed)
+    names = [f'Gracz {i}' for i in range(players)]
+    ratings = {name: rng.randint(100, 1500) for name in names}
+
+    tournaments = []
+    table = GameTable()
+    date = datetime.date(2000, 1, 1)
+    for start in range(0, games, games_per_tournament):
+        for gid in range(start, min(games, start + games_per_tournament)):
+            white, black = rng.sample(names, 2)
+            table.append(
+                gid, white, ratings[white], black, ratings[black], '', rng.randint(0, 2), Termination.RESIGNATION, None,
+            )
+        tournaments.append(Tournament(date, 'Wałbrzych', table.games(start), True, {}, {}))
+        date += datetime.timedelta(days=7)
+
+    return ratings, tournaments
+
+
+def random_movetext(rng: random.Random, plies: int) -> str:
+    """
+    Movetext of a game of random legal moves, shorter if it ends early.
+    """
+    board = Board()
+    tokens = []
+    for ply in range(plies):
+        moves = board.legal_moves()
+        if not moves:
+            break
+        move = rng.choice(moves)
+        if ply % 2 == 0:
+            tokens.append(f'{ply // 2 + 1}.')
+        tokens.append(board.san(move))
+        board.push(move)
+    return ' '.join(tokens)
+
+
+def synthetic_tournaments(
+    players: int,
+    games: int,
+    games_per_tournament: int = 50,
+    seed: int = 0,
+    plies: int = 0,
+) -> List[TournamentData]:
+    """
+    Random raw tournament data, every tenth tournament unranked.
+
+    Games have random legal moves up to the given number of plies, drawn from
+    a pool of a hundred movetexts to keep generation fast.
+    """
+    rng = random.Random(seed)
+    names = [f'Gracz {i}' for i in range(players)]
+    movetexts = [random_movetext(rng, plies) for _ in range(100)] if plies else ['']
+
+    tournaments = []
+    date = datetime.date(2000, 1, 1)
+    for number, start in enumerate(range(0, games, games_per_tournament)):
+        tournament_games = []
+        for gid in range(start, min(games, start + games_per_tournament)):
+            white, black = rng.sample(names, 2)
+            tournament_games.append(GameData(
+                gid, white, black, rng.choice(movetexts), rng.randint(0, 2), Termination.RESIGNATION, None,
+            ))
+        tournaments.append(TournamentData(date, 'Wałbrzych', tournament_games, ranked=number % 10 != 9))
+        date += datetime.timedelta(days=7)
+
+    return tournaments
+
+
+def synthetic_history(players: int, games: int, games_per_tournament: int = 50, seed: int = 0) -> History:
+    """
+    Like synthetic_tournaments, but generated directly as arrays.
+    """
+    rng = np.random.default_rng(seed)
+    white = rng.integers(0, players, games)
+    black = (white + rng.integers(1, players, games)) % players
+    tournament_count = -(-games // games_per_tournament)
+
+    return History(
+        players=[f'Gracz {i}' for i in range(players)],
+        white=white.astype(np.intp),
+        black=black.astype(np.intp),
+        score=rng.integers(0, 3, games, dtype=np.int8),
+        offsets=np.minimum(np.arange(tournament_count + 1) * games_per_tournament, games).astype(np.intp),
+        ranked=np.arange(tournament_count) % 10 != 9,
+    )
+
+
+@dataclass(frozen=True)
+class Measurement:
+    name: str
+    seconds: float  # Best of the timed runs
+    peak_memory: Optional[int]  # Peak of memory allocated during a run, in bytes
+
+
+def measure(name: str, function: Callable[[], object], repeat: int = 3) -> Measurement:
+    """
+    Time the best of a few runs, then trace the memory of one more, since
+    tracemalloc slows everything down.
+    """
+    seconds = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    tracemalloc.start()
+    function()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return Measurement(name, seconds, peak_memory)
+
+
+def bench_ratings(tournament_data: List[TournamentData], legacy: bool) -> Iterator[Measurement]:
+    yield measure('compute_ratings', lambda: compute_ratings(tournament_data))
+    yield measure('compute_ratings_batch', lambda: compute_ratings_batch(tournament_data))
+
+    ratings, tournaments, total_scores = compute_ratings(tournament_data)
+    yield measure('compute_ranking', lambda: [*compute_ranking(ratings, lambda rating: rating)])
+    yield measure('TournamentView', lambda: [*map(TournamentView, tournaments)])
+    yield measure('Glicko2Engine', lambda: Glicko2Engine().rate(ratings, tournaments))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'szachy.snapshot')
+        yield measure('write_snapshot', lambda: write_snapshot(path, 0, 0, ratings, tournaments, total_scores))
+        yield measure('load_snapshot', lambda: load_snapshot(path, 0, 0))
+
+    implementations: List[Type[PlannerView] | Type[LegacyPlannerView]] = [PlannerView]
+    if legacy:
+        implementations.append(LegacyPlannerView)
+
+    for implementation in implementations:
+        def planner() -> None:
+            view = implementation(ratings, tournaments)
+            for name, probabilities in view.names_and_probabilities:
+                pass
+
+        yield measure(implementation.__name__, planner)
+
+
+def bench_batch(players: int, games: int) -> Iterator[Measurement]:
+    history = synthetic_history(players, games)
+    yield measure('replay_batch', lambda: replay_batch(history))
+    small_tournaments = synthetic_history(players, games, games_per_tournament=10)
+    yield measure('replay_batch_small_tournaments', lambda: replay_batch(small_tournaments))
+
+
+def bench_perft(depth: int) -> Iterator[Measurement]:
+    for name, fen in [('start', START_FEN), ('kiwipete', KIWIPETE)]:
+        board = Board(fen)
+        yield measure(f'perft {name} {depth}', lambda: perft(board, depth), repeat=1)
+
+
+def bench_simulation(tournament_data: List[TournamentData], simulations: int = 100000) -> Iterator[Measurement]:
+    """
+    Simulations of the games of the last synthetic tournament.
+    """
+    ratings, _, _ = compute_ratings(tournament_data[:-1])
+    games = [(game.white, game.black) for game in tournament_data[-1].games]
+    yield measure(f'simulate {len(games)} games', lambda: simulate(games, ratings, simulations, seed=0))
+
+
+def bench_requests(tournament_data: List[TournamentData], requests: int = 100) -> Iterator[Measurement]:
+    """
+    The full request path through aiohttp's test client, from a store holding
+    the synthetic history next to the historical tournaments.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'szachy.db')
+        store = Store(database)
+        first_gid = store.next_gid()
+        tournament_data = [
+            replace(tournament, games=[replace(game, gid=first_gid + game.gid) for game in tournament.games])
+            for tournament in tournament_data
+        ]
+        for tournament in tournament_data:
+            store.add_tournament(tournament)
+        store.close()
+
+        # The first start replays the ratings and indexes positions and
+        # openings, which only happens once and is too slow to trace. Later
+        # ones resume from checkpoints.
+        start = time.perf_counter()
+        make_app(database)
+        yield Measurement('first startup', time.perf_counter() - start, None)
+
+        yield measure('startup', lambda: make_app(database), repeat=1)
+
+        app = make_app(database)
+        gids = [game.gid for tournament in tournament_data for game in tournament.games]
+        player = tournament_data[0].games[0].white
+        paths: Dict[str, Callable[[int], str]] = {
+            'GET /': lambda i: '/',
+            'GET /planer': lambda i: '/planer',
+            'GET /gra/{gid}': lambda i: f'/gra/{gids[i % len(gids)]}',
+            'GET /gracz/{name}': lambda i: f'/gracz/{player}',
+            'GET /api/ranking': lambda i: '/api/ranking',
+            'GET /api/gry?limit=100': lambda i: '/api/gry?limit=100',
+        }
+
+        async def run() -> List[Measurement]:
+            results = []
+            async with TestClient(TestServer(app)) as client:
+                for name, path in paths.items():
+                    async def get(count: int) -> None:
+                        for i in range(count):
+                            response = await client.get(path(i))
+                            assert response.status == 200, (path(i), response.status)
+                            await response.read()
+
+                    # The first request renders the page, the rest mostly hit
+                    # the response cache.
+                    start = time.perf_counter()
+                    await get(1)
+                    first = time.perf_counter() - start
+
+                    start = time.perf_counter()
+                    await get(requests)
+                    seconds = (time.perf_counter() - start) / requests
+
+                    tracemalloc.start()
+                    await get(1)
+                    _, peak_memory = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+
+                    results.append(Measurement(f'{name} (first)', first, peak_memory))
+                    results.append(Measurement(name, seconds, peak_memory))
+            return results
+
+        yield from asyncio.run(run())
+
+
+def compare(results: List[Measurement], baseline_path: str) -> None:
+    with open(baseline_path) as file:
+        baseline = {result['name']: result for result in json.load(file)['results']}
+
+    for result in results:
+        if result.name in baseline:
+            ratio = result.seconds / baseline[result.name]['seconds']
+            print(f'{result.name:32} {ratio:6.2f}x time vs {baseline_path}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='python -m szachy.bench')
+    parser.add_argument('--players', type=int, default=200)
+    parser.add_argument('--games', type=int, default=20000)
+    parser.add_argument('--games-per-tournament', type=int, default=50)
+    parser.add_argument('--plies', type=int, default=40, help='length of the synthetic games')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--legacy', action='store_true', help='also time the pre-NumPy planner')
+    parser.add_argument('--perft', type=int, default=3, help='perft depth')
+    parser.add_argument('--no-requests', action='store_true', help='skip the request path benchmarks')
+    parser.add_argument('--json', type=str, default=None, metavar='PATH', help='write the results to a JSON file')
+    parser.add_argument('--compare', type=str, default=None, metavar='PATH', help='compare with earlier JSON results')
+    args = parser.parse_args()
+
+    tournament_data = synthetic_tournaments(
+        args.players, args.games, args.games_per_tournament, args.seed, args.plies,
+    )
+    print(f'{args.players} players, {args.games} games, {len(tournament_data)} tournaments')
+
+    results: List[Measurement] = []
+    benchmarks = [
+        bench_ratings(tournament_data, args.legacy),
+        bench_batch(args.players, args.games),
+        bench_perft(args.perft),
+        bench_simulation(tournament_data),
+    ]
+    if not args.no_requests:
+        benchmarks.append(bench_requests(tournament_data))
+
+    for benchmark in benchmarks:
+        for result in benchmark:
+            memory = f'{result.peak_memory / 2**20:10.1f} MiB' if result.peak_memory is not None else ''
+            print(f'{result.name:32} {result.seconds * 1000:10.2f} ms {memory}')
+            results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({
+                'parameters': vars(args),
+                'python': platform.python_version(),
+                'results': [asdict(result) for result in results],
+            }, file, indent=2)
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
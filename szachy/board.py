@@ -0,0 +1,570 @@
+"""
+Chess rules: a 0x88 board with legal move generation and SAN parsing.
+
+Squares are 0x88 indices (rank * 16 + file, a1 = 0, h8 = 119), pieces are small
+ints (piece type | colour) and moves are packed into ints, so replaying a game
+allocates next to nothing besides the undo stack. Boards keep an incrementally
+updated 64-bit Zobrist hash of the position (ignoring move clocks).
+"""
+from typing import Iterator, List, Optional, Tuple
+import random
+import re
+
+from szachy.pgn import clean_movetext
+
+EMPTY = 0
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(1, 7)
+WHITE, BLACK = 0, 8
+TYPE = 7
+COLOR = 8
+
+PIECE_LETTERS = '.PNBRQK'
+SAN_PIECES = {'N': KNIGHT, 'B': BISHOP, 'R': ROOK, 'Q': QUEEN, 'K': KING}
+
+KNIGHT_OFFSETS = (33, 31, 18, 14, -14, -18, -31, -33)
+BISHOP_OFFSETS = (17, 15, -15, -17)
+ROOK_OFFSETS = (16, 1, -1, -16)
+KING_OFFSETS = BISHOP_OFFSETS + ROOK_OFFSETS
+PROMOTIONS = (QUEEN, ROOK, BISHOP, KNIGHT)
+
+SQUARES = [square for square in range(128) if not square & 0x88]
+
+# Move flags
+FLAG_EN_PASSANT = 1
+FLAG_CASTLE = 2
+FLAG_DOUBLE_PUSH = 3
+
+# Castling rights
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+
+# Castling rights kept when a piece moves from or to a square.
+CASTLING_MASKS = [15] * 128
+CASTLING_MASKS[0x00] = 15 & ~WHITE_QUEENSIDE
+CASTLING_MASKS[0x04] = 15 & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASKS[0x07] = 15 & ~WHITE_KINGSIDE
+CASTLING_MASKS[0x70] = 15 & ~BLACK_QUEENSIDE
+CASTLING_MASKS[0x74] = 15 & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASKS[0x77] = 15 & ~BLACK_KINGSIDE
+
+# Zobrist keys: one per piece and square, for black to move, per combination of
+# castling rights and per en passant file. Fixed seed, so hashes can be stored.
+_zobrist_random = random.Random(0x5A_C4_F3)
+ZOBRIST_PIECES = [[_zobrist_random.getrandbits(64) for square in range(128)] for piece in range(16)]
+ZOBRIST_BLACK = _zobrist_random.getrandbits(64)
+ZOBRIST_CASTLING = [0] + [_zobrist_random.getrandbits(64) for rights in range(1, 16)]
+ZOBRIST_EP = [_zobrist_random.getrandbits(64) for file in range(8)]
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+SAN_PATTERN = re.compile(r'([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?')
+MOVE_NUMBER_PATTERN = re.compile(r'^\d+\.+')
+RESULTS = ('1-0', '0-1', '1/2-1/2', '½-½', '*')
+
+
+class IllegalMoveError(ValueError):
+    pass
+
+
+def encode_move(origin: int, target: int, promotion: int = 0, flag: int = 0) -> int:
+    return origin | target << 7 | promotion << 14 | flag << 17
+
+
+def decode_move(move: int) -> Tuple[int, int, int, int]:
+    """
+    (origin, target, promotion, flag)
+    """
+    return move & 127, move >> 7 & 127, move >> 14 & 7, move >> 17
+
+
+def square_name(square: int) -> str:
+    return 'abcdefgh'[square & 7] + str((square >> 4) + 1)
+
+
+def parse_square(name: str) -> int:
+    if len(name) != 2 or name[0] not in 'abcdefgh' or name[1] not in '12345678':
+        raise ValueError(f'invalid square: {name!r}')
+    return (ord(name[1]) - ord('1')) * 16 + ord(name[0]) - ord('a')
+
+
+class Board:
+    __slots__ = ('squares', 'turn', 'castling', 'ep', 'halfmove', 'fullmove', 'kings', 'hash', '_undo')
+
+    def __init__(self, fen: str = START_FEN) -> None:
+        try:
+            placement, turn, castling, ep, *clocks = fen.split()
+        except ValueError:
+            raise ValueError(f'invalid FEN: {fen!r}')
+
+        self.squares = [EMPTY] * 128
+        self.kings = [-1, -1]  # Indexed by colour >> 3
+        self._undo: List[Tuple[int, int, int, int, int, int]] = []
+
+        ranks = placement.split('/')
+        if len(ranks) != 8:
+            raise ValueError(f'invalid FEN: {fen!r}')
+        for rank, row in zip(range(7, -1, -1), ranks):
+            file = 0
+            for char in row:
+                if char.isdigit():
+                    file += int(char)
+                    continue
+                if char.upper() not in SAN_PIECES and char.upper() != 'P' or file > 7:
+                    raise ValueError(f'invalid FEN: {fen!r}')
+                piece = PIECE_LETTERS.index(char.upper()) | (WHITE if char.isupper() else BLACK)
+                self.squares[rank * 16 + file] = piece
+                if piece & TYPE == KING:
+                    self.kings[piece >> 3] = rank * 16 + file
+                file += 1
+            if file != 8:
+                raise ValueError(f'invalid FEN: {fen!r}')
+
+        if -1 in self.kings or turn not in ('w', 'b'):
+            raise ValueError(f'invalid FEN: {fen!r}')
+
+        self.turn = WHITE if turn == 'w' else BLACK
+        self.castling = sum(bit for letter, bit in zip('KQkq', (1, 2, 4, 8)) if letter in castling)
+        self.ep = -1 if ep == '-' else parse_square(ep)
+        self.halfmove = int(clocks[0]) if clocks else 0
+        self.fullmove = int(clocks[1]) if len(clocks) > 1 else 1
+        self.hash = self._compute_hash()
+
+    def fen(self) -> str:
+        rows = []
+        for rank in range(7, -1, -1):
+            row = ''
+            empty = 0
+            for file in range(8):
+                piece = self.squares[rank * 16 + file]
+                if not piece:
+                    empty += 1
+                    continue
+                if empty:
+                    row += str(empty)
+                    empty = 0
+                letter = PIECE_LETTERS[piece & TYPE]
+                row += letter if piece & COLOR == WHITE else letter.lower()
+            rows.append(row + (str(empty) if empty else ''))
+
+        castling = ''.join(letter for letter, bit in zip('KQkq', (1, 2, 4, 8)) if self.castling & bit)
+        return ' '.join([
+            '/'.join(rows),
+            'w' if self.turn == WHITE else 'b',
+            castling or '-',
+            square_name(self.ep) if self.ep >= 0 else '-',
+            str(self.halfmove),
+            str(self.fullmove),
+        ])
+
+    def attacked(self, square: int, by: int) -> bool:
+        """
+        Whether any piece of the given colour attacks the square.
+        """
+        squares = self.squares
+
+        pawn = PAWN | by
+        for origin in ((square - 15, square - 17) if by == WHITE else (square + 15, square + 17)):
+            if not origin & 0x88 and squares[origin] == pawn:
+                return True
+
+        knight = KNIGHT | by
+        for offset in KNIGHT_OFFSETS:
+            origin = square + offset
+            if not origin & 0x88 and squares[origin] == knight:
+                return True
+
+        king = KING | by
+        for offset in KING_OFFSETS:
+            origin = square + offset
+            if not origin & 0x88 and squares[origin] == king:
+                return True
+
+        bishop, rook, queen = BISHOP | by, ROOK | by, QUEEN | by
+        for offsets, slider in ((BISHOP_OFFSETS, bishop), (ROOK_OFFSETS, rook)):
+            for offset in offsets:
+                origin = square + offset
+                while not origin & 0x88:
+                    piece = squares[origin]
+                    if piece:
+                        if piece == slider or piece == queen:
+                            return True
+                        break
+                    origin += offset
+
+        return False
+
+    def is_check(self) -> bool:
+        return self.attacked(self.kings[self.turn >> 3], self.turn ^ COLOR)
+
+    def _castling_moves(self) -> Iterator[int]:
+        us, them = self.turn, self.turn ^ COLOR
+        king = 0x04 if us == WHITE else 0x74
+        kingside, queenside = (WHITE_KINGSIDE, WHITE_QUEENSIDE) if us == WHITE else (BLACK_KINGSIDE, BLACK_QUEENSIDE)
+        squares = self.squares
+
+        if not self.castling & (kingside | queenside) or squares[king] != KING | us or self.attacked(king, them):
+            return
+        if self.castling & kingside and squares[king + 3] == ROOK | us:
+            if not squares[king + 1] and not squares[king + 2] and not self.attacked(king + 1, them):
+                yield encode_move(king, king + 2, flag=FLAG_CASTLE)
+        if self.castling & queenside and squares[king - 4] == ROOK | us:
+            if not squares[king - 1] and not squares[king - 2] and not squares[king - 3] and not self.attacked(king - 1, them):
+                yield encode_move(king, king - 2, flag=FLAG_CASTLE)
+
+    def pseudo_legal_moves(self) -> List[int]:
+        """
+        Moves that follow the piece movement rules, but may leave the king in check.
+        """
+        us, them = self.turn, self.turn ^ COLOR
+        squares = self.squares
+        moves: List[int] = []
+        append = moves.append
+
+        forward = 16 if us == WHITE else -16
+        start_rank = 1 if us == WHITE else 6
+        last_rank = 7 if us == WHITE else 0
+
+        for origin in SQUARES:
+            piece = squares[origin]
+            if not piece or piece & COLOR != us:
+                continue
+            kind = piece & TYPE
+
+            if kind == PAWN:
+                target = origin + forward
+                if not squares[target]:
+                    if target >> 4 == last_rank:
+                        for promotion in PROMOTIONS:
+                            append(encode_move(origin, target, promotion))
+                    else:
+                        append(encode_move(origin, target))
+                        if origin >> 4 == start_rank and not squares[target + forward]:
+                            append(encode_move(origin, target + forward, flag=FLAG_DOUBLE_PUSH))
+                for target in (origin + forward - 1, origin + forward + 1):
+                    if target & 0x88:
+                        continue
+                    captured = squares[target]
+                    if captured and captured & COLOR == them:
+                        if target >> 4 == last_rank:
+                            for promotion in PROMOTIONS:
+                                append(encode_move(origin, target, promotion))
+                        else:
+                            append(encode_move(origin, target))
+                    elif target == self.ep:
+                        append(encode_move(origin, target, flag=FLAG_EN_PASSANT))
+
+            elif kind == KNIGHT or kind == KING:
+                for offset in (KNIGHT_OFFSETS if kind == KNIGHT else KING_OFFSETS):
+                    target = origin + offset
+                    if target & 0x88:
+                        continue
+                    captured = squares[target]
+                    if not captured or captured & COLOR == them:
+                        append(encode_move(origin, target))
+
+            else:
+                offsets = ROOK_OFFSETS if kind == ROOK else BISHOP_OFFSETS if kind == BISHOP else KING_OFFSETS
+                for offset in offsets:
+                    target = origin + offset
+                    while not target & 0x88:
+                        captured = squares[target]
+                        if captured:
+                            if captured & COLOR == them:
+                                append(encode_move(origin, target))
+                            break
+                        append(encode_move(origin, target))
+                        target += offset
+
+        moves.extend(self._castling_moves())
+        return moves
+
+    def is_legal(self, move: int) -> bool:
+        """
+        Whether a pseudo-legal move does not leave the king in check.
+        """
+        us = self.turn
+        self.push(move)
+        legal = not self.attacked(self.kings[us >> 3], us ^ COLOR)
+        self.pop()
+        return legal
+
+    def legal_moves(self) -> List[int]:
+        return [move for move in self.pseudo_legal_moves() if self.is_legal(move)]
+
+    def has_legal_move(self) -> bool:
+        return any(self.is_legal(move) for move in self.pseudo_legal_moves())
+
+    def is_checkmate(self) -> bool:
+        return self.is_check() and not self.has_legal_move()
+
+    def is_stalemate(self) -> bool:
+        return not self.is_check() and not self.has_legal_move()
+
+    def _ep_key(self) -> int:
+        """
+        Zobrist key of the en passant square, only set if a capture is possible.
+        """
+        if self.ep < 0:
+            return 0
+        pawn = PAWN | self.turn
+        origin = self.ep - 16 if self.turn == WHITE else self.ep + 16
+        for capturer in (origin - 1, origin + 1):
+            if not capturer & 0x88 and self.squares[capturer] == pawn:
+                return ZOBRIST_EP[self.ep & 7]
+        return 0
+
+    def _compute_hash(self) -> int:
+        key = ZOBRIST_CASTLING[self.castling] ^ self._ep_key()
+        if self.turn == BLACK:
+            key ^= ZOBRIST_BLACK
+        for square in SQUARES:
+            if self.squares[square]:
+                key ^= ZOBRIST_PIECES[self.squares[square]][square]
+        return key
+
+    def push(self, move: int) -> None:
+        origin, target, promotion, flag = decode_move(move)
+        squares = self.squares
+        us = self.turn
+        piece = squares[origin]
+        captured = squares[target]
+        moved = promotion | us if promotion else piece
+
+        self._undo.append((move, captured, self.castling, self.ep, self.halfmove, self.hash))
+        key = self.hash ^ self._ep_key() ^ ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_BLACK
+        key ^= ZOBRIST_PIECES[piece][origin] ^ ZOBRIST_PIECES[moved][target]
+        if captured:
+            key ^= ZOBRIST_PIECES[captured][target]
+
+        squares[target] = moved
+        squares[origin] = EMPTY
+
+        if flag == FLAG_EN_PASSANT:
+            square = target - 16 if us == WHITE else target + 16
+            key ^= ZOBRIST_PIECES[squares[square]][square]
+            squares[square] = EMPTY
+        elif flag == FLAG_CASTLE:
+            rook_origin, rook_target = (origin + 3, origin + 1) if target > origin else (origin - 4, origin - 1)
+            rook = squares[rook_origin]
+            key ^= ZOBRIST_PIECES[rook][rook_origin] ^ ZOBRIST_PIECES[rook][rook_target]
+            squares[rook_target], squares[rook_origin] = rook, EMPTY
+
+        if piece & TYPE == KING:
+            self.kings[us >> 3] = target
+
+        self.castling &= CASTLING_MASKS[origin] & CASTLING_MASKS[target]
+        self.ep = (origin + target) >> 1 if flag == FLAG_DOUBLE_PUSH else -1
+        self.halfmove = 0 if captured or piece & TYPE == PAWN else self.halfmove + 1
+        if us == BLACK:
+            self.fullmove += 1
+        self.turn = us ^ COLOR
+        self.hash = key ^ ZOBRIST_CASTLING[self.castling] ^ self._ep_key()
+
+    def pop(self) -> int:
+        """
+        Take back the last move and return it.
+        """
+        move, captured, self.castling, self.ep, self.halfmove, self.hash = self._undo.pop()
+        origin, target, promotion, flag = decode_move(move)
+        squares = self.squares
+        self.turn ^= COLOR
+        us = self.turn
+
+        piece = PAWN | us if promotion else squares[target]
+        squares[origin] = piece
+        squares[target] = captured
+
+        if flag == FLAG_EN_PASSANT:
+            squares[target - 16 if us == WHITE else target + 16] = PAWN | (us ^ COLOR)
+        elif flag == FLAG_CASTLE:
+            if target > origin:
+                squares[origin + 3], squares[origin + 1] = squares[origin + 1], EMPTY
+            else:
+                squares[origin - 4], squares[origin - 1] = squares[origin - 1], EMPTY
+
+        if piece & TYPE == KING:
+            self.kings[us >> 3] = origin
+        if us == BLACK:
+            self.fullmove -= 1
+
+        return move
+
+    def _origins(self, kind: int, target: int) -> List[int]:
+        """
+        Squares of the side to move's pieces of a kind that can move to the target.
+        """
+        us = self.turn
+        squares = self.squares
+        piece = kind | us
+
+        if kind == PAWN:
+            forward = 16 if us == WHITE else -16
+            captured = squares[target]
+            if captured or target == self.ep:
+                return [
+                    origin
+                    for origin in (target - forward - 1, target - forward + 1)
+                    if not origin & 0x88 and squares[origin] == piece
+                ]
+            origin = target - forward
+            if origin & 0x88:
+                return []
+            if squares[origin] == piece:
+                return [origin]
+            if not squares[origin] and target >> 4 == (3 if us == WHITE else 4) and squares[origin - forward] == piece:
+                return [origin - forward]
+            return []
+
+        if kind == KNIGHT or kind == KING:
+            return [
+                target - offset
+                for offset in (KNIGHT_OFFSETS if kind == KNIGHT else KING_OFFSETS)
+                if not (target - offset) & 0x88 and squares[target - offset] == piece
+            ]
+
+        origins = []
+        for offset in ROOK_OFFSETS if kind == ROOK else BISHOP_OFFSETS if kind == BISHOP else KING_OFFSETS:
+            origin = target + offset
+            while not origin & 0x88:
+                if squares[origin]:
+                    if squares[origin] == piece:
+                        origins.append(origin)
+                    break
+                origin += offset
+        return origins
+
+    def parse_san(self, san: str) -> int:
+        """
+        The legal move described by a move in standard algebraic notation.
+        """
+        text = san.rstrip('+#!?')
+
+        if text in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+            for move in self._castling_moves():
+                origin, target, _, _ = decode_move(move)
+                if (target > origin) == (len(text) == 3) and self.is_legal(move):
+                    return move
+            raise IllegalMoveError(f'illegal castling: {san}')
+
+        match = SAN_PATTERN.fullmatch(text)
+        if match is None:
+            raise IllegalMoveError(f'not a move: {san}')
+        letter, file, rank, square, promotion_letter = match.groups()
+
+        kind = SAN_PIECES[letter] if letter else PAWN
+        target = parse_square(square)
+        promotion = SAN_PIECES[promotion_letter] if promotion_letter else 0
+
+        captured = self.squares[target]
+        if captured and captured & COLOR == self.turn:
+            raise IllegalMoveError(f'target square occupied: {san}')
+        if kind == PAWN and (target >> 4 in (0, 7)) != bool(promotion):
+            raise IllegalMoveError(f'invalid promotion: {san}')
+        if kind != PAWN and promotion:
+            raise IllegalMoveError(f'invalid promotion: {san}')
+
+        moves = []
+        for origin in self._origins(kind, target):
+            if file and 'abcdefgh'[origin & 7] != file or rank and str((origin >> 4) + 1) != rank:
+                continue
+
+            flag = 0
+            if kind == PAWN:
+                if abs(target - origin) == 32:
+                    flag = FLAG_DOUBLE_PUSH
+                elif target == self.ep and not captured:
+                    flag = FLAG_EN_PASSANT
+
+            move = encode_move(origin, target, promotion, flag)
+            if self.is_legal(move):
+                moves.append(move)
+
+        if not moves:
+            raise IllegalMoveError(f'illegal move: {san}')
+        if len(moves) > 1:
+            raise IllegalMoveError(f'ambiguous move: {san}')
+        return moves[0]
+
+    def san(self, move: int) -> str:
+        """
+        Standard algebraic notation of a legal move.
+        """
+        origin, target, promotion, flag = decode_move(move)
+        kind = self.squares[origin] & TYPE
+        capture = 'x' if self.squares[target] or flag == FLAG_EN_PASSANT else ''
+
+        if flag == FLAG_CASTLE:
+            text = 'O-O' if target > origin else 'O-O-O'
+        elif kind == PAWN:
+            text = ('abcdefgh'[origin & 7] + capture if capture else '') + square_name(target)
+            if promotion:
+                text += '=' + PIECE_LETTERS[promotion]
+        else:
+            others = [
+                other
+                for other in self._origins(kind, target)
+                if other != origin and self.is_legal(encode_move(other, target))
+            ]
+            disambiguation = ''
+            if others:
+                if all(other & 7 != origin & 7 for other in others):
+                    disambiguation = 'abcdefgh'[origin & 7]
+                elif all(other >> 4 != origin >> 4 for other in others):
+                    disambiguation = str((origin >> 4) + 1)
+                else:
+                    disambiguation = square_name(origin)
+            text = PIECE_LETTERS[kind] + disambiguation + capture + square_name(target)
+
+        self.push(move)
+        if self.is_check():
+            text += '#' if not self.has_legal_move() else '+'
+        self.pop()
+        return text
+
+
+def san_moves(movetext: str) -> Iterator[str]:
+    """
+    Moves of a PGN movetext, skipping comments, variations, move numbers,
+    annotations and the result.
+    """
+    for token in clean_movetext(movetext).split():
+        token = MOVE_NUMBER_PATTERN.sub('', token)
+        if token and token not in RESULTS:
+            yield token
+
+
+def replay(movetext: str, board: Optional[Board] = None) -> Board:
+    """
+    Play all moves of a movetext, raising IllegalMoveError at the first
+    illegal one.
+    """
+    if board is None:
+        board = Board()
+
+    for ply, san in enumerate(san_moves(movetext), 1):
+        try:
+            board.push(board.parse_san(san))
+        except IllegalMoveError as error:
+            raise IllegalMoveError(f'ply {ply}: {error}') from None
+
+    return board
+
+
+def perft(board: Board, depth: int) -> int:
+    """
+    Number of leaf nodes of the legal move tree, for testing move generation.
+    """
+    if depth == 0:
+        return 1
+
+    nodes = 0
+    for move in board.legal_moves():
+        if depth == 1:
+            nodes += 1
+            continue
+        board.push(move)
+        nodes += perft(board, depth - 1)
+        board.pop()
+    return nodes
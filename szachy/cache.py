@@ -0,0 +1,197 @@
+"""
+Cache of rendered responses with ETags and precompressed bodies.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, Iterable, Optional, Tuple
+import asyncio
+import gzip
+import hashlib
+import zlib
+
+from aiohttp import web
+
+try:
+    import brotli  # type: ignore
+except ImportError:
+    brotli = None
+
+BROTLI_MAX_QUALITY_SIZE = 64 * 1024  # Larger bodies are compressed faster, but less
+STREAM_COMPRESSION_LEVEL = 6  # Of bodies compressed while they are sent
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    etag: str  # Of the identity body, those of the others have the encoding appended
+    content_type: str
+    bodies: Dict[str, bytes]  # Content-Encoding -> body, 'identity' is always present
+
+    def etag_of(self, encoding: str) -> str:
+        # Strong validators must differ between content codings.
+        return self.etag if encoding == 'identity' else f'{self.etag}-{encoding}'
+
+
+def _compress(body: bytes) -> Dict[str, bytes]:
+    bodies = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        # The highest quality is two orders of magnitude slower than the next
+        # ones, seconds for a large index page, for a few percent less.
+        quality = 11 if len(body) <= BROTLI_MAX_QUALITY_SIZE else 9
+        bodies['br'] = brotli.compress(body, quality=quality)
+    return bodies
+
+
+def _entry(content_type: str, body: bytes) -> CachedResponse:
+    return CachedResponse(hashlib.sha256(body).hexdigest()[:32], content_type, _compress(body))
+
+
+def _accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    encodings = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            encodings[name.lower()] = quality
+    return encodings
+
+
+def choose_encoding(accept_encoding: str, available: Dict[str, bytes]) -> str:
+    """
+    Pick the smallest available body the client accepts.
+    """
+    accepted = _accepted_encodings(accept_encoding)
+    candidates = [
+        encoding
+        for encoding in available
+        if encoding != 'identity' and accepted.get(encoding, accepted.get('*', 0.0)) > 0
+    ]
+    return min(candidates, key=lambda encoding: len(available[encoding]), default='identity')
+
+
+class ResponseCache:
+    """
+    Rendered responses keyed on the data version they were rendered from.
+
+    Entries from other versions are dropped as soon as a new version is seen.
+    The least recently used entries are evicted past max_entries.
+    """
+    def __init__(self, max_entries: int = 4096) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Tuple[int, Hashable], CachedResponse] = OrderedDict()
+        self._version = 0
+
+    def _lookup(self, version: int, key: Hashable) -> Optional[CachedResponse]:
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+        entry = self._entries.get((version, key))
+        if entry is not None:
+            self._entries.move_to_end((version, key))
+        return entry
+
+    def _store(self, version: int, key: Hashable, entry: CachedResponse) -> None:
+        # A newer version may have been seen while a streamed body was sent.
+        if version == self._version:
+            self._entries[version, key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, version: int, key: Hashable, content_type: str, render: Callable[[], str]) -> CachedResponse:
+        entry = self._lookup(version, key)
+        if entry is None:
+            entry = _entry(content_type, render().encode('utf-8'))
+            self._store(version, key, entry)
+        return entry
+
+    def respond(
+        self,
+        request: web.Request,
+        version: int,
+        key: Hashable,
+        content_type: str,
+        render: Callable[[], str],
+    ) -> web.Response:
+        return self._respond_cached(request, self.get(version, key, content_type, render))
+
+    async def stream(
+        self,
+        request: web.Request,
+        version: int,
+        key: Hashable,
+        content_type: str,
+        render: Callable[[], Iterable[str]],
+        cache: bool = True,
+    ) -> web.StreamResponse:
+        """
+        Like respond, but a body missing from the cache is sent chunk by chunk
+        while it is rendered, compressed on the fly and without an ETag, and
+        cached once complete. Its precompressed bodies are made in a thread.
+
+        Without cache, the body is only streamed: pages for arbitrary user
+        input would otherwise evict the popular ones and cost a maximum
+        compression each.
+        """
+        if cache:
+            entry = self._lookup(version, key)
+            if entry is not None:
+                return self._respond_cached(request, entry)
+
+        chunks = render()
+        headers = {'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache'}
+        accepted = _accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        # Every chunk is flushed through the compressor, so that it reaches
+        # the client as soon as it is rendered.
+        compressor = None
+        if accepted.get('gzip', accepted.get('*', 0.0)) > 0:
+            compressor = zlib.compressobj(STREAM_COMPRESSION_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            headers['Content-Encoding'] = 'gzip'
+        response = web.StreamResponse(headers=headers)
+        response.content_type = content_type
+        response.charset = 'utf-8'
+        await response.prepare(request)
+
+        body = bytearray()
+        for chunk in chunks:
+            data = chunk.encode('utf-8')
+            if cache:
+                body += data
+            if compressor is not None:
+                data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            await response.write(data)
+        if compressor is not None:
+            await response.write(compressor.flush())
+        await response.write_eof()
+
+        if cache:
+            entry = await asyncio.get_running_loop().run_in_executor(None, _entry, content_type, bytes(body))
+            self._store(version, key, entry)
+        return response
+
+    def _respond_cached(self, request: web.Request, entry: CachedResponse) -> web.Response:
+        headers = {'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache'}
+        encoding = choose_encoding(request.headers.get('Accept-Encoding', ''), entry.bodies)
+
+        # Any encoding of the body is still valid, whichever the client has.
+        if_none_match = request.if_none_match
+        etags = {'*', *map(entry.etag_of, entry.bodies)}
+        if if_none_match is not None and any(tag.value in etags for tag in if_none_match):
+            response = web.Response(status=304, headers=headers)
+            response.etag = entry.etag_of(encoding)
+            return response
+
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+
+        response = web.Response(body=entry.bodies[encoding], headers=headers)
+        response.content_type = entry.content_type
+        response.charset = 'utf-8'
+        response.etag = entry.etag_of(encoding)
+        return response
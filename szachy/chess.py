@@ -1,12 +1,17 @@
 """
 Elo ratings and tournament rankings.
 """
+from abc import ABC, abstractmethod
 from collections import defaultdict
-from dataclasses import dataclass
-from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar, Union
+from dataclasses import dataclass, field
+from typing import Any, Callable, DefaultDict, Dict, Generic, Iterable, Iterator, List, Mapping, Optional, Tuple, TypeVar, Union
 import datetime
 
-from szachy.database import TOURNAMENTS, Termination
+import numpy as np
+import numpy.typing as npt
+
+from szachy.games import GameList, GameTable
+from szachy.types import TournamentData
 
 STARTING_RATING = 400
 MINIMUM_RATING = 100
@@ -16,27 +21,17 @@ T = TypeVar('T')
 Number = Union[int, float]  # numbers.Number is broken
 
 
-@dataclass(frozen=True)
-class Game:
-    gid: int
-    white: str
-    white_rating: int
-    black: str
-    black_rating: int
-    pgn: str
-    score: int
-    termination: Termination
-    chess_com_embed: Optional[int]
-
-
 class Score:
     """
     Total score for a given player in a given tournament.
     """
-    games_played: int = 0
-    actual: int = 0
-    expected: float = 0.0  # Expected score based on Elo ratings
-    adjustment: int = 0
+    __slots__ = ('games_played', 'actual', 'expected', 'adjustment')
+
+    def __init__(self) -> None:
+        self.games_played = 0
+        self.actual = 0
+        self.expected = 0.0  # Expected score based on Elo ratings
+        self.adjustment = 0
 
     def __float__(self) -> float:
         return self.actual / 2 / self.games_played
@@ -50,29 +45,106 @@ class TotalScore:
     """
     Total score for a given player in all tournaments.
     """
-    wins: int = 0
-    draws: int = 0
-    losses: int = 0
+    __slots__ = ('wins', 'draws', 'losses')
+
+    def __init__(self) -> None:
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
 
     @property
     def games_played(self) -> int:
         return self.wins + self.draws + self.losses
 
 
+@dataclass(frozen=True)
+class ScoreColumns:
+    """
+    Initial ratings and scores of the players of many tournaments as arrays,
+    such as those of a snapshot. Players are indices into players.
+    """
+    players: List[str]
+    player: npt.NDArray[np.int32]
+    initial_rating: npt.NDArray[np.int64]
+    games_played: npt.NDArray[np.int32]
+    actual: npt.NDArray[np.int32]
+    expected: npt.NDArray[np.float64]
+    adjustment: npt.NDArray[np.int32]
+
+
+class _ColumnsMapping(ABC, Mapping[str, T], Generic[T]):
+    """
+    The rows in range(start, stop) of ScoreColumns by player name, the lookup
+    dict made on first use.
+    """
+    __slots__ = ('columns', 'start', 'stop', '_rows')
+
+    def __init__(self, columns: ScoreColumns, start: int, stop: int) -> None:
+        self.columns = columns
+        self.start = start
+        self.stop = stop
+        self._rows: Optional[Dict[str, int]] = None
+
+    @abstractmethod
+    def _value(self, row: int) -> T:
+        """
+        The value in the given row of the columns.
+        """
+
+    def __getitem__(self, player: str) -> T:
+        if self._rows is None:
+            self._rows = {name: row for row, name in enumerate(self, self.start)}
+        return self._value(self._rows[player])
+
+    def __iter__(self) -> Iterator[str]:
+        players = self.columns.players
+        return (players[pid] for pid in self.columns.player[self.start:self.stop].tolist())
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+
+class InitialRatings(_ColumnsMapping[int]):
+    def _value(self, row: int) -> int:
+        return int(self.columns.initial_rating.item(row))
+
+
+class Scores(_ColumnsMapping[Score]):
+    """
+    Scores made on access, not stored as objects.
+    """
+    def _value(self, row: int) -> Score:
+        score = Score()
+        score.games_played = int(self.columns.games_played.item(row))
+        score.actual = int(self.columns.actual.item(row))
+        score.expected = float(self.columns.expected.item(row))
+        score.adjustment = int(self.columns.adjustment.item(row))
+        return score
+
+
 @dataclass(frozen=True)
 class Tournament:
     date: datetime.date
     location: str
-    games: List[Game]
+    games: GameList
     ranked: bool
-    initial_ratings: Dict[str, int]
-    scores: Dict[str, Score]
+    initial_ratings: Mapping[str, int]  # Dicts, or InitialRatings and Scores over shared columns
+    scores: Mapping[str, Score]
+    tid: Optional[int] = field(default=None, compare=False)  # Id in the store, unlike positions in lists it never changes
 
 
 def elo_expected_score(white_rating: int, black_rating: int) -> float:
     return 2 / (1 + 10 ** ((black_rating - white_rating) / 400))
 
 
+def elo_expected_scores(white_rating: npt.ArrayLike, black_rating: npt.ArrayLike) -> npt.NDArray[np.float64]:
+    """
+    Vectorized elo_expected_score.
+    """
+    difference = np.subtract(black_rating, white_rating, dtype=np.float64)
+    return np.asarray(2 / (1 + 10 ** (difference / 400)), dtype=np.float64)
+
+
 def elo_adjust_rating(rating: int, score: Score) -> int:
     adjustment = K_FACTOR * (score.actual - score.expected) / 2
     new_rating = max(MINIMUM_RATING, int(round(rating + adjustment)))
@@ -80,71 +152,93 @@ def elo_adjust_rating(rating: int, score: Score) -> int:
     return new_rating
 
 
-def compute_ratings() -> Tuple[Dict[str, int], List[Tournament], Dict[str, TotalScore]]:
-    ratings: Dict[str, int] = defaultdict(lambda: STARTING_RATING)
-    tournaments: List[Tournament] = []
-    total_scores: Dict[str, TotalScore] = defaultdict(TotalScore)
-
-    for tournament in TOURNAMENTS:
-        initial_ratings: Dict[str, int] = {}
-        scores: Dict[str, Score] = defaultdict(Score)
-        games: List[Game] = []
-
-        for game in tournament.games:
-            scores[game.white].games_played += 1
-            scores[game.black].games_played += 1
-
-            scores[game.white].actual += game.score
-            scores[game.black].actual += 2 - game.score
-
-            match game.score:
-                case 0:
-                    total_scores[game.white].losses += 1
-                    total_scores[game.black].wins += 1
-                case 1:
-                    total_scores[game.white].draws += 1
-                    total_scores[game.black].draws += 1
-                case 2:
-                    total_scores[game.white].wins += 1
-                    total_scores[game.black].losses += 1
-
-            expected_score = elo_expected_score(ratings[game.white], ratings[game.black])
-            scores[game.white].expected += expected_score
-            scores[game.black].expected += 2 - expected_score
-
-            initial_ratings[game.white] = ratings[game.white]
-            initial_ratings[game.black] = ratings[game.black]
-
-            games.append(Game(
-                game.gid,
-                game.white,
-                ratings[game.white],
-                game.black,
-                ratings[game.black],
-                game.pgn,
-                game.score,
-                game.termination,
-                game.chess_com_embed,
-            ))
-
-        if tournament.ranked:
-            for player, score in scores.items():
-                ratings[player] = elo_adjust_rating(ratings[player], score)
-
-        tournaments.append(Tournament(
-            tournament.date,
-            tournament.location,
-            games,
-            tournament.ranked,
-            initial_ratings,
-            scores,
-        ))
+def replay_tournament(
+    tournament: TournamentData,
+    ratings: DefaultDict[str, int],
+    total_scores: DefaultDict[str, TotalScore],
+    table: Optional[GameTable] = None,
+) -> Tournament:
+    """
+    Score a single tournament, updating ratings and total scores in place.
+    Its games are appended to the given table, or a new one.
+    """
+    if table is None:
+        table = GameTable()
+    initial_ratings: Dict[str, int] = {}
+    scores: Dict[str, Score] = defaultdict(Score)
+    start = len(table)
+
+    for game in tournament.games:
+        scores[game.white].games_played += 1
+        scores[game.black].games_played += 1
+
+        scores[game.white].actual += game.score
+        scores[game.black].actual += 2 - game.score
+
+        match game.score:
+            case 0:
+                total_scores[game.white].losses += 1
+                total_scores[game.black].wins += 1
+            case 1:
+                total_scores[game.white].draws += 1
+                total_scores[game.black].draws += 1
+            case 2:
+                total_scores[game.white].wins += 1
+                total_scores[game.black].losses += 1
+
+        expected_score = elo_expected_score(ratings[game.white], ratings[game.black])
+        scores[game.white].expected += expected_score
+        scores[game.black].expected += 2 - expected_score
+
+        initial_ratings[game.white] = ratings[game.white]
+        initial_ratings[game.black] = ratings[game.black]
+
+        table.append(
+            game.gid,
+            game.white,
+            ratings[game.white],
+            game.black,
+            ratings[game.black],
+            game.pgn,
+            game.score,
+            game.termination,
+            game.chess_com_embed,
+        )
+
+    if tournament.ranked:
+        for player, score in scores.items():
+            ratings[player] = elo_adjust_rating(ratings[player], score)
+
+    return Tournament(
+        tournament.date,
+        tournament.location,
+        table.games(start),
+        tournament.ranked,
+        initial_ratings,
+        scores,
+    )
+
+
+def compute_ratings(
+    tournament_data: Iterable[TournamentData],
+) -> Tuple[Dict[str, int], List[Tournament], Dict[str, TotalScore]]:
+    ratings: DefaultDict[str, int] = defaultdict(lambda: STARTING_RATING)
+    total_scores: DefaultDict[str, TotalScore] = defaultdict(TotalScore)
+    table = GameTable()
+
+    tournaments = [
+        replay_tournament(tournament, ratings, total_scores, table)
+        for tournament in tournament_data
+    ]
+    table.compact()
 
     return ratings, tournaments, total_scores
 
 
-def compute_ranking(dct: Dict[str, T], key: Callable[[T], Number]) -> Iterator[Tuple[int, str, T]]:
+def compute_ranking(dct: Mapping[str, T], key: Callable[[T], Number]) -> Iterator[Tuple[int, str, T]]:
     lst = sorted(dct.items(), key=lambda kv: (-key(kv[1]), kv[0]))
+    if not lst:
+        return
 
     rank = 1
     last_value = lst[0][1]
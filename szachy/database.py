@@ -2,38 +2,12 @@
 This file contains raw game and tournament data. The objects contain immutable
 data, to be considered as historical facts.
 """
-from dataclasses import dataclass
 from datetime import date
-from enum import Enum
-from typing import List, Optional
 
+from szachy.types import GameData, Termination, TournamentData
 
-class Termination(Enum):
-    RESIGNATION = 1
-    CHECKMATE = 2
-    STALEMATE = 3
-
-
-@dataclass(frozen=True)
-class GameData:
-    gid: int
-    white: str
-    black: str
-    pgn: str
-    score: int  # Doubled to avoid floats (0 - Black wins, 1 - draw, 2 - White wins)
-    termination: Termination
-    chess_com_embed: Optional[int]  # FIXME: move elsewhere (and automate)
-
-
-@dataclass(frozen=True)
-class TournamentData:
-    date: date
-    location: str
-    games: List[GameData]
-    ranked: bool = True
-
-
-# TODO: this will be replaced with a proper SQL database once it grows big enough.
+# Frozen: new tournaments go to the SQLite store (szachy.store), which is seeded
+# from these literals on first run.
 TOURNAMENTS = [
     TournamentData(
         date=date(2022, 11, 5),
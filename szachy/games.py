@@ -0,0 +1,266 @@
+"""
+Scored games as columns of a table, with lightweight views for single games.
+
+A game costs a few dozen bytes of arrays plus its PGN, kept as UTF-8 in one
+buffer, instead of a Python object with a string per field.
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union, overload
+import copy
+
+import numpy as np
+import numpy.typing as npt
+
+from szachy.types import Termination
+
+_TERMINATIONS = {termination.value: termination for termination in Termination}
+NO_EMBED = -1  # chess_com_embed of games without one
+
+
+class GameTable:
+    """
+    Games in the order they were appended, players interned as indices into
+    players. The PGN of game i is pgn_buffer[pgn_offsets[i]:pgn_offsets[i + 1]].
+    """
+    def __init__(self, capacity: int = 64) -> None:
+        self.players: List[str] = []
+        self.player_ids: Dict[str, int] = {}
+        self.size = 0
+
+        self.gid = np.empty(capacity, dtype=np.int64)
+        self.white = np.empty(capacity, dtype=np.int32)
+        self.black = np.empty(capacity, dtype=np.int32)
+        self.white_rating = np.empty(capacity, dtype=np.int32)
+        self.black_rating = np.empty(capacity, dtype=np.int32)
+        self.score = np.empty(capacity, dtype=np.int8)
+        self.termination = np.empty(capacity, dtype=np.int8)
+        self.chess_com_embed = np.empty(capacity, dtype=np.int64)
+        self.pgn_offsets = np.zeros(capacity + 1, dtype=np.int64)
+        self.pgn_buffer: Union[bytearray, memoryview] = bytearray()  # Read-only memory for mapped tables
+
+    _COLUMNS = ('gid', 'white', 'black', 'white_rating', 'black_rating', 'score', 'termination', 'chess_com_embed')
+
+    def __len__(self) -> int:
+        return self.size
+
+    def player_id(self, name: str) -> int:
+        pid = self.player_ids.get(name)
+        if pid is None:
+            pid = self.player_ids[name] = len(self.players)
+            self.players.append(name)
+        return pid
+
+    def _grow(self) -> None:
+        capacity = max(64, 2 * len(self.gid))
+        for column in self._COLUMNS:
+            array = getattr(self, column)
+            grown = np.empty(capacity, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            setattr(self, column, grown)
+        offsets = np.zeros(capacity + 1, dtype=np.int64)
+        offsets[:self.size + 1] = self.pgn_offsets[:self.size + 1]
+        self.pgn_offsets = offsets
+
+    def append(
+        self,
+        gid: int,
+        white: str,
+        white_rating: int,
+        black: str,
+        black_rating: int,
+        pgn: str,
+        score: int,
+        termination: Termination,
+        chess_com_embed: Optional[int],
+    ) -> int:
+        """
+        Add a game, returning its index.
+        """
+        assert isinstance(self.pgn_buffer, bytearray), 'mapped tables are read-only'
+        if self.size == len(self.gid):
+            self._grow()
+
+        i = self.size
+        self.gid[i] = gid
+        self.white[i] = self.player_id(white)
+        self.black[i] = self.player_id(black)
+        self.white_rating[i] = white_rating
+        self.black_rating[i] = black_rating
+        self.score[i] = score
+        self.termination[i] = termination.value
+        self.chess_com_embed[i] = NO_EMBED if chess_com_embed is None else chess_com_embed
+        self.pgn_buffer += pgn.encode()
+        self.pgn_offsets[i + 1] = len(self.pgn_buffer)
+        self.size += 1
+        return i
+
+    @classmethod
+    def from_columns(cls, players: List[str], columns: Dict[str, npt.NDArray[Any]], pgn_offsets: npt.NDArray[np.int64], pgn_buffer: Union[bytearray, memoryview]) -> 'GameTable':
+        """
+        A table over existing arrays, such as those of a snapshot. It is
+        read-only unless the PGN buffer is a bytearray.
+        """
+        table = cls(capacity=0)
+        table.players = players
+        table.player_ids = {player: i for i, player in enumerate(players)}
+        table.size = len(pgn_offsets) - 1
+        for column in cls._COLUMNS:
+            setattr(table, column, columns[column])
+        table.pgn_offsets = pgn_offsets
+        table.pgn_buffer = pgn_buffer
+        return table
+
+    def compact(self) -> None:
+        """
+        Release the capacity reserved for more games.
+        """
+        for column in self._COLUMNS:
+            setattr(self, column, getattr(self, column)[:self.size].copy())
+        self.pgn_offsets = self.pgn_offsets[:self.size + 1].copy()
+
+    def games(self, start: int = 0, stop: Optional[int] = None) -> 'GameList':
+        return GameList(self, start, self.size if stop is None else stop)
+
+    def pgn(self, i: int) -> str:
+        return str(self.pgn_buffer[self.pgn_offsets[i]:self.pgn_offsets[i + 1]], 'utf-8')
+
+    def with_ratings(self, white_rating: npt.NDArray[np.int64], black_rating: npt.NDArray[np.int64]) -> 'GameTable':
+        """
+        The same games with other ratings. Every other column is shared, so
+        neither table may be appended to afterwards.
+        """
+        table = copy.copy(self)
+        table.white_rating = white_rating[:self.size].astype(np.int32)
+        table.black_rating = black_rating[:self.size].astype(np.int32)
+        return table
+
+
+class Game:
+    """
+    View of a single game in a GameTable.
+    """
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table: GameTable, index: int) -> None:
+        self.table = table
+        self.index = index
+
+    @property
+    def gid(self) -> int:
+        return int(self.table.gid.item(self.index))
+
+    @property
+    def white(self) -> str:
+        return self.table.players[self.table.white.item(self.index)]
+
+    @property
+    def white_rating(self) -> int:
+        return int(self.table.white_rating.item(self.index))
+
+    @property
+    def black(self) -> str:
+        return self.table.players[self.table.black.item(self.index)]
+
+    @property
+    def black_rating(self) -> int:
+        return int(self.table.black_rating.item(self.index))
+
+    @property
+    def pgn(self) -> str:
+        return self.table.pgn(self.index)
+
+    @property
+    def score(self) -> int:
+        return int(self.table.score.item(self.index))
+
+    @property
+    def termination(self) -> Termination:
+        return _TERMINATIONS[int(self.table.termination.item(self.index))]
+
+    @property
+    def chess_com_embed(self) -> Optional[int]:
+        embed = int(self.table.chess_com_embed.item(self.index))
+        return None if embed == NO_EMBED else embed
+
+    def _fields(self) -> Tuple[Any, ...]:
+        return (
+            self.gid, self.white, self.white_rating, self.black, self.black_rating,
+            self.pgn, self.score, self.termination, self.chess_com_embed,
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Game):
+            return NotImplemented
+        return self._fields() == other._fields()
+
+    def __hash__(self) -> int:
+        return hash(self._fields())
+
+    def __repr__(self) -> str:
+        return 'Game(gid={!r}, white={!r}, white_rating={!r}, black={!r}, black_rating={!r}, pgn={!r}, score={!r}, termination={!r}, chess_com_embed={!r})'.format(*self._fields())
+
+
+class GameList:
+    """
+    The games of a range of a GameTable, as a read-only sequence of views.
+    """
+    __slots__ = ('table', 'start', 'stop')
+
+    def __init__(self, table: GameTable, start: int, stop: int) -> None:
+        self.table = table
+        self.start = start
+        self.stop = stop
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def column(self, name: str) -> npt.NDArray[Any]:
+        """
+        The games' values of a column of the table, such as 'gid' or 'white'.
+        """
+        column: npt.NDArray[Any] = getattr(self.table, name)
+        return column[self.start:self.stop]
+
+    def __iter__(self) -> Iterator[Game]:
+        table = self.table
+        return (Game(table, i) for i in range(self.start, self.stop))
+
+    @overload
+    def __getitem__(self, key: int) -> Game:
+        ...
+
+    @overload
+    def __getitem__(self, key: slice) -> 'GameList':
+        ...
+
+    def __getitem__(self, key: Union[int, slice]) -> Union[Game, 'GameList']:
+        indices = range(self.start, self.stop)[key]
+        if isinstance(indices, range):
+            if indices.step != 1:
+                raise ValueError('GameList slices must be contiguous')
+            return GameList(self.table, indices.start, indices.stop)
+        return Game(self.table, indices)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, (GameList, list)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self) -> str:
+        return repr([*self])
+
+
+def player_column(game_lists: Iterable[GameList], color: str, player_ids: Dict[str, int]) -> npt.NDArray[np.intp]:
+    """
+    Ids in player_ids of the white or black players of all games of the lists,
+    -1 for players missing from it.
+    """
+    mappings: Dict[int, npt.NDArray[np.intp]] = {}
+    parts = [np.empty(0, dtype=np.intp)]
+    for games in game_lists:
+        table = games.table
+        mapping = mappings.get(id(table))
+        if mapping is None or len(mapping) < len(table.players):
+            mapping = np.array([player_ids.get(player, -1) for player in table.players], dtype=np.intp)
+            mappings[id(table)] = mapping
+        parts.append(mapping[games.column(color)])
+    return np.concatenate(parts)
@@ -0,0 +1,202 @@
+"""
+Head-to-head records of every pair of players who met, precomputed from
+replayed tournaments.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Sequence
+import datetime
+
+import numpy as np
+import numpy.typing as npt
+
+from szachy.chess import Tournament
+from szachy.games import player_column
+
+
+@dataclass(frozen=True)
+class HeadToHead:
+    """
+    Results of a player against an opponent, from the player's side.
+    """
+    player: str
+    opponent: str
+    games: int
+    wins: int
+    draws: int
+    losses: int
+    white_games: int  # Of the player as white
+
+    @property
+    def black_games(self) -> int:
+        return self.games - self.white_games
+
+
+@dataclass(frozen=True)
+class Meeting:
+    """
+    A game between the two players of a head-to-head record.
+    """
+    gid: int
+    tid: int  # Index into the chronological list of tournaments
+    date: datetime.date
+    white: str
+    black: str
+    white_rating: int  # Before the tournament, as in the game
+    black_rating: int
+    score: int  # Doubled score of white, as in GameData.score
+
+
+class HeadToHeadIndex:
+    """
+    Games of all pairs of players as flat arrays grouped by pair.
+
+    Pairs are numbered in order of (first, second) player ids with first <
+    second, and looked up in the sorted pair_keys by first * number of
+    players + second. The games of pair p are those in range(offsets[p], offsets[p + 1]), in
+    chronological order, and per-pair totals are counted from the first
+    player's side.
+    """
+    ARRAYS = (
+        'pair_keys', 'offsets', 'gids', 'tids', 'white', 'black', 'white_ratings', 'black_ratings', 'scores',
+        'games', 'wins', 'draws', 'first_white_games', 'opponent_ids', 'opponent_pairs', 'opponent_offsets',
+    )
+
+    def __init__(self, tournaments: Sequence[Tournament]) -> None:
+        # Players of the tables the games are in, usually one or a few shared
+        # by all tournaments.
+        game_lists = [tournament.games for tournament in tournaments]
+        self.players: List[str] = []
+        self.player_ids: Dict[str, int] = {}
+        for table in {id(games.table): games.table for games in game_lists}.values():
+            for player in table.players:
+                if player not in self.player_ids:
+                    self.player_ids[player] = len(self.players)
+                    self.players.append(player)
+        n = len(self.players)
+        self.dates = [tournament.date for tournament in tournaments]
+
+        white = player_column(game_lists, 'white', self.player_ids).astype(np.int64)
+        black = player_column(game_lists, 'black', self.player_ids).astype(np.int64)
+        first = np.minimum(white, black)
+        keys = first * n + np.maximum(white, black)
+
+        # Games are in chronological order, a stable sort keeps it within
+        # every pair.
+        order = np.argsort(keys, kind='stable')
+        pair_keys, starts = np.unique(keys[order], return_index=True)
+        self.pair_keys = pair_keys
+        self.offsets: npt.NDArray[np.intp] = np.append(starts, len(keys)).astype(np.intp)
+
+        def column(name: str) -> npt.NDArray[np.int64]:
+            parts = [np.empty(0, dtype=np.int64), *(games.column(name) for games in game_lists)]
+            return np.concatenate(parts).astype(np.int64)[order]
+
+        lengths = np.array([len(games) for games in game_lists], dtype=np.intp)
+        self.gids = column('gid')
+        self.tids = np.repeat(np.arange(len(game_lists), dtype=np.int32), lengths)[order]
+        self.white = white[order].astype(np.int32)
+        self.black = black[order].astype(np.int32)
+        self.white_ratings = column('white_rating').astype(np.int32)
+        self.black_ratings = column('black_rating').astype(np.int32)
+        self.scores = column('score').astype(np.int8)
+
+        # Totals per pair, from the side of its first player.
+        first_white = self.white == first[order]
+        first_scores = np.where(first_white, self.scores, 2 - self.scores)
+        self.games = np.diff(self.offsets)
+        pair_of_game = np.repeat(np.arange(len(pair_keys)), self.games)
+        self.wins = np.bincount(pair_of_game, weights=first_scores == 2, minlength=len(pair_keys)).astype(np.int32)
+        self.draws = np.bincount(pair_of_game, weights=first_scores == 1, minlength=len(pair_keys)).astype(np.int32)
+        self.first_white_games = np.bincount(pair_of_game, weights=first_white, minlength=len(pair_keys)).astype(np.int32)
+
+        # Opponents of every player, grouped by player id like the games by
+        # pair, with the pair of each.
+        firsts, seconds = np.divmod(pair_keys, max(n, 1))
+        pair_players = np.concatenate((firsts, seconds))
+        player_order = np.argsort(pair_players, kind='stable')
+        self.opponent_ids = np.concatenate((seconds, firsts))[player_order].astype(np.int32)
+        self.opponent_pairs = np.tile(np.arange(len(pair_keys)), 2)[player_order]
+        self.opponent_offsets: npt.NDArray[np.intp] = np.searchsorted(pair_players[player_order], np.arange(n + 1))
+
+    @classmethod
+    def from_arrays(cls, players: List[str], dates: List[datetime.date], arrays: Mapping[str, npt.NDArray[Any]]) -> 'HeadToHeadIndex':
+        """
+        An index over existing arrays, such as those of a snapshot, named as in
+        ARRAYS. Players are in order of their ids.
+        """
+        index = cls.__new__(cls)
+        index.players = players
+        index.player_ids = {player: i for i, player in enumerate(players)}
+        index.dates = dates
+        for name in cls.ARRAYS:
+            setattr(index, name, arrays[name])
+        return index
+
+    def __contains__(self, player: str) -> bool:
+        return player in self.player_ids
+
+    def _pair(self, player: str, opponent: str) -> int:
+        """
+        Index of the pair, -1 if they never met. Raises KeyError for unknown
+        players.
+        """
+        a, b = sorted((self.player_ids[player], self.player_ids[opponent]))
+        key = a * len(self.players) + b
+        pair = int(np.searchsorted(self.pair_keys, key))
+        if pair == len(self.pair_keys) or self.pair_keys[pair] != key:
+            return -1
+        return pair
+
+    def _record(self, pair: int, player: str, opponent: str) -> HeadToHead:
+        games = int(self.games[pair])
+        wins, draws = int(self.wins[pair]), int(self.draws[pair])
+        white_games = int(self.first_white_games[pair])
+        if self.player_ids[player] > self.player_ids[opponent]:
+            wins, white_games = games - wins - draws, games - white_games
+        return HeadToHead(player, opponent, games, wins, draws, games - wins - draws, white_games)
+
+    def head_to_head(self, player: str, opponent: str) -> HeadToHead:
+        """
+        The player's record against the opponent. Raises KeyError for unknown
+        players.
+        """
+        pair = self._pair(player, opponent)
+        if pair < 0:
+            return HeadToHead(player, opponent, 0, 0, 0, 0, 0)
+        return self._record(pair, player, opponent)
+
+    def meetings(self, player: str, opponent: str) -> List[Meeting]:
+        """
+        Games between the two players in chronological order. Raises KeyError
+        for unknown players.
+        """
+        pair = self._pair(player, opponent)
+        if pair < 0:
+            return []
+
+        games = slice(self.offsets[pair], self.offsets[pair + 1])
+        return [
+            Meeting(gid, tid, self.dates[tid], self.players[white], self.players[black], white_rating, black_rating, score)
+            for gid, tid, white, black, white_rating, black_rating, score in zip(
+                self.gids[games].tolist(),
+                self.tids[games].tolist(),
+                self.white[games].tolist(),
+                self.black[games].tolist(),
+                self.white_ratings[games].tolist(),
+                self.black_ratings[games].tolist(),
+                self.scores[games].tolist(),
+            )
+        ]
+
+    def opponents(self, player: str) -> List[HeadToHead]:
+        """
+        The player's records against everyone they met, most games first.
+        Raises KeyError for unknown players.
+        """
+        pid = self.player_ids[player]
+        start, stop = self.opponent_offsets[pid], self.opponent_offsets[pid + 1]
+        records = [
+            self._record(pair, player, self.players[opponent])
+            for opponent, pair in zip(self.opponent_ids[start:stop].tolist(), self.opponent_pairs[start:stop].tolist())
+        ]
+        return sorted(records, key=lambda record: -record.games)
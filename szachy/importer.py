@@ -0,0 +1,136 @@
+"""
+Bulk import of PGN files into the game store.
+
+Usage: python -m szachy import [--database PATH] [--location LOCATION] [--unranked] [--jobs N] FILE...
+
+Games are grouped into tournaments by date and location, which is taken from
+the Site or Event tags unless given explicitly. Games already in the store with
+the same date, players and moves are skipped, so a file can be imported again.
+"""
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+from typing import Deque, Iterable, Iterator, List, Optional, Tuple, TypeVar
+import argparse
+import datetime
+import time
+
+from szachy.pgn import PgnGame, parse_games, split_games
+from szachy.positions import update_position_index
+from szachy.store import Store
+from szachy.types import GameData
+
+T = TypeVar('T')
+
+
+@dataclass
+class ImportStats:
+    imported: int = 0
+    skipped: int = 0  # Unfinished or undated games
+    duplicates: int = 0  # Already in the store
+    seconds: float = 0.0
+
+    @property
+    def games_per_second(self) -> float:
+        return (self.imported + self.skipped + self.duplicates) / self.seconds if self.seconds else 0.0
+
+
+def chunked(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    iterator = iter(iterable)
+    while chunk := [*islice(iterator, size)]:
+        yield chunk
+
+
+def _parse_chunks(chunks: Iterable[List[List[str]]], jobs: int) -> Iterator[List[PgnGame]]:
+    """
+    Parse chunks of games in order, optionally in a process pool.
+
+    At most two chunks per worker are in flight, so memory use does not depend
+    on the size of the input.
+    """
+    if jobs <= 1:
+        yield from map(parse_games, chunks)
+        return
+
+    with ProcessPoolExecutor(jobs) as executor:
+        pending: Deque[Future[List[PgnGame]]] = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(parse_games, chunk))
+            if len(pending) >= 2 * jobs:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+def import_pgn(
+    store: Store,
+    lines: Iterable[str],
+    location: Optional[str] = None,
+    ranked: bool = True,
+    batch_size: int = 1000,
+    jobs: int = 1,
+) -> ImportStats:
+    stats = ImportStats()
+    start = time.perf_counter()
+    gid = store.next_gid()
+
+    chunks = _parse_chunks(chunked(split_games(lines), batch_size), jobs)
+    for chunk in chunks:
+        rows: List[Tuple[datetime.date, str, bool, GameData]] = []
+
+        for game in chunk:
+            score = game.score
+            date = game.date
+            if score is None or date is None:
+                stats.skipped += 1
+                continue
+
+            rows.append((
+                date,
+                location or game.tags.get('Site') or game.tags.get('Event') or '?',
+                ranked,
+                GameData(
+                    gid=gid,
+                    white=game.white,
+                    black=game.black,
+                    pgn=game.movetext,
+                    score=score,
+                    termination=game.termination,
+                    chess_com_embed=None,
+                ),
+            ))
+            gid += 1
+
+        added = store.add_games(rows)
+        stats.imported += added
+        stats.duplicates += len(rows) - added
+
+    stats.seconds = time.perf_counter() - start
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m szachy import')
+    parser.add_argument('--database', type=str, default='szachy.db')
+    parser.add_argument('--location', type=str, default=None)
+    parser.add_argument('--unranked', action='store_true')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--jobs', type=int, default=1, help='parser processes')
+    parser.add_argument('files', nargs='+')
+    args = parser.parse_args(argv)
+
+    store = Store(args.database)
+    for path in args.files:
+        with open(path, encoding='utf-8', errors='replace') as file:
+            stats = import_pgn(store, file, args.location, not args.unranked, args.batch_size, args.jobs)
+        print(
+            f'{path}: {stats.imported} games imported, {stats.skipped} skipped, {stats.duplicates} already imported '
+            f'({stats.games_per_second:.0f} games/s)'
+        )
+
+    start = time.perf_counter()
+    indexed = update_position_index(store)
+    print(f'{indexed} games added to the position index in {time.perf_counter() - start:.1f} s')
+    store.close()
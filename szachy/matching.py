@@ -0,0 +1,423 @@
+"""
+Maximum weight matching in general graphs.
+
+Edmonds' blossom algorithm with dual variables, O(n³), following the classic
+formulation by Galil ("Efficient algorithms for finding maximum matching in
+graphs", 1986) as implemented by Joris van Rantwijk. Weights must be integers,
+which keeps the dual variables exact.
+"""
+from typing import Iterator, List, Optional, Tuple
+
+
+def max_weight_matching(edges: List[Tuple[int, int, int]], max_cardinality: bool = False) -> List[int]:
+    """
+    Matching of maximum total weight in the graph given by (i, j, weight)
+    edges over vertices 0..n-1, as the list of the vertex matched to each
+    vertex, -1 for unmatched ones.
+
+    With max_cardinality, only matchings of maximum cardinality are
+    considered, so with non-negative weights a perfect matching is found if
+    one exists.
+    """
+    if not edges:
+        return []
+
+    edge_count = len(edges)
+    vertex_count = 1 + max(max(i, j) for i, j, _ in edges)
+    max_weight = max(0, max(weight for _, _, weight in edges))
+
+    # Edge k has endpoints 2k and 2k + 1, endpoint[p] is the vertex of p and
+    # p ^ 1 is the other end of the same edge.
+    endpoint = [edges[p // 2][p % 2] for p in range(2 * edge_count)]
+    neighbour_ends: List[List[int]] = [[] for _ in range(vertex_count)]
+    for k, (i, j, _) in enumerate(edges):
+        neighbour_ends[i].append(2 * k + 1)
+        neighbour_ends[j].append(2 * k)
+
+    # Endpoint through which a vertex is matched, -1 if it is single.
+    mate = [-1] * vertex_count
+
+    # Vertices are 0..n-1, non-trivial blossoms n..2n-1. Labels of top-level
+    # blossoms: 0 free, 1 S (outer), 2 T (inner); 4 and 5 mark visited ones
+    # in scan_blossom.
+    label = [0] * (2 * vertex_count)
+    label_end = [-1] * (2 * vertex_count)
+    in_blossom = [*range(vertex_count)]
+    blossom_parent = [-1] * (2 * vertex_count)
+    blossom_children: List[Optional[List[int]]] = [None] * (2 * vertex_count)
+    blossom_base = [*range(vertex_count)] + [-1] * vertex_count
+    blossom_ends: List[Optional[List[int]]] = [None] * (2 * vertex_count)
+    best_edge = [-1] * (2 * vertex_count)
+    blossom_best_edges: List[Optional[List[int]]] = [None] * (2 * vertex_count)
+    unused_blossoms = [*range(vertex_count, 2 * vertex_count)]
+    dual = [max_weight] * vertex_count + [0] * vertex_count
+    allowed = [False] * edge_count
+    queue: List[int] = []
+
+    def slack(k: int) -> int:
+        i, j, weight = edges[k]
+        return dual[i] + dual[j] - 2 * weight
+
+    def leaves(b: int) -> Iterator[int]:
+        if b < vertex_count:
+            yield b
+        else:
+            for child in blossom_children[b] or ():
+                yield from leaves(child)
+
+    def assign_label(w: int, t: int, p: int) -> None:
+        b = in_blossom[w]
+        label[w] = label[b] = t
+        label_end[w] = label_end[b] = p
+        best_edge[w] = best_edge[b] = -1
+        if t == 1:
+            queue.extend(leaves(b))
+        elif t == 2:
+            base = blossom_base[b]
+            assign_label(endpoint[mate[base]], 1, mate[base] ^ 1)
+
+    def scan_blossom(v: int, w: int) -> int:
+        """
+        Base of the blossom closed by an edge between S vertices, -1 if it
+        connects two trees instead (an augmenting path).
+        """
+        path = []
+        base = -1
+        while v != -1 or w != -1:
+            b = in_blossom[v]
+            if label[b] & 4:
+                base = blossom_base[b]
+                break
+            path.append(b)
+            label[b] = 5
+            if label_end[b] == -1:
+                v = -1
+            else:
+                v = endpoint[label_end[b]]
+                b = in_blossom[v]
+                v = endpoint[label_end[b]]
+            if w != -1:
+                v, w = w, v
+        for b in path:
+            label[b] = 1
+        return base
+
+    def add_blossom(base: int, k: int) -> None:
+        v, w, _ = edges[k]
+        base_blossom = in_blossom[base]
+        bv = in_blossom[v]
+        bw = in_blossom[w]
+
+        b = unused_blossoms.pop()
+        blossom_base[b] = base
+        blossom_parent[b] = -1
+        blossom_parent[base_blossom] = b
+        path: List[int] = []
+        ends: List[int] = []
+        blossom_children[b] = path
+        blossom_ends[b] = ends
+
+        while bv != base_blossom:
+            blossom_parent[bv] = b
+            path.append(bv)
+            ends.append(label_end[bv])
+            v = endpoint[label_end[bv]]
+            bv = in_blossom[v]
+        path.append(base_blossom)
+        path.reverse()
+        ends.reverse()
+        ends.append(2 * k)
+        while bw != base_blossom:
+            blossom_parent[bw] = b
+            path.append(bw)
+            ends.append(label_end[bw] ^ 1)
+            w = endpoint[label_end[bw]]
+            bw = in_blossom[w]
+
+        label[b] = 1
+        label_end[b] = label_end[base_blossom]
+        dual[b] = 0
+        for v in leaves(b):
+            if label[in_blossom[v]] == 2:
+                queue.append(v)
+            in_blossom[v] = b
+
+        best_edge_to = [-1] * (2 * vertex_count)
+        for bv in path:
+            best_edges = blossom_best_edges[bv]
+            if best_edges is None:
+                edge_lists = [[p // 2 for p in neighbour_ends[v]] for v in leaves(bv)]
+            else:
+                edge_lists = [best_edges]
+            for edge_list in edge_lists:
+                for k in edge_list:
+                    i, j, _ = edges[k]
+                    if in_blossom[j] == b:
+                        i, j = j, i
+                    bj = in_blossom[j]
+                    if bj != b and label[bj] == 1 and (best_edge_to[bj] == -1 or slack(k) < slack(best_edge_to[bj])):
+                        best_edge_to[bj] = k
+            blossom_best_edges[bv] = None
+            best_edge[bv] = -1
+
+        blossom_best_edges[b] = [k for k in best_edge_to if k != -1]
+        best_edge[b] = -1
+        for k in blossom_best_edges[b] or ():
+            if best_edge[b] == -1 or slack(k) < slack(best_edge[b]):
+                best_edge[b] = k
+
+    def expand_blossom(b: int, end_stage: bool) -> None:
+        children = blossom_children[b]
+        ends = blossom_ends[b]
+        assert children is not None and ends is not None
+
+        for s in children:
+            blossom_parent[s] = -1
+            if s < vertex_count:
+                in_blossom[s] = s
+            elif end_stage and dual[s] == 0:
+                expand_blossom(s, end_stage)
+            else:
+                for v in leaves(s):
+                    in_blossom[v] = s
+
+        # A T blossom expanded mid-stage: relabel the children along the even
+        # path from the entry child to the base.
+        if not end_stage and label[b] == 2:
+            entry_child = in_blossom[endpoint[label_end[b] ^ 1]]
+            j = children.index(entry_child)
+            if j & 1:
+                j -= len(children)
+                step = 1
+                trick = 0
+            else:
+                step = -1
+                trick = 1
+
+            p = label_end[b]
+            while j != 0:
+                label[endpoint[p ^ 1]] = 0
+                label[endpoint[ends[j - trick] ^ trick ^ 1]] = 0
+                assign_label(endpoint[p ^ 1], 2, p)
+                allowed[ends[j - trick] // 2] = True
+                j += step
+                p = ends[j - trick] ^ trick
+                allowed[p // 2] = True
+                j += step
+
+            bv = children[j]
+            label[endpoint[p ^ 1]] = label[bv] = 2
+            label_end[endpoint[p ^ 1]] = label_end[bv] = p
+            best_edge[bv] = -1
+            j += step
+
+            while children[j] != entry_child:
+                bv = children[j]
+                if label[bv] == 1:
+                    j += step
+                    continue
+                labelled = next((v for v in leaves(bv) if label[v] != 0), None)
+                if labelled is not None:
+                    label[labelled] = 0
+                    label[endpoint[mate[blossom_base[bv]]]] = 0
+                    assign_label(labelled, 2, label_end[labelled])
+                j += step
+
+        label[b] = label_end[b] = -1
+        blossom_children[b] = blossom_ends[b] = None
+        blossom_base[b] = -1
+        blossom_best_edges[b] = None
+        best_edge[b] = -1
+        unused_blossoms.append(b)
+
+    def augment_blossom(b: int, v: int) -> None:
+        """
+        Swap matched and unmatched edges along the even path from v to the
+        base of blossom b, making v its new base.
+        """
+        t = v
+        while blossom_parent[t] != b:
+            t = blossom_parent[t]
+        if t >= vertex_count:
+            augment_blossom(t, v)
+
+        children = blossom_children[b]
+        ends = blossom_ends[b]
+        assert children is not None and ends is not None
+
+        i = j = children.index(t)
+        if i & 1:
+            j -= len(children)
+            step = 1
+            trick = 0
+        else:
+            step = -1
+            trick = 1
+
+        while j != 0:
+            j += step
+            t = children[j]
+            p = ends[j - trick] ^ trick
+            if t >= vertex_count:
+                augment_blossom(t, endpoint[p])
+            j += step
+            t = children[j]
+            if t >= vertex_count:
+                augment_blossom(t, endpoint[p ^ 1])
+            mate[endpoint[p]] = p ^ 1
+            mate[endpoint[p ^ 1]] = p
+
+        blossom_children[b] = children[i:] + children[:i]
+        blossom_ends[b] = ends[i:] + ends[:i]
+        blossom_base[b] = blossom_base[children[i]]
+
+    def augment_matching(k: int) -> None:
+        v, w, _ = edges[k]
+        for s, p in ((v, 2 * k + 1), (w, 2 * k)):
+            while True:
+                bs = in_blossom[s]
+                if bs >= vertex_count:
+                    augment_blossom(bs, s)
+                mate[s] = p
+                if label_end[bs] == -1:
+                    break
+                t = endpoint[label_end[bs]]
+                bt = in_blossom[t]
+                s = endpoint[label_end[bt]]
+                j = endpoint[label_end[bt] ^ 1]
+                if bt >= vertex_count:
+                    augment_blossom(bt, j)
+                mate[j] = label_end[bt]
+                p = label_end[bt] ^ 1
+
+    # Every stage grows alternating trees from the single vertices until the
+    # matching can be augmented, adjusting the duals when it gets stuck.
+    for _ in range(vertex_count):
+        label[:] = [0] * (2 * vertex_count)
+        best_edge[:] = [-1] * (2 * vertex_count)
+        blossom_best_edges[vertex_count:] = [None] * vertex_count
+        allowed[:] = [False] * edge_count
+        queue.clear()
+
+        for v in range(vertex_count):
+            if mate[v] == -1 and label[in_blossom[v]] == 0:
+                assign_label(v, 1, -1)
+
+        augmented = False
+        while True:
+            while queue and not augmented:
+                v = queue.pop()
+                for p in neighbour_ends[v]:
+                    k = p // 2
+                    w = endpoint[p]
+                    if in_blossom[v] == in_blossom[w]:
+                        continue
+
+                    k_slack = 0
+                    if not allowed[k]:
+                        k_slack = slack(k)
+                        if k_slack <= 0:
+                            allowed[k] = True
+
+                    if allowed[k]:
+                        if label[in_blossom[w]] == 0:
+                            assign_label(w, 2, p ^ 1)
+                        elif label[in_blossom[w]] == 1:
+                            base = scan_blossom(v, w)
+                            if base >= 0:
+                                add_blossom(base, k)
+                            else:
+                                augment_matching(k)
+                                augmented = True
+                                break
+                        elif label[w] == 0:
+                            label[w] = 2
+                            label_end[w] = p ^ 1
+                    elif label[in_blossom[w]] == 1:
+                        b = in_blossom[v]
+                        if best_edge[b] == -1 or k_slack < slack(best_edge[b]):
+                            best_edge[b] = k
+                    elif label[w] == 0:
+                        if best_edge[w] == -1 or k_slack < slack(best_edge[w]):
+                            best_edge[w] = k
+
+            if augmented:
+                break
+
+            # No augmenting path with the current duals, find the largest
+            # dual change keeping them feasible and what it unlocks.
+            delta_type = -1
+            delta = 0
+            delta_edge = -1
+            delta_blossom = -1
+
+            if not max_cardinality:
+                delta_type = 1
+                delta = min(dual[:vertex_count])
+
+            for v in range(vertex_count):
+                if label[in_blossom[v]] == 0 and best_edge[v] != -1:
+                    d = slack(best_edge[v])
+                    if delta_type == -1 or d < delta:
+                        delta = d
+                        delta_type = 2
+                        delta_edge = best_edge[v]
+
+            for b in range(2 * vertex_count):
+                if blossom_parent[b] == -1 and label[b] == 1 and best_edge[b] != -1:
+                    # Slack of edges between S blossoms is even with integer
+                    # weights.
+                    d = slack(best_edge[b]) // 2
+                    if delta_type == -1 or d < delta:
+                        delta = d
+                        delta_type = 3
+                        delta_edge = best_edge[b]
+
+            for b in range(vertex_count, 2 * vertex_count):
+                if blossom_base[b] < 0 or blossom_parent[b] != -1 or label[b] != 2:
+                    continue
+                if delta_type == -1 or dual[b] < delta:
+                    delta = dual[b]
+                    delta_type = 4
+                    delta_blossom = b
+
+            if delta_type == -1:
+                # Maximum cardinality reached, finish with a last dual update.
+                delta_type = 1
+                delta = max(0, min(dual[:vertex_count]))
+
+            for v in range(vertex_count):
+                if label[in_blossom[v]] == 1:
+                    dual[v] -= delta
+                elif label[in_blossom[v]] == 2:
+                    dual[v] += delta
+            for b in range(vertex_count, 2 * vertex_count):
+                if blossom_base[b] >= 0 and blossom_parent[b] == -1:
+                    if label[b] == 1:
+                        dual[b] += delta
+                    elif label[b] == 2:
+                        dual[b] -= delta
+
+            if delta_type == 1:
+                break
+            elif delta_type == 2:
+                allowed[delta_edge] = True
+                i, j, _ = edges[delta_edge]
+                if label[in_blossom[i]] == 0:
+                    i, j = j, i
+                queue.append(i)
+            elif delta_type == 3:
+                allowed[delta_edge] = True
+                i, j, _ = edges[delta_edge]
+                queue.append(i)
+            else:
+                expand_blossom(delta_blossom, False)
+
+        if not augmented:
+            break
+
+        for b in range(vertex_count, 2 * vertex_count):
+            if blossom_parent[b] == -1 and blossom_base[b] >= 0 and label[b] == 1 and dual[b] == 0:
+                expand_blossom(b, True)
+
+    return [endpoint[p] if p >= 0 else -1 for p in mate]
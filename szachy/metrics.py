@@ -0,0 +1,178 @@
+"""
+Request latency and hot path metrics in the Prometheus text format, and an
+opt-in sampling profiler for slow requests.
+
+The server only exposes them at /metrics when started with --metrics. With
+several workers every process keeps its own metrics, each scrape of /metrics
+sees the one that happened to serve it.
+"""
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import AsyncIterator, Deque, Dict, Iterator, List, Optional, Tuple
+import sys
+import threading
+import time
+
+from aiohttp import web
+from aiohttp.typedefs import Handler, Middleware
+
+# Upper bounds of histogram buckets, in seconds.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)  # The last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Labels) -> str:
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in labels)
+
+
+class Metrics:
+    """
+    Histograms of request latency per route, and of time spent in named
+    phases of handling requests: building views and rendering templates.
+    """
+    def __init__(self) -> None:
+        self.requests: Dict[Labels, Histogram] = {}
+        self.phases: Dict[Labels, Histogram] = {}
+
+    def observe_request(self, route: str, method: str, status: int, seconds: float) -> None:
+        labels = (('route', route), ('method', method), ('status', str(status)))
+        self.requests.setdefault(labels, Histogram()).observe(seconds)
+
+    def observe_phase(self, phase: str, name: str, seconds: float) -> None:
+        labels = (('phase', phase), ('name', name))
+        self.phases.setdefault(labels, Histogram()).observe(seconds)
+
+    @contextmanager
+    def time(self, phase: str, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_phase(phase, name, time.perf_counter() - start)
+
+    def middleware(self, profiler: Optional['SlowRequestProfiler'] = None) -> Middleware:
+        @web.middleware
+        async def metrics_middleware(request: web.Request, handler: Handler) -> web.StreamResponse:
+            resource = request.match_info.route.resource
+            route = resource.canonical if resource is not None else 'unmatched'
+            status = 500
+            start = time.perf_counter()
+            try:
+                response = await handler(request)
+                status = response.status
+                return response
+            except web.HTTPException as exception:
+                status = exception.status
+                raise
+            finally:
+                end = time.perf_counter()
+                self.observe_request(route, request.method, status, end - start)
+                if profiler is not None:
+                    profiler.request_finished(f'{request.method} {route}', start, end)
+
+        return metrics_middleware
+
+    def prometheus(self) -> str:
+        lines: List[str] = []
+        for metric, help_text, histograms in [
+            ('szachy_request_duration_seconds', 'Time to handle a request.', self.requests),
+            ('szachy_phase_duration_seconds', 'Time spent building views and rendering templates.', self.phases),
+        ]:
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} histogram')
+            for labels, histogram in sorted(histograms.items()):
+                label_text = _format_labels(labels)
+                cumulative = 0
+                for bound, count in zip([*map(str, BUCKETS), '+Inf'], histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{{label_text}}} {histogram.sum}')
+                lines.append(f'{metric}_count{{{label_text}}} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+class SlowRequestProfiler:
+    """
+    Samples the stack of the event loop thread from a background thread, and
+    appends the samples taken during requests slower than the threshold to a
+    file, in the folded format of flamegraph.pl and speedscope. The file is
+    written by the sampling thread, so the event loop never waits for it.
+
+    Requests are interleaved on the event loop, so the samples of a slow
+    request can include work done for others running at the same time.
+    """
+    def __init__(self, path: str, threshold: float, interval: float = 0.005, history: float = 30.0) -> None:
+        self.path = path
+        self.threshold = threshold
+        self.interval = interval
+        self.samples: Deque[Tuple[float, Tuple[str, ...]]] = deque(maxlen=int(history / interval))
+        self.slow_requests: List[Tuple[str, float, float]] = []  # Not written yet, as (label, start, end)
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread_id = threading.get_ident()
+
+    def _sample(self) -> None:
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_filename.rsplit("/", 1)[-1]}:{code.co_name}')
+                frame = frame.f_back
+            with self.lock:
+                self.samples.append((time.perf_counter(), tuple(reversed(stack))))
+            self.write_slow_requests()
+        self.write_slow_requests()
+
+    def request_finished(self, label: str, start: float, end: float) -> None:
+        if end - start >= self.threshold:
+            with self.lock:
+                self.slow_requests.append((label, start, end))
+
+    def write_slow_requests(self) -> None:
+        """
+        Append the samples of the slow requests finished since the last call
+        to the file.
+        """
+        with self.lock:
+            if not self.slow_requests:
+                return
+            folded: Dict[str, int] = {}
+            for label, start, end in self.slow_requests:
+                for timestamp, stack in self.samples:
+                    if start <= timestamp <= end:
+                        line = ';'.join((label, *stack))
+                        folded[line] = folded.get(line, 0) + 1
+            self.slow_requests.clear()
+
+        with open(self.path, 'a') as file:
+            for line, count in folded.items():
+                file.write(f'{line} {count}\n')
+
+    async def run(self, app: web.Application) -> AsyncIterator[None]:
+        """
+        Sample for the lifetime of the application, for cleanup_ctx.
+        """
+        self.thread_id = threading.get_ident()
+        self.stopped.clear()
+        thread = threading.Thread(target=self._sample, name='profiler', daemon=True)
+        thread.start()
+        yield
+        self.stopped.set()
+        thread.join()
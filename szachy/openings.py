@@ -0,0 +1,91 @@
+"""
+Opening explorer: statistics of the moves played in the first plies of stored
+games, merged by position.
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+
+from szachy.board import Board, IllegalMoveError, san_moves
+from szachy.positions import signed_hash
+from szachy.store import Store, StoreReader
+
+MAX_PLY = 20
+
+
+@dataclass(frozen=True)
+class OpeningMove:
+    san: str
+    games: int
+    white_wins: int
+    draws: int
+    black_wins: int
+    mean_rating: float  # Mean rating of the players of these games
+
+    @property
+    def score(self) -> float:
+        """
+        Average score of white, in doubled points like GameData.score.
+        """
+        return (2 * self.white_wins + self.draws) / self.games
+
+
+def update_opening_tree(store: Store, max_ply: int = MAX_PLY, batch_size: int = 1000, limit: Optional[int] = None) -> int:
+    """
+    Add games missing from the opening tree, all of them or about limit,
+    returning their number.
+
+    Only games whose ratings were replayed with Store.replay_ratings are added,
+    the tree counts the ratings checkpointed by it. Games are streamed in
+    batches, and statistics are aggregated in memory for one batch at a time
+    before being merged into the stored tree.
+    """
+    count = 0
+    while (limit is None or count < limit) and (batch := store.unexplored_games(batch_size)):
+        moves: Dict[Tuple[int, int], List[int]] = {}
+
+        for gid, pgn, score, white_rating, black_rating in batch:
+            board = Board()
+            for ply, san in enumerate(san_moves(pgn)):
+                if ply >= max_ply:
+                    break
+                try:
+                    move = board.parse_san(san)
+                except IllegalMoveError:
+                    break
+
+                stats = moves.setdefault((signed_hash(board.hash), move), [0, 0, 0, 0, 0])
+                stats[0] += 1
+                stats[1 if score == 2 else 2 if score == 1 else 3] += 1
+                stats[4] += white_rating + black_rating
+                board.push(move)
+
+        store.add_opening_moves(
+            ((hash_, move, games, white, draws, black, ratings)
+             for (hash_, move), (games, white, draws, black, ratings) in moves.items()),
+            (gid for gid, *_ in batch),
+        )
+        count += len(batch)
+
+    return count
+
+
+def explore(store: Union[Store, StoreReader], moves: List[str]) -> Tuple[Board, List[OpeningMove]]:
+    """
+    The position after a sequence of SAN moves from the starting position and
+    the statistics of moves played from it. Raises IllegalMoveError.
+    """
+    board = Board()
+    for san in moves:
+        board.push(board.parse_san(san))
+
+    return board, [
+        OpeningMove(
+            san=board.san(move),
+            games=games,
+            white_wins=white_wins,
+            draws=draws,
+            black_wins=black_wins,
+            mean_rating=rating_sum / games / 2,
+        )
+        for move, games, white_wins, draws, black_wins, rating_sum in store.opening_moves(signed_hash(board.hash))
+    ]
@@ -0,0 +1,259 @@
+"""
+Pairings of attending players for the rounds of an upcoming tournament.
+
+Every round is a minimum cost perfect matching over the attending players,
+found with the blossom algorithm. Pairs cost more for every game already
+played between the two players and for a gap in their expected scores, less
+when they owe each other a game with reversed colours, and a little more when
+both players are due the same colour.
+
+Usage: python -m szachy pair [--database PATH] [--rounds N | --round-robin] PLAYER...
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+import argparse
+import sys
+
+import numpy as np
+import numpy.typing as npt
+
+from szachy.chess import STARTING_RATING, Tournament, elo_expected_scores
+from szachy.games import player_column
+from szachy.matching import max_weight_matching
+from szachy.store import Store
+
+REPEAT_COST = 100  # Per game already played between the two players
+RETURN_GAME_BONUS = 100  # When their games with either colour are not balanced
+RATING_COST = 100  # Per point of difference between the expected scores
+COLOR_COST = 10  # Per game of colour imbalance in the same direction
+BYE_COST = 1  # Per game played fewer than the most active attending player
+PLANNED_REPEAT_COST = 1000  # Per game or bye already planned for the same players
+
+# Candidate opponents of every player kept in the matching graph. The full
+# graph is only used if these do not admit a perfect matching.
+NEIGHBOURS = 16
+
+
+@dataclass(frozen=True)
+class Pairing:
+    white: str
+    black: str
+    expected_score: float  # Of white, doubled as in GameData.score
+
+
+@dataclass(frozen=True)
+class Round:
+    pairings: List[Pairing]
+    bye: Optional[str]  # Player sitting out with an odd number of players
+
+
+class _PairingState:
+    """
+    Games between the attending players and their colour balance, updated
+    as rounds are planned.
+    """
+    def __init__(self, players: Sequence[str], ratings: Dict[str, int], tournaments: Sequence[Tournament]) -> None:
+        self.players = [*players]
+        ids = {player: i for i, player in enumerate(self.players)}
+        n = len(self.players)
+
+        self.ratings = np.array([ratings.get(player, STARTING_RATING) for player in self.players], dtype=np.float64)
+        self.white_games = np.zeros((n, n), dtype=np.int32)  # [i, j]: games of i as white against j
+        self.color_balance = np.zeros(n, dtype=np.int32)  # Games as white minus games as black
+        self.games_played = np.zeros(n, dtype=np.int32)
+        self.planned_games = np.zeros((n, n), dtype=np.int32)  # Symmetric
+        self.planned_byes = np.zeros(n, dtype=np.int32)
+
+        white = player_column((tournament.games for tournament in tournaments), 'white', ids)
+        black = player_column((tournament.games for tournament in tournaments), 'black', ids)
+        white_known = white[white >= 0]
+        black_known = black[black >= 0]
+        self.color_balance += np.bincount(white_known, minlength=n).astype(np.int32)
+        self.color_balance -= np.bincount(black_known, minlength=n).astype(np.int32)
+        self.games_played += np.bincount(white_known, minlength=n).astype(np.int32)
+        self.games_played += np.bincount(black_known, minlength=n).astype(np.int32)
+        both = (white >= 0) & (black >= 0)
+        np.add.at(self.white_games, (white[both], black[both]), 1)
+
+    def costs(self) -> npt.NDArray[np.int64]:
+        games = self.white_games + self.white_games.T
+        owed = self.white_games != self.white_games.T
+        expected = elo_expected_scores(self.ratings[:, np.newaxis], self.ratings[np.newaxis, :])
+
+        balance = self.color_balance
+        same_direction = (np.sign(balance)[:, np.newaxis] == np.sign(balance)[np.newaxis, :]) & (balance != 0)
+        shared_imbalance = np.minimum(np.abs(balance)[:, np.newaxis], np.abs(balance)[np.newaxis, :])
+
+        costs = RATING_COST * np.abs(expected - 1)
+        costs += REPEAT_COST * games - RETURN_GAME_BONUS * owed
+        costs += COLOR_COST * np.where(same_direction, shared_imbalance, 0)
+        costs += PLANNED_REPEAT_COST * self.planned_games
+        return np.asarray(np.rint(costs), dtype=np.int64)
+
+    def bye_costs(self) -> npt.NDArray[np.int64]:
+        costs = BYE_COST * (self.games_played.max() - self.games_played) + PLANNED_REPEAT_COST * self.planned_byes
+        return np.asarray(costs, dtype=np.int64)
+
+    def colors(self, i: int, j: int) -> Tuple[int, int]:
+        """
+        (white, black): whoever is owed white against the other, otherwise
+        whoever played black more often, otherwise the lower rated player.
+        """
+        if self.white_games[i, j] != self.white_games[j, i]:
+            return (i, j) if self.white_games[i, j] < self.white_games[j, i] else (j, i)
+        if self.color_balance[i] != self.color_balance[j]:
+            return (i, j) if self.color_balance[i] < self.color_balance[j] else (j, i)
+        return (i, j) if self.ratings[i] <= self.ratings[j] else (j, i)
+
+    def play(self, white: int, black: int) -> None:
+        self.white_games[white, black] += 1
+        self.color_balance[white] += 1
+        self.color_balance[black] -= 1
+        self.games_played[white] += 1
+        self.games_played[black] += 1
+        self.planned_games[white, black] += 1
+        self.planned_games[black, white] += 1
+
+
+def _match(costs: npt.NDArray[np.int64], bye_costs: Optional[npt.NDArray[np.int64]], neighbours: Optional[int]) -> List[int]:
+    """
+    Minimum cost perfect matching of players, with an extra vertex for the
+    bye if bye_costs are given. Only the neighbours cheapest opponents of
+    every player are considered unless it is None.
+    """
+    n = len(costs)
+    if neighbours is None or neighbours >= n - 1:
+        candidates = np.triu(np.ones((n, n), dtype=np.bool_), k=1)
+    else:
+        # Mask the diagonal with the largest cost so no player picks itself.
+        masked = costs + np.diag(np.full(n, np.iinfo(np.int32).max, dtype=np.int64))
+        nearest = np.argpartition(masked, neighbours, axis=1)[:, :neighbours]
+        candidates = np.zeros((n, n), dtype=np.bool_)
+        candidates[np.repeat(np.arange(n), neighbours), nearest.ravel()] = True
+        candidates = np.triu(candidates | candidates.T, k=1)
+
+    rows, columns = np.nonzero(candidates)
+    edge_costs = costs[rows, columns]
+    all_costs = edge_costs if bye_costs is None else np.concatenate((edge_costs, bye_costs))
+    # Maximum weight with maximum cardinality, so weights must be positive.
+    ceiling = int(all_costs.max()) + 1
+
+    edges = [(i, j, ceiling - cost) for i, j, cost in zip(rows.tolist(), columns.tolist(), edge_costs.tolist())]
+    if bye_costs is not None:
+        edges.extend((i, n, ceiling - cost) for i, cost in enumerate(bye_costs.tolist()))
+
+    mate = max_weight_matching(edges, max_cardinality=True)
+    mate.extend([-1] * (n + (bye_costs is not None) - len(mate)))
+    return mate
+
+
+def _pair_round(state: _PairingState) -> Round:
+    n = len(state.players)
+    costs = state.costs()
+    bye_costs = state.bye_costs() if n % 2 == 1 else None
+
+    mate = _match(costs, bye_costs, NEIGHBOURS)
+    if -1 in mate:
+        mate = _match(costs, bye_costs, None)
+
+    games = []
+    bye = None
+    for i in range(n):
+        j = mate[i]
+        if j == n:
+            bye = state.players[i]
+            state.planned_byes[i] += 1
+        elif i < j:
+            games.append(state.colors(i, j))
+
+    pairings = []
+    for white, black in games:
+        expected = elo_expected_scores(state.ratings[white], state.ratings[black])
+        pairings.append(Pairing(state.players[white], state.players[black], float(expected)))
+        state.play(white, black)
+
+    return Round(pairings, bye)
+
+
+def pair_rounds(
+    players: Sequence[str],
+    ratings: Dict[str, int],
+    tournaments: Sequence[Tournament],
+    rounds: int = 1,
+) -> List[Round]:
+    """
+    Pairings for consecutive rounds, each taking the previous ones into
+    account as if they had been played. Players without a rating start with
+    STARTING_RATING.
+    """
+    if len(players) < 2:
+        return []
+
+    state = _PairingState(players, ratings, tournaments)
+    return [_pair_round(state) for _ in range(rounds)]
+
+
+def round_robin(players: Sequence[str], ratings: Dict[str, int]) -> List[Round]:
+    """
+    All-play-all schedule by the circle method, with colours such that every
+    player ends with at most one game of either colour more than the other.
+    """
+    order: List[Optional[str]] = [*players]
+    if len(order) % 2 == 1:
+        order.append(None)
+    n = len(order)
+    if n < 2:
+        return []
+
+    # The last player is fixed, the others rotate: in round r, player r meets
+    # the fixed one and r + i meets r - i.
+    m = n - 1
+    rounds = []
+    for r in range(m):
+        games = [(r, m) if r % 2 == 0 else (m, r)]
+        for i in range(1, n // 2):
+            a, b = (r + i) % m, (r - i) % m
+            games.append((a, b) if i % 2 == 1 else (b, a))
+
+        pairings = []
+        bye = None
+        for white_index, black_index in games:
+            white, black = order[white_index], order[black_index]
+            if white is None or black is None:
+                bye = white or black
+                continue
+            expected = elo_expected_scores(ratings.get(white, STARTING_RATING), ratings.get(black, STARTING_RATING))
+            pairings.append(Pairing(white, black, float(expected)))
+        rounds.append(Round(pairings, bye))
+
+    return rounds
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m szachy pair')
+    parser.add_argument('--database', type=str, default='szachy.db')
+    parser.add_argument('--rounds', type=int, default=1)
+    parser.add_argument('--round-robin', action='store_true', help='all-play-all instead of rating-based rounds')
+    parser.add_argument('players', nargs='+')
+    args = parser.parse_args(argv)
+    players = [*dict.fromkeys(args.players)]
+
+    store = Store(args.database)
+    ratings, tournaments, _ = store.replay_ratings()
+    store.close()
+
+    unknown = [player for player in players if player not in ratings]
+    if unknown:
+        print(f'new players, starting at {STARTING_RATING}: {", ".join(unknown)}', file=sys.stderr)
+
+    if args.round_robin:
+        rounds = round_robin(players, ratings)
+    else:
+        rounds = pair_rounds(players, ratings, tournaments, args.rounds)
+
+    for number, round_ in enumerate(rounds, 1):
+        print(f'Runda {number}')
+        for pairing in round_.pairings:
+            print(f'  {pairing.white} - {pairing.black} ({50 * pairing.expected_score:.0f}%)')
+        if round_.bye is not None:
+            print(f'  pauza: {round_.bye}')
@@ -0,0 +1,133 @@
+"""
+Streaming parser of multi-game PGN files.
+"""
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Optional
+import re
+
+from szachy.types import Termination
+
+TAG_PATTERN = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+COMMENT_PATTERN = re.compile(r'\{[^}]*\}|;[^\n]*|\$\d+')
+VARIATION_PATTERN = re.compile(r'\([^()]*\)')
+RESULT_PATTERN = re.compile(r'(1-0|0-1|1/2-1/2|\*)$')
+MATE_PATTERN = re.compile(r'#\s*(1-0|0-1|1/2-1/2|\*)?$')
+
+# Result token -> doubled score, as in GameData.score.
+RESULTS = {'1-0': 2, '1/2-1/2': 1, '0-1': 0}
+
+
+@dataclass(frozen=True)
+class PgnGame:
+    tags: Dict[str, str]
+    movetext: str
+
+    @property
+    def white(self) -> str:
+        return self.tags.get('White', '?')
+
+    @property
+    def black(self) -> str:
+        return self.tags.get('Black', '?')
+
+    @property
+    def score(self) -> Optional[int]:
+        """
+        Doubled score, None for unfinished games.
+        """
+        result = self.tags.get('Result')
+        if result not in RESULTS:
+            match = RESULT_PATTERN.search(self.movetext)
+            result = match.group(1) if match else None
+        return RESULTS.get(result or '*')
+
+    @property
+    def termination(self) -> Termination:
+        text = self.tags.get('Termination', '').lower()
+
+        if 'checkmate' in text or MATE_PATTERN.search(self.movetext):
+            return Termination.CHECKMATE
+        if 'stalemate' in text:
+            return Termination.STALEMATE
+        if 'time' in text:
+            return Termination.TIMEOUT
+        if self.score == 1:
+            return Termination.DRAW
+        return Termination.RESIGNATION
+
+    @property
+    def date(self) -> Optional[date]:
+        """
+        Date of the game, None if missing or incomplete.
+        """
+        year, _, rest = self.tags.get('Date', '').partition('.')
+        month, _, day = rest.partition('.')
+        try:
+            return date(int(year), int(month), int(day))
+        except ValueError:
+            return None
+
+
+def split_games(lines: Iterable[str]) -> Iterator[List[str]]:
+    """
+    Group the lines of a PGN file into games, without parsing them.
+    """
+    game: List[str] = []
+    in_movetext = False
+
+    for line in lines:
+        line = line.lstrip('\ufeff').strip()
+        if not line or line.startswith('%'):
+            continue
+
+        if line.startswith('['):
+            if in_movetext:
+                yield game
+                game = []
+                in_movetext = False
+        else:
+            in_movetext = True
+
+        game.append(line)
+
+    if game:
+        yield game
+
+
+def clean_movetext(movetext: str) -> str:
+    movetext = COMMENT_PATTERN.sub(' ', movetext)
+
+    # Variations nest, strip the innermost ones until there are none left.
+    stripped = VARIATION_PATTERN.sub(' ', movetext)
+    while stripped != movetext:
+        movetext = stripped
+        stripped = VARIATION_PATTERN.sub(' ', movetext)
+
+    return ' '.join(movetext.split())
+
+
+def parse_game(lines: List[str]) -> PgnGame:
+    tags = {}
+    movetext = []
+
+    for line in lines:
+        match = TAG_PATTERN.fullmatch(line)
+        if match:
+            tags[match.group(1)] = match.group(2).replace('\\"', '"').replace('\\\\', '\\')
+        else:
+            movetext.append(line)
+
+    return PgnGame(tags, clean_movetext('\n'.join(movetext)))
+
+
+def parse_games(chunk: List[List[str]]) -> List[PgnGame]:
+    """
+    Parse a chunk of games from split_games, used as a unit of work by
+    process pools.
+    """
+    return [*map(parse_game, chunk)]
+
+
+def parse_pgn(lines: Iterable[str]) -> Iterator[PgnGame]:
+    return map(parse_game, split_games(lines))
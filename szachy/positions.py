@@ -0,0 +1,76 @@
+"""
+Index of the positions occurring in stored games, keyed by Zobrist hash.
+"""
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from szachy.board import Board, IllegalMoveError, san_moves
+from szachy.store import Store, StoreReader
+
+
+@dataclass(frozen=True)
+class PositionMatch:
+    gid: int
+    ply: int  # Number of half-moves played before the position first occurs
+    white: str
+    black: str
+    score: int
+
+
+@dataclass(frozen=True)
+class PositionResult:
+    games: List[PositionMatch]  # Most recent first, possibly truncated
+    scores: Dict[int, int]  # Score -> number of all matching games
+
+    @property
+    def total(self) -> int:
+        return sum(self.scores.values())
+
+
+def signed_hash(hash_: int) -> int:
+    """
+    Map a 64-bit hash to SQLite's signed integers.
+    """
+    return hash_ - (1 << 64) if hash_ >= 1 << 63 else hash_
+
+
+def game_positions(pgn: str) -> Iterator[Tuple[int, int]]:
+    """
+    (hash, ply) of every position in a game, up to the first illegal move.
+    """
+    board = Board()
+    yield board.hash, 0
+
+    for ply, san in enumerate(san_moves(pgn), 1):
+        try:
+            board.push(board.parse_san(san))
+        except IllegalMoveError:
+            return
+        yield board.hash, ply
+
+
+def update_position_index(store: Store, batch_size: int = 1000, limit: Optional[int] = None) -> int:
+    """
+    Index the games not indexed yet, all of them or about limit, returning
+    their number.
+    """
+    count = 0
+    while (limit is None or count < limit) and (batch := store.unindexed_games(batch_size)):
+        store.add_positions(
+            (
+                (signed_hash(hash_), gid, ply)
+                for gid, pgn in batch
+                for hash_, ply in game_positions(pgn)
+            ),
+            (gid for gid, pgn in batch),
+        )
+        count += len(batch)
+    return count
+
+
+def find_games(store: Union[Store, StoreReader], fen: str, limit: int = 100) -> PositionResult:
+    """
+    Games reaching the position, raising ValueError for invalid FENs.
+    """
+    games, scores = store.find_position(signed_hash(Board(fen).hash), limit)
+    return PositionResult([PositionMatch(*game) for game in games], scores)
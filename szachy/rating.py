@@ -0,0 +1,252 @@
+"""
+Rating systems the league can be displayed with.
+
+The store always replays Elo, the native rating of the league. Other engines
+rate the replayed tournaments again in a single pass over the history, with
+per-player state in arrays, and produce tournaments in the same form so every
+page and API shows their ratings instead.
+"""
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, replace
+from typing import Dict, List, Mapping, Tuple
+import math
+
+import numpy as np
+import numpy.typing as npt
+
+from szachy.chess import STARTING_RATING, Score, TotalScore, Tournament
+from szachy.games import GameList, GameTable
+
+# Games after which an Elo rating counts as established.
+ELO_MIN_GAMES = 10
+
+# Glicko-2 constants, in the units of the displayed ratings where applicable.
+GLICKO_SCALE = 400 / math.log(10)  # 173.7178, between displayed ratings and the internal scale
+INITIAL_DEVIATION = 350.0
+INITIAL_VOLATILITY = 0.06
+TAU = 0.5  # Constrains changes of volatility
+CONVERGENCE = 1e-6
+MAX_RANKED_DEVIATION = 150.0  # Deviation below which a Glicko-2 rating counts as established
+
+
+@dataclass(frozen=True)
+class RatedHistory:
+    ratings: Dict[str, int]  # Current rating of every player
+    tournaments: List[Tournament]  # With ratings and adjustments of the engine
+    deviations: Dict[str, int]  # Current rating deviation, empty without uncertainty
+
+
+class RatingEngine(ABC):
+    name: str  # Command line name
+    label: str  # Column header on pages
+
+    @abstractmethod
+    def rate(self, ratings: Dict[str, int], tournaments: List[Tournament]) -> RatedHistory:
+        """
+        Rate the history replayed by the store, given as its final Elo ratings
+        and tournaments.
+        """
+
+    @abstractmethod
+    def established(self, history: RatedHistory, player: str, total_score: TotalScore) -> bool:
+        """
+        Whether the player's rating is reliable enough for the ranking.
+        """
+
+
+class EloEngine(RatingEngine):
+    name = 'elo'
+    label = 'Elo'
+
+    def rate(self, ratings: Dict[str, int], tournaments: List[Tournament]) -> RatedHistory:
+        return RatedHistory(ratings, tournaments, {})
+
+    def established(self, history: RatedHistory, player: str, total_score: TotalScore) -> bool:
+        return total_score.games_played >= ELO_MIN_GAMES
+
+
+def _g(phi: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+    return np.asarray(1 / np.sqrt(1 + 3 * phi**2 / math.pi**2), dtype=np.float64)
+
+
+def _new_volatility(
+    phi: npt.NDArray[np.float64],
+    sigma: npt.NDArray[np.float64],
+    v: npt.NDArray[np.float64],
+    delta: npt.NDArray[np.float64],
+    tau: float,
+) -> npt.NDArray[np.float64]:
+    """
+    Step 5 of Glicko-2, the Illinois algorithm, for all players of a rating
+    period at once.
+    """
+    log_variance = np.log(sigma**2)
+
+    def f(x: npt.NDArray[np.float64], i: npt.NDArray[np.intp]) -> npt.NDArray[np.float64]:
+        ex = np.exp(x)
+        denominator = phi[i]**2 + v[i] + ex
+        return np.asarray(ex * (delta[i]**2 - denominator) / (2 * denominator**2) - (x - log_variance[i]) / tau**2, dtype=np.float64)
+
+    a = log_variance.copy()
+    everyone = np.arange(len(a))
+    big_delta = delta**2 > phi**2 + v
+    b = np.where(big_delta, np.log(np.maximum(delta**2 - phi**2 - v, np.finfo(np.float64).tiny)), a - tau)
+    searching = np.nonzero(~big_delta)[0]
+    while len(searching):
+        searching = searching[f(b[searching], searching) < 0]
+        b[searching] -= tau
+
+    fa = f(a, everyone)
+    fb = f(b, everyone)
+    active = np.nonzero(np.abs(b - a) > CONVERGENCE)[0]
+    while len(active):
+        c = a[active] + (a[active] - b[active]) * fa[active] / (fb[active] - fa[active])
+        fc = f(c, active)
+        crossed = fc * fb[active] <= 0
+        a[active] = np.where(crossed, b[active], a[active])
+        fa[active] = np.where(crossed, fb[active], fa[active] / 2)
+        b[active] = c
+        fb[active] = fc
+        active = active[np.abs(b[active] - a[active]) > CONVERGENCE]
+
+    return np.asarray(np.exp(a / 2), dtype=np.float64)
+
+
+def _rating_period(
+    mu: npt.NDArray[np.float64],
+    phi: npt.NDArray[np.float64],
+    sigma: npt.NDArray[np.float64],
+    me: npt.NDArray[np.intp],
+    opponent: npt.NDArray[np.intp],
+    score: npt.NDArray[np.float64],
+    tau: float,
+) -> Tuple[npt.NDArray[np.float64], npt.NDArray[np.float64], npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """
+    New mu, phi and sigma of players on the Glicko-2 scale after a rating
+    period with a game of me against opponent, scored 0, 0.5 or 1, for every
+    index. Also returns the expected score of each of these games.
+    """
+    g = _g(phi[opponent])
+    expected = 1 / (1 + np.exp(-g * (mu[me] - mu[opponent])))
+
+    v = 1 / np.bincount(me, weights=g**2 * expected * (1 - expected), minlength=len(mu))
+    improvement = np.bincount(me, weights=g * (score - expected), minlength=len(mu))
+    new_sigma = _new_volatility(phi, sigma, v, v * improvement, tau)
+    phi_star = np.sqrt(phi**2 + new_sigma**2)
+    new_phi = 1 / np.sqrt(1 / phi_star**2 + 1 / v)
+    return mu + new_phi**2 * improvement, new_phi, new_sigma, expected
+
+
+class Glicko2Engine(RatingEngine):
+    """
+    Glicko-2 with every ranked tournament as a rating period. Players missing
+    a period are not updated when it happens: the growth of their deviation is
+    caught up with when they play again, which gives the same result.
+    """
+    name = 'glicko2'
+    label = 'Glicko-2'
+
+    def __init__(self, tau: float = TAU, max_deviation: float = MAX_RANKED_DEVIATION) -> None:
+        self.tau = tau
+        self.max_deviation = max_deviation
+
+    def rate(self, ratings: Dict[str, int], tournaments: List[Tournament]) -> RatedHistory:
+        player_ids: Dict[str, int] = {player: i for i, player in enumerate(ratings)}
+        for tournament in tournaments:
+            for player in tournament.scores:
+                player_ids.setdefault(player, len(player_ids))
+
+        n = len(player_ids)
+        initial_phi = INITIAL_DEVIATION / GLICKO_SCALE
+        mu = np.zeros(n)
+        phi = np.full(n, initial_phi)
+        sigma = np.full(n, INITIAL_VOLATILITY)
+        last_period = np.full(n, -1, dtype=np.int64)  # Last rating period played, -1 for none
+        displayed = np.full(n, STARTING_RATING, dtype=np.int64)
+
+        # Per table of games: the global id of each of its players, and the
+        # ratings of the engine at the start of each game's tournament.
+        table_players: Dict[int, npt.NDArray[np.intp]] = {}
+        table_ratings: Dict[int, Tuple[GameTable, npt.NDArray[np.int64], npt.NDArray[np.int64]]] = {}
+        local_ids = np.zeros(n, dtype=np.intp)
+
+        period = 0
+        rated: List[Tuple[Tournament, Mapping[str, int], Mapping[str, Score]]] = []
+        for tournament in tournaments:
+            games = tournament.games
+            if not len(games):
+                rated.append((tournament, tournament.initial_ratings, tournament.scores))
+                continue
+
+            table = games.table
+            if id(table) not in table_ratings:
+                table_ratings[id(table)] = (table, np.zeros(len(table), dtype=np.int64), np.zeros(len(table), dtype=np.int64))
+            if len(table_players.get(id(table), ())) < len(table.players):
+                table_players[id(table)] = np.array([player_ids[player] for player in table.players], dtype=np.intp)
+            _, white_ratings, black_ratings = table_ratings[id(table)]
+            global_ids = table_players[id(table)]
+
+            players = [*tournament.scores]
+            ids = np.array([player_ids[player] for player in players], dtype=np.intp)
+            local_ids[ids] = np.arange(len(ids))
+            white = local_ids[global_ids[table.white[games.start:games.stop]]]
+            black = local_ids[global_ids[table.black[games.start:games.stop]]]
+            white_score = table.score[games.start:games.stop] / 2
+
+            # Deviation at the start of the period, grown by the periods missed.
+            missed = np.where(last_period[ids] >= 0, period - 1 - last_period[ids], 0)
+            phi_start = np.minimum(np.sqrt(phi[ids]**2 + missed * sigma[ids]**2), initial_phi)
+
+            # Both sides of every game: player, opponent and score.
+            me = np.concatenate((white, black))
+            opponent = np.concatenate((black, white))
+            score = np.concatenate((white_score, 1 - white_score))
+            initial = displayed[ids]
+            white_ratings[games.start:games.stop] = initial[white]
+            black_ratings[games.start:games.stop] = initial[black]
+
+            new_mu, new_phi, new_sigma, expected = _rating_period(mu[ids], phi_start, sigma[ids], me, opponent, score, self.tau)
+            expected_sums = np.bincount(me, weights=2 * expected, minlength=len(players))
+
+            if tournament.ranked:
+                mu[ids] = new_mu
+                phi[ids] = new_phi
+                sigma[ids] = new_sigma
+                last_period[ids] = period
+                displayed[ids] = np.rint(STARTING_RATING + GLICKO_SCALE * new_mu).astype(np.int64)
+                period += 1
+
+            scores: Dict[str, Score] = {}
+            for player, expected_sum, before, after in zip(players, expected_sums.tolist(), initial.tolist(), displayed[ids].tolist()):
+                score_ = Score()
+                score_.games_played = tournament.scores[player].games_played
+                score_.actual = tournament.scores[player].actual
+                score_.expected = expected_sum
+                score_.adjustment = after - before
+                scores[player] = score_
+            rated.append((tournament, dict(zip(players, initial.tolist())), scores))
+
+        rated_tables = {key: table.with_ratings(white, black) for key, (table, white, black) in table_ratings.items()}
+        rated_tournaments = [
+            replace(
+                tournament,
+                games=GameList(rated_tables[id(tournament.games.table)], tournament.games.start, tournament.games.stop),
+                initial_ratings=initial_ratings,
+                scores=scores,
+            )
+            for tournament, initial_ratings, scores in rated
+        ]
+
+        missed = np.where(last_period >= 0, period - 1 - last_period, 0)
+        deviations = np.rint(GLICKO_SCALE * np.minimum(np.sqrt(phi**2 + missed * sigma**2), initial_phi))
+        return RatedHistory(
+            {player: int(displayed[i]) for player, i in player_ids.items() if player in ratings},
+            rated_tournaments,
+            {player: int(deviations[i]) for player, i in player_ids.items() if player in ratings},
+        )
+
+    def established(self, history: RatedHistory, player: str, total_score: TotalScore) -> bool:
+        return history.deviations[player] <= self.max_deviation
+
+
+ENGINES: Dict[str, RatingEngine] = {engine.name: engine for engine in [EloEngine(), Glicko2Engine()]}
@@ -0,0 +1,283 @@
+"""
+Monte Carlo simulation of the outcome of a planned tournament.
+
+Results of every game are sampled from the Elo expected score, and ratings
+are adjusted as in elo_adjust_rating, all simulations of a chunk at once as
+NumPy arrays.
+
+Usage: python -m szachy simulate [--database PATH] [--rounds N | --round-robin] PLAYER...
+"""
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+import argparse
+import sys
+
+import numpy as np
+import numpy.typing as npt
+
+from szachy.chess import K_FACTOR, MINIMUM_RATING, STARTING_RATING, TotalScore, elo_expected_score
+from szachy.pairing import pair_rounds, round_robin
+from szachy.store import Store
+
+# Draw probability of evenly matched players when the league's own is unknown.
+DEFAULT_DRAW_RATE = 0.1
+
+# Simulations sampled at once. Chunks have their own random streams, so the
+# results only depend on the seed, not on the number of processes.
+CHUNK_SIZE = 10000
+MAX_CHUNK_CELLS = 2**24  # Bound on simulations times players in a chunk
+
+
+@dataclass(frozen=True)
+class _Model:
+    ratings: npt.NDArray[np.int64]  # Before the tournament, of all players
+    participants: npt.NDArray[np.intp]  # Indices of players with games
+    incidence: npt.NDArray[np.float32]  # [game, participant]: 1 if white, -1 if black
+    black_games: npt.NDArray[np.float32]  # Per participant
+    expected: npt.NDArray[np.float64]  # Doubled expected score per participant
+    win: npt.NDArray[np.float64]  # Per game, probability of a white win
+    draw: npt.NDArray[np.float64]  # Per game
+    max_adjustment: int
+
+
+@dataclass(frozen=True)
+class Simulation:
+    """
+    Distribution of the league ranking and ratings after the tournament.
+    """
+    players: List[str]  # All rated players and the newcomers
+    participants: List[str]  # Players with games in the tournament
+    simulations: int
+    rank_counts: npt.NDArray[np.int64]  # [player, rank - 1]: simulations with the player at the rank
+    adjustment_counts: npt.NDArray[np.int64]  # [participant, adjustment + max_adjustment]
+    max_adjustment: int
+
+    def rank_probabilities(self, player: str) -> Dict[int, float]:
+        counts = self.rank_counts[self.players.index(player)]
+        return {rank: count / self.simulations for rank, count in enumerate(counts.tolist(), 1) if count}
+
+    def rating_probabilities(self, player: str, rating: int) -> Dict[int, float]:
+        """
+        Probabilities of the player's ratings after the tournament, given the
+        rating before it.
+        """
+        counts = self.adjustment_counts[self.participants.index(player)]
+        return {
+            rating + adjustment - self.max_adjustment: count / self.simulations
+            for adjustment, count in enumerate(counts.tolist()) if count
+        }
+
+    def expected_adjustment(self, player: str) -> float:
+        counts = self.adjustment_counts[self.participants.index(player)]
+        adjustments = np.arange(len(counts)) - self.max_adjustment
+        return float(counts @ adjustments) / self.simulations
+
+
+def draw_rate(total_scores: Dict[str, TotalScore]) -> float:
+    """
+    Share of drawn games in the league, DEFAULT_DRAW_RATE without any games.
+    """
+    draws = sum(score.draws for score in total_scores.values())
+    games = sum(score.games_played for score in total_scores.values())
+    return draws / games if games else DEFAULT_DRAW_RATE
+
+
+def _build_model(games: Sequence[Tuple[str, str]], players: List[str], ratings: Dict[str, int], draw_rate: float) -> _Model:
+    ids = {player: i for i, player in enumerate(players)}
+    initial = np.array([ratings.get(player, STARTING_RATING) for player in players], dtype=np.int64)
+
+    participant_ids: Dict[int, int] = {}
+    for white, black in games:
+        participant_ids.setdefault(ids[white], len(participant_ids))
+        participant_ids.setdefault(ids[black], len(participant_ids))
+
+    incidence = np.zeros((len(games), len(participant_ids)), dtype=np.float32)
+    black_games = np.zeros(len(participant_ids), dtype=np.float32)
+    expected = [0.0] * len(participant_ids)
+    white_scores = []
+    for g, (white, black) in enumerate(games):
+        w, b = participant_ids[ids[white]], participant_ids[ids[black]]
+        incidence[g, w] += 1
+        incidence[g, b] -= 1
+        black_games[b] += 1
+        # Summed game by game like Score.expected, so adjustments round the same.
+        expected_score = elo_expected_score(ratings.get(white, STARTING_RATING), ratings.get(black, STARTING_RATING))
+        expected[w] += expected_score
+        expected[b] += 2 - expected_score
+        white_scores.append(expected_score / 2)
+
+    # Draws are most likely between evenly matched players, and taken evenly
+    # from both sides' winning chances to keep the expected score.
+    p = np.array(white_scores, dtype=np.float64)
+    draw = draw_rate * 2 * np.minimum(p, 1 - p)
+    games_per_participant = np.abs(incidence).sum(axis=0)
+
+    return _Model(
+        ratings=initial,
+        participants=np.array([*participant_ids], dtype=np.intp),
+        incidence=incidence,
+        black_games=black_games,
+        expected=np.array(expected, dtype=np.float64),
+        win=p - draw / 2,
+        draw=draw,
+        max_adjustment=int(K_FACTOR * games_per_participant.max(initial=0)),
+    )
+
+
+def _rank_counts(ratings: npt.NDArray[np.int64], participants: npt.NDArray[np.intp], adjusted: npt.NDArray[np.int64]) -> npt.NDArray[np.int64]:
+    """
+    Counts of the dense ranks by rating, as in compute_ranking, of all players
+    ([player, rank - 1]) over simulations in which the participants end with
+    the adjusted ratings ([simulation, participant]) and the others keep theirs.
+
+    The distinct ratings of the others (levels) are sorted once, and the
+    participants placed among them with searchsorted, so the cost grows with
+    the participants, not with the league.
+    """
+    simulations, m = adjusted.shape
+    n = len(ratings)
+    others = np.ones(n, dtype=np.bool_)
+    others[participants] = False
+    levels, other_levels = np.unique(ratings[others], return_inverse=True)
+
+    # Participants by rating in every simulation, with the levels below and
+    # above each, and whether it adds a distinct rating: none of the levels
+    # and not that of the previous participant.
+    order = np.argsort(adjusted, axis=1)
+    values = np.take_along_axis(adjusted, order, axis=1)
+    below = np.searchsorted(levels, values)
+    above = len(levels) - np.searchsorted(levels, values, side='right')
+    new = below + above == len(levels)
+    new[:, 1:] &= values[:, 1:] != values[:, :-1]
+    new_before = np.zeros((simulations, m + 1), dtype=np.int64)  # New distinct ratings among the first k participants
+    np.cumsum(new, axis=1, out=new_before[:, 1:])
+    new_total = new_before[:, m:]
+
+    # A participant is under the levels and the new ratings higher than its.
+    ranks = above + new_total - new_before[:, 1:]
+    counts = np.bincount((participants[order] * n + ranks).ravel(), minlength=n * n).reshape(n, n)
+
+    # Level i is under the higher levels and under new_total - new_before[k]
+    # new ratings for i in range(below[k - 1], below[k]): count simulations by
+    # level and number of new ratings above it as differences along levels.
+    starts = np.concatenate((np.zeros((simulations, 1), dtype=np.intp), below), axis=1)
+    stops = np.concatenate((below, np.full((simulations, 1), len(levels), dtype=np.intp)), axis=1)
+    new_above = new_total - new_before
+    size = (len(levels) + 1) * (m + 1)
+    entering = np.bincount((starts * (m + 1) + new_above).ravel(), minlength=size)
+    leaving = np.bincount((stops * (m + 1) + new_above).ravel(), minlength=size)
+    level_counts = np.cumsum((entering - leaving).reshape(len(levels) + 1, m + 1), axis=0)[:-1]
+
+    higher_levels = len(levels) - 1 - other_levels
+    counts[np.flatnonzero(others)[:, np.newaxis], higher_levels[:, np.newaxis] + np.arange(m + 1)] = level_counts[other_levels]
+    return counts
+
+
+def _simulate_chunk(model: _Model, simulations: int, seed: np.random.SeedSequence) -> Tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    """
+    Rank counts and adjustment counts, as in Simulation, of a chunk of
+    simulations.
+    """
+    rng = np.random.default_rng(seed)
+    m = len(model.participants)
+
+    # Doubled scores of white: 2 for a win, 1 for a draw, 0 for a loss.
+    u = rng.random((simulations, len(model.win)))
+    scores = (u < model.win).astype(np.float32) * 2 + ((u >= model.win) & (u < model.win + model.draw))
+    actual = scores @ model.incidence + 2 * model.black_games
+
+    initial = model.ratings[model.participants]
+    adjusted = np.rint(initial + K_FACTOR * (actual - model.expected) / 2).astype(np.int64)
+    adjusted = np.maximum(MINIMUM_RATING, adjusted)
+    adjustments = adjusted - initial
+
+    bins = 2 * model.max_adjustment + 1
+    flat_adjustments = (np.arange(m) * bins + adjustments + model.max_adjustment).ravel()
+    adjustment_counts = np.bincount(flat_adjustments, minlength=m * bins).reshape(m, bins)
+
+    rank_counts = _rank_counts(model.ratings, model.participants, adjusted)
+    return rank_counts.astype(np.int64), adjustment_counts.astype(np.int64)
+
+
+def simulate(
+    games: Sequence[Tuple[str, str]],
+    ratings: Dict[str, int],
+    simulations: int = 100000,
+    draw_rate: float = DEFAULT_DRAW_RATE,
+    seed: Optional[int] = None,
+    processes: int = 1,
+) -> Simulation:
+    """
+    Simulate a ranked tournament of (white, black) games, with every rated
+    player in the ranking. Players without a rating start with
+    STARTING_RATING, and draw_rate is the draw probability of evenly matched
+    players.
+    """
+    players = [*ratings]
+    for game in games:
+        players.extend(player for player in game if player not in ratings and player not in players)
+    model = _build_model(games, players, ratings, draw_rate)
+
+    chunk_size = max(1, min(CHUNK_SIZE, MAX_CHUNK_CELLS // max(1, len(players), len(games))))
+    sizes = [min(chunk_size, simulations - start) for start in range(0, simulations, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    if processes > 1 and len(sizes) > 1:
+        with ProcessPoolExecutor(processes) as executor:
+            chunks = [*executor.map(_simulate_chunk, [model] * len(sizes), sizes, seeds)]
+    else:
+        chunks = [*map(_simulate_chunk, [model] * len(sizes), sizes, seeds)]
+
+    n = len(players)
+    rank_counts = np.zeros((n, n), dtype=np.int64)
+    adjustment_counts = np.zeros((len(model.participants), 2 * model.max_adjustment + 1), dtype=np.int64)
+    for chunk_ranks, chunk_adjustments in chunks:
+        rank_counts += chunk_ranks
+        adjustment_counts += chunk_adjustments
+
+    return Simulation(
+        players=players,
+        participants=[players[i] for i in model.participants.tolist()],
+        simulations=simulations,
+        rank_counts=rank_counts,
+        adjustment_counts=adjustment_counts,
+        max_adjustment=model.max_adjustment,
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m szachy simulate')
+    parser.add_argument('--database', type=str, default='szachy.db')
+    parser.add_argument('--rounds', type=int, default=1)
+    parser.add_argument('--round-robin', action='store_true', help='all-play-all instead of rating-based rounds')
+    parser.add_argument('--simulations', type=int, default=100000)
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('players', nargs='+')
+    args = parser.parse_args(argv)
+
+    store = Store(args.database)
+    ratings, tournaments, total_scores = store.replay_ratings()
+    store.close()
+
+    if args.round_robin:
+        rounds = round_robin(args.players, ratings)
+    else:
+        rounds = pair_rounds(args.players, ratings, tournaments, args.rounds)
+    games = [(pairing.white, pairing.black) for round_ in rounds for pairing in round_.pairings]
+    if not games:
+        print('no games to simulate', file=sys.stderr)
+        sys.exit(1)
+
+    simulation = simulate(games, ratings, args.simulations, draw_rate(total_scores), args.seed, args.processes)
+
+    print(f'{len(games)} games, {simulation.simulations} simulations')
+    for player in sorted(simulation.participants, key=lambda player: -ratings.get(player, STARTING_RATING)):
+        rating = ratings.get(player, STARTING_RATING)
+        ranks = simulation.rank_probabilities(player)
+        likely_rank = max(ranks, key=lambda rank: ranks[rank])
+        print(
+            f'{player:24} {rating:5} {simulation.expected_adjustment(player):+7.1f}'
+            f'   miejsce {likely_rank} ({100 * ranks[likely_rank]:.0f}%), pierwsze {100 * ranks.get(1, 0):.0f}%'
+        )
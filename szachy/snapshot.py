@@ -0,0 +1,331 @@
+"""
+Binary snapshot of the replayed league, memory-mapped at startup instead of
+replaying the store.
+
+The file starts with a fixed header: magic, format version, the random id of
+the database and the store revision it was built from, a CRC-32 of
+everything after the header and the length of a JSON directory that follows
+it. The directory lists the arrays of the snapshot by name, with their dtype,
+offset and length, and the arrays follow, each aligned to 8 bytes. Games,
+their PGNs, the scores of players in tournaments and the timelines and
+head-to-head index are used in place from the mapping, the per-player and
+per-tournament rest is rebuilt from the arrays when loading.
+
+Checking the CRC reads the whole file, so loading only does it when asked to,
+as --verify does: the server maps the snapshot without touching the pages it
+does not need.
+
+Writing a snapshot also brings the position index and the opening tree up to
+date, the latter needing the replayed ratings, so that a server started from
+it has nothing left to index.
+
+Usage: python -m szachy snapshot [--database PATH] [--output PATH] [--verify]
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, DefaultDict, Dict, List, Optional, Tuple
+import argparse
+import datetime
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import zlib
+
+import numpy as np
+import numpy.typing as npt
+
+from szachy.chess import STARTING_RATING, InitialRatings, ScoreColumns, Scores, TotalScore, Tournament
+from szachy.games import GameTable
+from szachy.headtohead import HeadToHeadIndex
+from szachy.openings import update_opening_tree
+from szachy.positions import update_position_index
+from szachy.store import Store
+from szachy.timeline import Timelines
+
+MAGIC = b'SZACHYSS'
+FORMAT_VERSION = 5
+HEADER = struct.Struct('<8sIqqIQ')  # Magic, format version, database id, revision, CRC-32, directory length
+ALIGNMENT = 8
+NO_TID = -1  # Of tournaments not from a store
+
+Replay = Tuple[Dict[str, int], List[Tournament], Dict[str, TotalScore]]
+
+
+@dataclass(frozen=True)
+class Indexes:
+    """
+    Indexes of the replayed tournaments that pages look things up in.
+    """
+    timelines: Timelines
+    head_to_head: HeadToHeadIndex
+
+    @classmethod
+    def build(cls, tournaments: List[Tournament]) -> 'Indexes':
+        return cls(Timelines(tournaments), HeadToHeadIndex(tournaments))
+
+
+Snapshot = Tuple[Replay, Indexes]
+
+
+def _encode_strings(strings: List[str]) -> Tuple[npt.NDArray[np.uint8], npt.NDArray[np.int64]]:
+    encoded = [string.encode() for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(data) for data in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def _decode_strings(blob: npt.NDArray[np.uint8], offsets: npt.NDArray[np.int64]) -> List[str]:
+    data = blob.tobytes()
+    bounds = offsets.tolist()
+    return [data[start:end].decode() for start, end in zip(bounds, bounds[1:])]
+
+
+def _arrays(ratings: Dict[str, int], tournaments: List[Tournament], total_scores: Dict[str, TotalScore], indexes: Indexes) -> Dict[str, npt.NDArray[Any]]:
+    players = [*ratings]
+    for tournament in tournaments:
+        players.extend(player for player in tournament.scores if player not in ratings)
+    player_ids = {player: i for i, player in enumerate(players)}
+
+    arrays: Dict[str, npt.NDArray[Any]] = {}
+    arrays['players'], arrays['player_offsets'] = _encode_strings(players)
+    arrays['rated'] = np.array([player in ratings for player in players], dtype=np.bool_)
+    arrays['ratings'] = np.array([ratings.get(player, STARTING_RATING) for player in players], dtype=np.int64)
+    for field in ('wins', 'draws', 'losses'):
+        arrays[field] = np.array([getattr(total_scores.get(player, TotalScore()), field) for player in players], dtype=np.int32)
+
+    arrays['dates'] = np.array([tournament.date.toordinal() for tournament in tournaments], dtype=np.int32)
+    arrays['locations'], arrays['location_offsets'] = _encode_strings([tournament.location for tournament in tournaments])
+    arrays['ranked'] = np.array([tournament.ranked for tournament in tournaments], dtype=np.bool_)
+    arrays['tids'] = np.array([NO_TID if tournament.tid is None else tournament.tid for tournament in tournaments], dtype=np.int64)
+
+    scores = [(player, score, tournament.initial_ratings[player]) for tournament in tournaments for player, score in tournament.scores.items()]
+    arrays['score_offsets'] = np.cumsum([0, *(len(tournament.scores) for tournament in tournaments)], dtype=np.int64)
+    arrays['score_players'] = np.array([player_ids[player] for player, _, _ in scores], dtype=np.int32)
+    arrays['initial_ratings'] = np.array([rating for _, _, rating in scores], dtype=np.int64)
+    arrays['games_played'] = np.array([score.games_played for _, score, _ in scores], dtype=np.int32)
+    arrays['actual'] = np.array([score.actual for _, score, _ in scores], dtype=np.int32)
+    arrays['expected'] = np.array([score.expected for _, score, _ in scores], dtype=np.float64)
+    arrays['adjustments'] = np.array([score.adjustment for _, score, _ in scores], dtype=np.int32)
+
+    # Games of every tournament, contiguous in tournament order, with players
+    # renumbered as in the players array.
+    games = [tournament.games for tournament in tournaments]
+    arrays['game_offsets'] = np.cumsum([0, *map(len, games)], dtype=np.int64)
+    for column in GameTable._COLUMNS:
+        parts = [np.empty(0, dtype=getattr(GameTable(0), column).dtype)]
+        for game_list in games:
+            values = game_list.column(column)
+            if column in ('white', 'black'):
+                mapping = np.array([player_ids[player] for player in game_list.table.players], dtype=np.int32)
+                values = mapping[values]
+            parts.append(values)
+        arrays[f'game_{column}'] = np.concatenate(parts)
+
+    pgn_lengths = [np.diff(game_list.table.pgn_offsets[game_list.start:game_list.stop + 1]) for game_list in games]
+    arrays['pgn_offsets'] = np.concatenate(([0], np.cumsum(np.concatenate([np.empty(0, dtype=np.int64), *pgn_lengths])))).astype(np.int64)
+    arrays['pgn'] = np.frombuffer(b''.join(
+        bytes(game_list.table.pgn_buffer[game_list.table.pgn_offsets[game_list.start]:game_list.table.pgn_offsets[game_list.stop]])
+        for game_list in games
+    ), dtype=np.uint8)
+
+    arrays['timeline_players'], arrays['timeline_player_offsets'] = _encode_strings([*indexes.timelines.player_ids])
+    for name in Timelines.ARRAYS:
+        arrays[f'timeline_{name}'] = getattr(indexes.timelines, name)
+    arrays['head_to_head_players'], arrays['head_to_head_player_offsets'] = _encode_strings(indexes.head_to_head.players)
+    for name in HeadToHeadIndex.ARRAYS:
+        arrays[f'head_to_head_{name}'] = getattr(indexes.head_to_head, name)
+    return arrays
+
+
+def write_snapshot(
+    path: str,
+    database_id: int,
+    revision: int,
+    ratings: Dict[str, int],
+    tournaments: List[Tournament],
+    total_scores: Dict[str, TotalScore],
+    indexes: Optional[Indexes] = None,
+) -> None:
+    """
+    Write the replayed league and its indexes, built from it unless given,
+    replacing any snapshot at the path atomically: processes still mapping the
+    previous one keep reading it.
+    """
+    arrays = _arrays(ratings, tournaments, total_scores, indexes or Indexes.build(tournaments))
+
+    directory: Dict[str, Tuple[str, int, int]] = {}
+    offset = 0
+    for name, array in arrays.items():
+        directory[name] = (array.dtype.str, offset, len(array))
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    directory_bytes = json.dumps(directory).encode()
+    directory_bytes += b' ' * (-(HEADER.size + len(directory_bytes)) % ALIGNMENT)
+
+    body = bytearray(directory_bytes)
+    for name, array in arrays.items():
+        body += array.tobytes()
+        body += bytes(-len(body) % ALIGNMENT)
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, database_id, revision, zlib.crc32(body), len(directory_bytes))
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.snapshot-')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(header)
+            file.write(body)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def load_snapshot(path: str, database_id: int, revision: int, verify: bool = False) -> Optional[Snapshot]:
+    """
+    The replayed league and its indexes from a snapshot of the given database
+    and revision, None if there is none or it cannot be read, or if it is of
+    another database, revision or format. With verify, also None if its CRC
+    does not match.
+    """
+    try:
+        with open(path, 'rb') as file:
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):  # ValueError for empty files
+        return None
+
+    if len(mapping) < HEADER.size:
+        return None
+    magic, format_version, snapshot_database_id, snapshot_revision, checksum, directory_length = HEADER.unpack_from(mapping)
+    if magic != MAGIC or format_version != FORMAT_VERSION:
+        return None
+    if snapshot_database_id != database_id or snapshot_revision != revision:
+        return None
+
+    memory = memoryview(mapping)
+    if verify and zlib.crc32(memory[HEADER.size:]) != checksum:
+        return None
+
+    directory = json.loads(bytes(memory[HEADER.size:HEADER.size + directory_length]))
+    start = HEADER.size + directory_length
+    arrays: Dict[str, npt.NDArray[Any]] = {
+        name: np.frombuffer(memory, dtype=np.dtype(dtype), count=count, offset=start + offset)
+        for name, (dtype, offset, count) in directory.items()
+    }
+    replay = _replay(arrays, memory[start + directory['pgn'][1]:start + directory['pgn'][1] + directory['pgn'][2]])
+    return replay, _indexes(arrays)
+
+
+def _replay(arrays: Dict[str, npt.NDArray[Any]], pgn: memoryview) -> Replay:
+    players = _decode_strings(arrays['players'], arrays['player_offsets'])
+
+    ratings: DefaultDict[str, int] = defaultdict(lambda: STARTING_RATING)
+    total_scores: DefaultDict[str, TotalScore] = defaultdict(TotalScore)
+    for player, rated, rating, wins, draws, losses in zip(
+        players,
+        arrays['rated'].tolist(),
+        arrays['ratings'].tolist(),
+        arrays['wins'].tolist(),
+        arrays['draws'].tolist(),
+        arrays['losses'].tolist(),
+    ):
+        if rated:
+            ratings[player] = rating
+        if wins or draws or losses:
+            total_scores[player].wins = wins
+            total_scores[player].draws = draws
+            total_scores[player].losses = losses
+
+    table = GameTable.from_columns(
+        players,
+        {column: arrays[f'game_{column}'] for column in GameTable._COLUMNS},
+        arrays['pgn_offsets'],
+        pgn,
+    )
+
+    columns = ScoreColumns(
+        players,
+        arrays['score_players'],
+        arrays['initial_ratings'],
+        arrays['games_played'],
+        arrays['actual'],
+        arrays['expected'],
+        arrays['adjustments'],
+    )
+    score_offsets = arrays['score_offsets'].tolist()
+    game_offsets = arrays['game_offsets'].tolist()
+    tournaments = [
+        Tournament(
+            datetime.date.fromordinal(date),
+            location,
+            table.games(game_offsets[i], game_offsets[i + 1]),
+            ranked,
+            InitialRatings(columns, score_offsets[i], score_offsets[i + 1]),
+            Scores(columns, score_offsets[i], score_offsets[i + 1]),
+            None if tid == NO_TID else tid,
+        )
+        for i, (date, location, ranked, tid) in enumerate(zip(
+            arrays['dates'].tolist(),
+            _decode_strings(arrays['locations'], arrays['location_offsets']),
+            arrays['ranked'].tolist(),
+            arrays['tids'].tolist(),
+        ))
+    ]
+
+    return ratings, tournaments, total_scores
+
+
+def _indexes(arrays: Dict[str, npt.NDArray[Any]]) -> Indexes:
+    return Indexes(
+        Timelines.from_arrays(
+            _decode_strings(arrays['timeline_players'], arrays['timeline_player_offsets']),
+            {name: arrays[f'timeline_{name}'] for name in Timelines.ARRAYS},
+        ),
+        HeadToHeadIndex.from_arrays(
+            _decode_strings(arrays['head_to_head_players'], arrays['head_to_head_player_offsets']),
+            arrays['timeline_dates'].tolist(),
+            {name: arrays[f'head_to_head_{name}'] for name in HeadToHeadIndex.ARRAYS},
+        ),
+    )
+
+
+def replay_with_snapshot(store: Store, path: str, revision: int) -> Snapshot:
+    """
+    Store.replay_ratings and its indexes, from the snapshot at the path if it
+    is of the store at the given revision, and otherwise replayed and written
+    there. Failing to write it only costs the next start another replay.
+    """
+    database_id = store.database_id()
+    snapshot = load_snapshot(path, database_id, revision)
+    if snapshot is None:
+        replay = store.replay_ratings()
+        snapshot = replay, Indexes.build(replay[1])
+        try:
+            write_snapshot(path, database_id, revision, *replay, snapshot[1])
+        except OSError as error:
+            print(f'Could not write snapshot {path}: {error}', file=sys.stderr)
+    return snapshot
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m szachy snapshot')
+    parser.add_argument('--database', type=str, default='szachy.db')
+    parser.add_argument('--output', type=str, default=None, help='defaults to the database path with .snapshot appended')
+    parser.add_argument('--verify', action='store_true', help='check the snapshot against the database and its CRC instead of writing it')
+    args = parser.parse_args(argv)
+
+    store = Store(args.database)
+    path = args.output or f'{args.database}.snapshot'
+    revision = store.revision()
+    if args.verify:
+        valid = load_snapshot(path, store.database_id(), revision, verify=True) is not None
+        store.close()
+        print(f'{path} is {"valid" if valid else "stale or corrupt"}')
+        if not valid:
+            sys.exit(1)
+        return
+    write_snapshot(path, store.database_id(), revision, *store.replay_ratings())
+    indexed = update_position_index(store)
+    explored = update_opening_tree(store)
+    print(f'{indexed} games added to the position index, {explored} to the opening tree')
+    store.close()
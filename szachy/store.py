@@ -0,0 +1,748 @@
+"""
+SQLite-backed storage of games and tournaments.
+"""
+from collections import defaultdict
+from dataclasses import replace
+from datetime import date
+from itertools import groupby
+from typing import DefaultDict, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import hashlib
+import pathlib
+import sqlite3
+
+import numpy as np
+
+from szachy.batch import replay_tournaments
+from szachy.chess import STARTING_RATING, InitialRatings, ScoreColumns, Scores, TotalScore, Tournament
+from szachy.games import NO_EMBED, GameTable
+from szachy.types import GameData, Termination, TournamentData
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS players (
+    pid INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS tournaments (
+    tid INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    location TEXT NOT NULL,
+    ranked INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS tournaments_by_date ON tournaments (date, tid);
+
+CREATE TABLE IF NOT EXISTS games (
+    gid INTEGER PRIMARY KEY,
+    tid INTEGER NOT NULL REFERENCES tournaments (tid),
+    seq INTEGER NOT NULL,
+    white INTEGER NOT NULL REFERENCES players (pid),
+    black INTEGER NOT NULL REFERENCES players (pid),
+    pgn TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    termination INTEGER NOT NULL,
+    chess_com_embed INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS games_by_tournament ON games (tid, seq);
+CREATE INDEX IF NOT EXISTS games_by_white ON games (white);
+CREATE INDEX IF NOT EXISTS games_by_black ON games (black);
+
+-- Hashes of the date, players and moves of games, see game_fingerprint.
+CREATE TABLE IF NOT EXISTS game_fingerprints (
+    gid INTEGER PRIMARY KEY REFERENCES games (gid) ON DELETE CASCADE,
+    fingerprint BLOB NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS games_by_fingerprint ON game_fingerprints (fingerprint);
+
+-- Zobrist hashes of the positions occurring in games, see szachy.positions.
+CREATE TABLE IF NOT EXISTS positions (
+    hash INTEGER NOT NULL,
+    gid INTEGER NOT NULL REFERENCES games (gid) ON DELETE CASCADE,
+    ply INTEGER NOT NULL,
+    PRIMARY KEY (hash, gid, ply)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS positions_by_game ON positions (gid);
+
+CREATE TABLE IF NOT EXISTS indexed_games (
+    gid INTEGER PRIMARY KEY REFERENCES games (gid) ON DELETE CASCADE
+);
+
+-- Bumped on every change to tournaments or games.
+CREATE TABLE IF NOT EXISTS revision (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    value INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO revision (id, value) VALUES (0, 0);
+
+-- Random id telling this database apart from others, such as a recreated one
+-- whose revision has started over.
+CREATE TABLE IF NOT EXISTS identity (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    value INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO identity (id, value) VALUES (0, random());
+
+-- Results of replaying the ratings up to and including a tournament. They
+-- always cover a chronological prefix of the tournaments table.
+CREATE TABLE IF NOT EXISTS checkpoints (
+    tid INTEGER PRIMARY KEY REFERENCES tournaments (tid) ON DELETE CASCADE
+);
+
+-- Scores of the players taking part in the tournament. Ratings after it are the
+-- initial ratings plus the adjustments, so the ratings at a checkpoint are
+-- those after the latest tournament of every player, and the total scores
+-- follow from the games: nothing is stored for players not taking part.
+CREATE TABLE IF NOT EXISTS scores (
+    tid INTEGER NOT NULL REFERENCES checkpoints (tid) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    pid INTEGER NOT NULL REFERENCES players (pid),
+    initial_rating INTEGER NOT NULL,
+    games_played INTEGER NOT NULL,
+    actual INTEGER NOT NULL,
+    expected REAL NOT NULL,
+    adjustment INTEGER NOT NULL,
+    PRIMARY KEY (tid, seq)
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS scores_by_player ON scores (tid, pid);
+
+-- Opening tree: statistics of moves played from positions early in games,
+-- see szachy.openings.
+CREATE TABLE IF NOT EXISTS opening_moves (
+    hash INTEGER NOT NULL,  -- Zobrist hash of the position before the move
+    move INTEGER NOT NULL,  -- As encoded by szachy.board
+    games INTEGER NOT NULL,
+    white_wins INTEGER NOT NULL,
+    draws INTEGER NOT NULL,
+    black_wins INTEGER NOT NULL,
+    rating_sum INTEGER NOT NULL,  -- Sum of both players' ratings over all games
+    PRIMARY KEY (hash, move)
+) WITHOUT ROWID;
+
+-- Games counted in opening_moves.
+CREATE TABLE IF NOT EXISTS opening_games (
+    gid INTEGER PRIMARY KEY
+);
+'''
+
+# Bumped whenever SCHEMA changes; stored in PRAGMA user_version.
+SCHEMA_VERSION = 8
+
+
+def game_fingerprint(date_: date, game: GameData) -> bytes:
+    """
+    Identity of a game for spotting the same one imported twice.
+    """
+    key = '\n'.join((date_.isoformat(), game.white, game.black, game.pgn))
+    return hashlib.sha256(key.encode()).digest()[:16]
+
+
+def _read_revision(connection: sqlite3.Connection) -> int:
+    (value,) = connection.execute('SELECT value FROM revision').fetchone()
+    return int(value)
+
+
+def _find_position(connection: sqlite3.Connection, hash_: int, limit: int) -> Tuple[List[Tuple[int, int, str, str, int]], Dict[int, int]]:
+    games = connection.execute('''
+        SELECT p.gid, MIN(p.ply), w.name, b.name, g.score
+        FROM positions AS p
+        JOIN games AS g ON g.gid = p.gid
+        JOIN players AS w ON w.pid = g.white
+        JOIN players AS b ON b.pid = g.black
+        WHERE p.hash = ?
+        GROUP BY p.gid
+        ORDER BY p.gid DESC
+        LIMIT ?
+    ''', (hash_, limit)).fetchall()
+
+    scores = dict(connection.execute('''
+        SELECT g.score, COUNT(*)
+        FROM games AS g
+        WHERE g.gid IN (SELECT gid FROM positions WHERE hash = ?)
+        GROUP BY g.score
+    ''', (hash_,)).fetchall())
+
+    return games, scores
+
+
+def _opening_moves(connection: sqlite3.Connection, hash_: int) -> List[Tuple[int, int, int, int, int, int]]:
+    return connection.execute('''
+        SELECT move, games, white_wins, draws, black_wins, rating_sum
+        FROM opening_moves
+        WHERE hash = ?
+        ORDER BY games DESC, move
+    ''', (hash_,)).fetchall()
+
+
+class StoreReader:
+    """
+    Read-only connection to an existing store, for polling its revision and
+    for queries run in a background thread. Opening a Store writes to the
+    database, which would compete with imports for its lock on every poll.
+    """
+    def __init__(self, path: str) -> None:
+        uri = f'{pathlib.Path(path).resolve().as_uri()}?mode=ro'
+        self.connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def revision(self) -> int:
+        return _read_revision(self.connection)
+
+    def find_position(self, hash_: int, limit: int) -> Tuple[List[Tuple[int, int, str, str, int]], Dict[int, int]]:
+        """
+        Same as Store.find_position.
+        """
+        return _find_position(self.connection, hash_, limit)
+
+    def opening_moves(self, hash_: int) -> List[Tuple[int, int, int, int, int, int]]:
+        """
+        Same as Store.opening_moves.
+        """
+        return _opening_moves(self.connection, hash_)
+
+
+class Store:
+    """
+    Games and tournaments kept in an SQLite database.
+
+    Tournaments are ordered by date, ties broken by insertion order, and games
+    within a tournament keep the order in which they were added.
+    """
+    def __init__(self, path: str) -> None:
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        # Readers (the web server) do not wait for writers (imports, reloads).
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.executescript(SCHEMA)
+        self._player_ids: Dict[str, int] = {}
+
+        (version,) = self.connection.execute('PRAGMA user_version').fetchone()
+        if version == 0:
+            self._migrate_literals()
+        elif version < SCHEMA_VERSION:
+            if version < 7:
+                self._migrate_fingerprints()
+            if version < 8:
+                self._migrate_checkpoint_players()
+            self.connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def _migrate_literals(self) -> None:
+        """
+        One-time import of the historical literals from szachy.database.
+        """
+        from szachy.database import TOURNAMENTS
+
+        with self.connection:
+            (count,) = self.connection.execute('SELECT COUNT(*) FROM tournaments').fetchone()
+            if count == 0:
+                for tournament in TOURNAMENTS:
+                    self._insert_tournament(tournament)
+            self.connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def _migrate_fingerprints(self) -> None:
+        with self.connection:
+            for tid, tournament in self._iter_tournaments():
+                self._insert_fingerprints(tournament.date, tournament.games)
+
+    def _migrate_checkpoint_players(self) -> None:
+        """
+        Drop the ratings and total scores of every player that earlier
+        checkpoints stored, they follow from the scores and games.
+        """
+        with self.connection:
+            self.connection.execute('DROP TABLE IF EXISTS checkpoint_players')
+
+    def player_id(self, name: str) -> int:
+        try:
+            return self._player_ids[name]
+        except KeyError:
+            pass
+
+        self.connection.execute('INSERT OR IGNORE INTO players (name) VALUES (?)', (name,))
+        (pid,) = self.connection.execute('SELECT pid FROM players WHERE name = ?', (name,)).fetchone()
+        self._player_ids[name] = int(pid)
+        return self._player_ids[name]
+
+    def _insert_tournament(self, tournament: TournamentData) -> int:
+        cursor = self.connection.execute(
+            'INSERT INTO tournaments (date, location, ranked) VALUES (?, ?, ?)',
+            (tournament.date.isoformat(), tournament.location, tournament.ranked),
+        )
+        assert cursor.lastrowid is not None
+        self._insert_games(cursor.lastrowid, tournament.date, tournament.games)
+        return cursor.lastrowid
+
+    def _insert_games(self, tid: int, date_: date, games: List[GameData], first_seq: int = 0) -> None:
+        self.connection.executemany(
+            'INSERT INTO games (gid, tid, seq, white, black, pgn, score, termination, chess_com_embed) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (
+                (
+                    game.gid,
+                    tid,
+                    seq,
+                    self.player_id(game.white),
+                    self.player_id(game.black),
+                    game.pgn,
+                    game.score,
+                    game.termination.value,
+                    game.chess_com_embed,
+                )
+                for seq, game in enumerate(games, first_seq)
+            ),
+        )
+        self._insert_fingerprints(date_, games)
+
+    def _insert_fingerprints(self, date_: date, games: Iterable[GameData]) -> None:
+        self.connection.executemany(
+            'INSERT INTO game_fingerprints (gid, fingerprint) VALUES (?, ?)',
+            ((game.gid, game_fingerprint(date_, game)) for game in games),
+        )
+
+    def _is_stored(self, fingerprint: bytes) -> bool:
+        row = self.connection.execute('SELECT 1 FROM game_fingerprints WHERE fingerprint = ?', (fingerprint,)).fetchone()
+        return row is not None
+
+    def revision(self) -> int:
+        """
+        Version of the stored data, changed by every write.
+        """
+        return _read_revision(self.connection)
+
+    def database_id(self) -> int:
+        """
+        Random id of the database, the same for as long as it exists.
+        """
+        (value,) = self.connection.execute('SELECT value FROM identity').fetchone()
+        return int(value)
+
+    def _invalidate_from(self, tid: int) -> None:
+        """
+        Drop the checkpoints of a tournament and of everything played after it.
+
+        The opening tree holds the ratings of players at the time of each game,
+        so it is dropped as well if it counts any of the affected games.
+        """
+        self.connection.execute('''
+            DELETE FROM checkpoints WHERE tid IN (
+                SELECT t.tid
+                FROM tournaments AS t
+                WHERE (t.date, t.tid) >= (SELECT date, tid FROM tournaments WHERE tid = ?)
+            )
+        ''', (tid,))
+
+        affected = self.connection.execute('''
+            SELECT 1
+            FROM opening_games AS o
+            JOIN games AS g ON g.gid = o.gid
+            JOIN tournaments AS t ON t.tid = g.tid
+            WHERE (t.date, t.tid) >= (SELECT date, tid FROM tournaments WHERE tid = ?)
+            LIMIT 1
+        ''', (tid,)).fetchone()
+        if affected:
+            self.connection.execute('DELETE FROM opening_moves')
+            self.connection.execute('DELETE FROM opening_games')
+
+    def add_tournament(self, tournament: TournamentData) -> int:
+        with self.connection:
+            tid = self._insert_tournament(tournament)
+            self._invalidate_from(tid)
+            self.connection.execute('UPDATE revision SET value = value + 1')
+            return tid
+
+    def next_gid(self) -> int:
+        (gid,) = self.connection.execute('SELECT COALESCE(MAX(gid), 0) + 1 FROM games').fetchone()
+        return int(gid)
+
+    def add_games(self, games: Iterable[Tuple[date, str, bool, GameData]]) -> int:
+        """
+        Append games to the tournaments with given dates and locations, creating
+        them as needed, and return how many were added. Games already stored
+        with the same date, players and moves are left out, so importing a
+        file twice does not count its games twice. All games are added in a
+        single transaction.
+        """
+        tournaments: Dict[Tuple[date, str], List[GameData]] = {}
+        ranked: Dict[Tuple[date, str], bool] = {}
+        seen: Set[bytes] = set()
+        for date_, location, is_ranked, game in games:
+            fingerprint = game_fingerprint(date_, game)
+            if fingerprint in seen or self._is_stored(fingerprint):
+                continue
+            seen.add(fingerprint)
+            tournaments.setdefault((date_, location), []).append(game)
+            ranked.setdefault((date_, location), is_ranked)
+
+        if not tournaments:
+            return 0
+
+        with self.connection:
+            tids = []
+            for (date_, location), tournament_games in tournaments.items():
+                tid = self.find_tournament(date_, location)
+                if tid is None:
+                    tid = self._insert_tournament(TournamentData(date_, location, [], ranked[date_, location]))
+                (seq,) = self.connection.execute(
+                    'SELECT COALESCE(MAX(seq), -1) + 1 FROM games WHERE tid = ?', (tid,)
+                ).fetchone()
+                self._insert_games(tid, date_, tournament_games, first_seq=seq)
+                tids.append(tid)
+
+            (earliest,) = self.connection.execute(
+                f'SELECT tid FROM tournaments WHERE tid IN ({", ".join("?" * len(tids))}) ORDER BY date, tid LIMIT 1',
+                tids,
+            ).fetchone()
+            self._invalidate_from(earliest)
+            self.connection.execute('UPDATE revision SET value = value + 1')
+
+        return sum(map(len, tournaments.values()))
+
+    def find_tournament(self, date_: date, location: str) -> Optional[int]:
+        row = self.connection.execute(
+            'SELECT tid FROM tournaments WHERE date = ? AND location = ? ORDER BY tid LIMIT 1',
+            (date_.isoformat(), location),
+        ).fetchone()
+        return None if row is None else int(row[0])
+
+    def replace_tournament(self, tid: int, tournament: TournamentData) -> None:
+        """
+        Correct a tournament that has already been stored.
+        """
+        with self.connection:
+            self._invalidate_from(tid)
+            self.connection.execute('DELETE FROM games WHERE tid = ?', (tid,))
+            self.connection.execute(
+                'UPDATE tournaments SET date = ?, location = ?, ranked = ? WHERE tid = ?',
+                (tournament.date.isoformat(), tournament.location, tournament.ranked, tid),
+            )
+            self._insert_games(tid, tournament.date, tournament.games)
+            self._invalidate_from(tid)
+            self.connection.execute('UPDATE revision SET value = value + 1')
+
+    def unindexed_games(self, limit: int) -> List[Tuple[int, str]]:
+        """
+        Up to limit (gid, pgn) pairs of games missing from the position index.
+        """
+        return self.connection.execute('''
+            SELECT gid, pgn FROM games
+            WHERE gid NOT IN (SELECT gid FROM indexed_games)
+            ORDER BY gid
+            LIMIT ?
+        ''', (limit,)).fetchall()
+
+    def add_positions(self, positions: Iterable[Tuple[int, int, int]], gids: Iterable[int]) -> None:
+        """
+        Add (hash, gid, ply) rows to the position index and mark the games as
+        indexed. Rows already added by another connection are left as they are.
+        """
+        with self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO positions (hash, gid, ply) VALUES (?, ?, ?)', positions)
+            self.connection.executemany('INSERT OR IGNORE INTO indexed_games (gid) VALUES (?)', ((gid,) for gid in gids))
+
+    def find_position(self, hash_: int, limit: int) -> Tuple[List[Tuple[int, int, str, str, int]], Dict[int, int]]:
+        """
+        Games in which a position occurs, as (gid, first ply, white, black,
+        score) for up to limit games, and the number of all such games by score.
+        """
+        return _find_position(self.connection, hash_, limit)
+
+    def unexplored_games(self, limit: int) -> List[Tuple[int, str, int, int, int]]:
+        """
+        Up to limit (gid, pgn, score, white rating, black rating) tuples of
+        games missing from the opening tree.
+
+        The ratings are those at the start of the game's tournament, read from
+        the scores checkpointed by replay_ratings. Games of tournaments not
+        replayed since they were added or invalidated are left out until the
+        next replay.
+        """
+        return self.connection.execute('''
+            SELECT g.gid, g.pgn, g.score, w.initial_rating, b.initial_rating
+            FROM games AS g
+            JOIN scores AS w ON w.tid = g.tid AND w.pid = g.white
+            JOIN scores AS b ON b.tid = g.tid AND b.pid = g.black
+            WHERE g.gid NOT IN (SELECT gid FROM opening_games)
+            ORDER BY g.gid
+            LIMIT ?
+        ''', (limit,)).fetchall()
+
+    def add_opening_moves(self, moves: Iterable[Tuple[int, int, int, int, int, int, int]], gids: Iterable[int]) -> None:
+        """
+        Add (hash, move, games, white wins, draws, black wins, rating sum)
+        statistics to the opening tree and mark the games as counted.
+        """
+        with self.connection:
+            self.connection.executemany('''
+                INSERT INTO opening_moves (hash, move, games, white_wins, draws, black_wins, rating_sum)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (hash, move) DO UPDATE SET
+                    games = games + excluded.games,
+                    white_wins = white_wins + excluded.white_wins,
+                    draws = draws + excluded.draws,
+                    black_wins = black_wins + excluded.black_wins,
+                    rating_sum = rating_sum + excluded.rating_sum
+            ''', moves)
+            self.connection.executemany('INSERT INTO opening_games (gid) VALUES (?)', ((gid,) for gid in gids))
+
+    def opening_moves(self, hash_: int) -> List[Tuple[int, int, int, int, int, int]]:
+        """
+        (move, games, white wins, draws, black wins, rating sum) of all moves
+        played from a position, most popular first.
+        """
+        return _opening_moves(self.connection, hash_)
+
+    def _iter_tournaments(self, checkpointed: Optional[bool] = None) -> Iterator[Tuple[int, TournamentData]]:
+        condition = {
+            None: '',
+            True: 'WHERE EXISTS (SELECT 1 FROM checkpoints AS c WHERE c.tid = t.tid)',
+            False: 'WHERE NOT EXISTS (SELECT 1 FROM checkpoints AS c WHERE c.tid = t.tid)',
+        }[checkpointed]
+
+        cursor = self.connection.execute(f'''
+            SELECT t.tid, t.date, t.location, t.ranked,
+                   g.gid, w.name, b.name, g.pgn, g.score, g.termination, g.chess_com_embed
+            FROM tournaments AS t
+            JOIN games AS g ON g.tid = t.tid
+            JOIN players AS w ON w.pid = g.white
+            JOIN players AS b ON b.pid = g.black
+            {condition}
+            ORDER BY t.date, t.tid, g.seq
+        ''')
+
+        for (tid, date_, location, ranked), rows in groupby(cursor, key=lambda row: row[:4]):
+            yield tid, TournamentData(
+                date=date.fromisoformat(date_),
+                location=location,
+                games=[
+                    GameData(
+                        gid=gid,
+                        white=white,
+                        black=black,
+                        pgn=pgn,
+                        score=score,
+                        termination=Termination(termination),
+                        chess_com_embed=chess_com_embed,
+                    )
+                    for _, _, _, _, gid, white, black, pgn, score, termination, chess_com_embed
+                    in rows
+                ],
+                ranked=bool(ranked),
+            )
+
+    def iter_tournaments(self) -> Iterator[TournamentData]:
+        """
+        Stream all tournaments in chronological order.
+
+        A single cursor walks the games table, so only one tournament's games
+        are held in memory at a time.
+        """
+        for tid, tournament in self._iter_tournaments():
+            yield tournament
+
+    def _load_checkpoint(self) -> Tuple[DefaultDict[str, int], List[Tournament], DefaultDict[str, TotalScore], GameTable]:
+        """
+        The replay up to the last checkpoint, read as columns: the games into
+        a table that those of later tournaments can be appended to, and the
+        scores into columns shared by the tournaments. Ratings and total scores
+        follow from the latest score of every player and from the games.
+        """
+        tournament_rows = self.connection.execute('''
+            SELECT t.tid, t.date, t.location, t.ranked
+            FROM tournaments AS t
+            JOIN checkpoints AS c ON c.tid = t.tid
+            ORDER BY t.date, t.tid
+        ''').fetchall()
+        game_rows = self.connection.execute('''
+            SELECT g.tid, g.gid, g.white, g.black, g.pgn, g.score, g.termination, COALESCE(g.chess_com_embed, ?)
+            FROM tournaments AS t
+            JOIN checkpoints AS c ON c.tid = t.tid
+            JOIN games AS g ON g.tid = t.tid
+            ORDER BY t.date, t.tid, g.seq
+        ''', (NO_EMBED,)).fetchall()
+        score_rows = self.connection.execute('''
+            SELECT s.tid, s.pid, s.initial_rating, s.games_played, s.actual, s.expected, s.adjustment
+            FROM tournaments AS t
+            JOIN scores AS s ON s.tid = t.tid
+            ORDER BY t.date, t.tid, s.seq
+        ''').fetchall()
+
+        tids, dates, locations, ranked = zip(*tournament_rows) if tournament_rows else ((),) * 4
+        game_tids, gids, white_pids, black_pids, pgns, game_scores, terminations, embeds = (
+            zip(*game_rows) if game_rows else ((),) * 8
+        )
+        score_tids, score_pids, initial_ratings, games_played, actual, expected, adjustments = (
+            zip(*score_rows) if score_rows else ((),) * 7
+        )
+
+        # Players numbered in order of their first game, as in a replay.
+        pids = np.stack((np.array(white_pids, dtype=np.int64), np.array(black_pids, dtype=np.int64)), axis=1).ravel()
+        unique, first = np.unique(pids, return_index=True)
+        ordered = unique[np.argsort(first)]
+        numbers = np.zeros(int(unique.max(initial=0)) + 1, dtype=np.int32)
+        numbers[ordered] = np.arange(len(ordered), dtype=np.int32)
+        names = dict(self.connection.execute('SELECT pid, name FROM players'))
+        players = [names[pid] for pid in ordered.tolist()]
+        white, black = numbers[pids[0::2]], numbers[pids[1::2]]
+
+        # Rows of the i-th tournament are range(offsets[i], offsets[i + 1]).
+        positions = {tid: i for i, tid in enumerate(tids)}
+        game_tournaments = np.array([positions[tid] for tid in game_tids], dtype=np.int64)
+        score_tournaments = np.array([positions[tid] for tid in score_tids], dtype=np.int64)
+        bounds = np.arange(len(tids) + 1)
+        game_offsets = np.searchsorted(game_tournaments, bounds).tolist()
+        score_offsets = np.searchsorted(score_tournaments, bounds).tolist()
+
+        columns = ScoreColumns(
+            players,
+            numbers[np.array(score_pids, dtype=np.int64)],
+            np.array(initial_ratings, dtype=np.int64),
+            np.array(games_played, dtype=np.int32),
+            np.array(actual, dtype=np.int32),
+            np.array(expected, dtype=np.float64),
+            np.array(adjustments, dtype=np.int32),
+        )
+
+        # Games carry the ratings their players started the tournament with.
+        score_keys = score_tournaments * len(players) + columns.player
+        order = np.argsort(score_keys)
+        rows = order[np.searchsorted(score_keys, np.stack((
+            game_tournaments * len(players) + white,
+            game_tournaments * len(players) + black,
+        )), sorter=order)]
+
+        encoded = [pgn.encode() for pgn in pgns]
+        pgn_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(pgn) for pgn in encoded], out=pgn_offsets[1:])
+        score = np.array(game_scores, dtype=np.int8)
+        table = GameTable.from_columns(
+            players,
+            {
+                'gid': np.array(gids, dtype=np.int64),
+                'white': white,
+                'black': black,
+                'white_rating': columns.initial_rating[rows[0]].astype(np.int32),
+                'black_rating': columns.initial_rating[rows[1]].astype(np.int32),
+                'score': score,
+                'termination': np.array(terminations, dtype=np.int8),
+                'chess_com_embed': np.array(embeds, dtype=np.int64),
+            },
+            pgn_offsets,
+            bytearray(b''.join(encoded)),
+        )
+
+        tournaments = [
+            Tournament(
+                date.fromisoformat(date_),
+                location,
+                table.games(game_offsets[i], game_offsets[i + 1]),
+                bool(is_ranked),
+                InitialRatings(columns, score_offsets[i], score_offsets[i + 1]),
+                Scores(columns, score_offsets[i], score_offsets[i + 1]),
+                tid,
+            )
+            for i, (tid, date_, location, is_ranked) in enumerate(zip(tids, dates, locations, ranked))
+        ]
+
+        # A player's rating is the one after their latest tournament, which
+        # its adjustment is the difference to, zero if unranked.
+        reversed_players = columns.player[::-1]
+        _, latest = np.unique(reversed_players, return_index=True)
+        latest = len(reversed_players) - 1 - latest
+        final_ratings = (columns.initial_rating[latest] + columns.adjustment[latest]).tolist()
+
+        def count(white_score: int, black_score: int) -> List[int]:
+            counts = np.bincount(white[score == white_score], minlength=len(players))
+            counts += np.bincount(black[score == black_score], minlength=len(players))
+            return [int(c) for c in counts.tolist()]
+
+        ratings: DefaultDict[str, int] = defaultdict(lambda: STARTING_RATING)
+        total_scores: DefaultDict[str, TotalScore] = defaultdict(TotalScore)
+        for player, rating, wins, draws, losses in zip(players, final_ratings, count(2, 0), count(1, 1), count(0, 2)):
+            ratings[player] = rating
+            total_scores[player].wins = wins
+            total_scores[player].draws = draws
+            total_scores[player].losses = losses
+
+        return ratings, tournaments, total_scores, table
+
+    def _save_checkpoints(self, tournaments: List[Tournament]) -> None:
+        """
+        Mark the tournaments as replayed and save their scores, read straight
+        from the columns the scores of replayed tournaments share.
+        """
+        self.connection.executemany(
+            'INSERT INTO checkpoints (tid) VALUES (?)',
+            ((tournament.tid,) for tournament in tournaments),
+        )
+        self.connection.executemany(
+            'INSERT INTO scores (tid, seq, pid, initial_rating, games_played, actual, expected, adjustment) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (
+                (tournament.tid, seq, *row)
+                for tournament in tournaments
+                for seq, row in enumerate(self._score_rows(tournament))
+            ),
+        )
+
+    def _score_rows(self, tournament: Tournament) -> Iterable[Tuple[int, int, int, int, float, int]]:
+        if isinstance(tournament.scores, Scores):
+            columns, start, stop = tournament.scores.columns, tournament.scores.start, tournament.scores.stop
+            return zip(
+                [self.player_id(columns.players[player]) for player in columns.player[start:stop].tolist()],
+                columns.initial_rating[start:stop].tolist(),
+                columns.games_played[start:stop].tolist(),
+                columns.actual[start:stop].tolist(),
+                columns.expected[start:stop].tolist(),
+                columns.adjustment[start:stop].tolist(),
+            )
+        return (
+            (
+                self.player_id(player),
+                tournament.initial_ratings[player],
+                score.games_played,
+                score.actual,
+                score.expected,
+                score.adjustment,
+            )
+            for player, score in tournament.scores.items()
+        )
+
+    def replay_ratings(self) -> Tuple[Dict[str, int], List[Tournament], Dict[str, TotalScore]]:
+        """
+        Same as szachy.chess.compute_ratings, but resumes from the last
+        checkpoint and only replays the tournaments added or changed since.
+        """
+        with self.connection:
+            row = self.connection.execute('''
+                SELECT t.tid
+                FROM tournaments AS t
+                WHERE NOT EXISTS (SELECT 1 FROM checkpoints AS c WHERE c.tid = t.tid)
+                  AND EXISTS (SELECT 1 FROM games AS g WHERE g.tid = t.tid)
+                ORDER BY t.date, t.tid
+                LIMIT 1
+            ''').fetchone()
+            if row is not None:
+                self._invalidate_from(row[0])
+
+            ratings, tournaments, total_scores, table = self._load_checkpoint()
+
+            pending = [*self._iter_tournaments(checkpointed=False)]
+            replayed = [
+                replace(tournament, tid=tid)
+                for (tid, _), tournament in zip(pending, replay_tournaments([data for _, data in pending], ratings, total_scores, table))
+            ]
+            self._save_checkpoints(replayed)
+            tournaments += replayed
+            table.compact()
+
+        return ratings, tournaments, total_scores
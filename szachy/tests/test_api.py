@@ -0,0 +1,34 @@
+from szachy.api import page, player_records, ranking_records
+from szachy.chess import compute_ratings
+from szachy.database import TOURNAMENTS
+from szachy.timeline import Timelines
+
+
+def test_page() -> None:
+    keys = [2, 3, 5, 8, 13]
+    assert page(keys, None, None) == (range(0, 5), None)
+    assert page(keys, None, 2) == (range(0, 2), 3)
+    assert page(keys, 3, 2) == (range(2, 4), 8)
+    assert page(keys, 4, 2) == (range(2, 4), 8)
+    assert page(keys, 8, 2) == (range(4, 5), None)
+    assert page(keys, 13, 2) == (range(5, 5), None)
+
+
+def test_records() -> None:
+    ratings, tournaments, total_scores = compute_ratings(TOURNAMENTS)
+
+    ranking = ranking_records(ratings, total_scores, lambda player: total_scores[player].games_played >= 10)
+    assert len(ranking) == len(ratings)
+    assert ranking[0]['rank'] == 1
+    assert ranking[-1]['rank'] is None
+    assert all(record['deviation'] is None for record in ranking)
+
+    # Everyone established, no one, or no players at all.
+    assert all(record['rank'] is not None for record in ranking_records(ratings, total_scores, lambda player: True))
+    assert all(record['rank'] is None for record in ranking_records(ratings, total_scores, lambda player: False))
+    assert ranking_records({}, {}, lambda player: True) == []
+
+    player = ranking[0]['player']
+    history = [*player_records(Timelines(tournaments).events(player), tournaments)]
+    assert sum(len(record['gids']) for record in history) == total_scores[player].games_played
+    assert history[-1]['rating_after'] == ratings[player]
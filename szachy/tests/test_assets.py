@@ -0,0 +1,48 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from szachy.assets import MANIFEST, STYLESHEET, Assets, build
+
+
+def test_built_assets(tmp_path: Path) -> None:
+    manifest = build(str(tmp_path))
+    assets = Assets('/szachy', str(tmp_path))
+
+    assert assets.built
+    stylesheet = manifest['files'][STYLESHEET]
+    assert assets.url(STYLESHEET) == f'/szachy/assets/{stylesheet}'
+    assert (tmp_path / f'{stylesheet}.gz').exists()
+
+    # The stylesheet refers to the other built files relative to itself.
+    css = (tmp_path / stylesheet).read_text()
+    font = manifest['files']['Roboto-Medium.ttf']
+    assert f'url("{font}")' in css and assets.path(font) == str(tmp_path / font)
+    assert '/static/' not in css
+
+
+def test_stale_or_missing_build(tmp_path: Path) -> None:
+    assets = Assets('', str(tmp_path))
+    assert not assets.built
+    assert assets.url(STYLESHEET) == '/style.css'
+    assert assets.url('riczart.jpg') == '/static/riczart.jpg' and assets.srcset('riczart.jpg') == ''
+
+    manifest = build(str(tmp_path))
+    manifest['sources'][f'templates/{STYLESHEET}'] = '0' * 64
+    (tmp_path / MANIFEST).write_text(json.dumps(manifest))
+    assert not Assets('', str(tmp_path)).built
+
+
+def test_build_replaces_only_builds(tmp_path: Path) -> None:
+    output = tmp_path / 'build'
+    first = build(str(output))
+    second = build(str(output))
+    assert first == second and (output / MANIFEST).exists()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['build']
+
+    (tmp_path / 'notes.txt').write_text('keep')
+    with pytest.raises(FileExistsError):
+        build(str(tmp_path))
+    assert (tmp_path / 'notes.txt').read_text() == 'keep'
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['build', 'notes.txt']
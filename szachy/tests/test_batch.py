@@ -0,0 +1,38 @@
+from szachy.batch import compute_ratings_batch, encode_history, replay_batch
+from szachy.bench import synthetic_tournaments
+from szachy.chess import compute_ratings
+from szachy.database import TOURNAMENTS
+
+
+def test_batch_matches_scalar_replay() -> None:
+    for tournaments in [TOURNAMENTS, synthetic_tournaments(40, 20000, games_per_tournament=13), synthetic_tournaments(8, 3000, games_per_tournament=5)]:
+        ratings, scored_tournaments, total_scores = compute_ratings(tournaments)
+        batch_ratings, batch_tournaments, batch_total_scores = compute_ratings_batch(tournaments)
+
+        assert [*batch_ratings.items()] == [*ratings.items()]
+        assert batch_tournaments == scored_tournaments
+        assert [
+            (player, score.wins, score.draws, score.losses)
+            for player, score in batch_total_scores.items()
+        ] == [
+            (player, score.wins, score.draws, score.losses)
+            for player, score in total_scores.items()
+        ]
+        for tournament, expected_tournament in zip(batch_tournaments, scored_tournaments):
+            assert [*tournament.initial_ratings.items()] == [*expected_tournament.initial_ratings.items()]
+            assert [
+                (player, score.games_played, score.actual, score.expected, score.adjustment)
+                for player, score in tournament.scores.items()
+            ] == [
+                (player, score.games_played, score.actual, score.expected, score.adjustment)
+                for player, score in expected_tournament.scores.items()
+            ]
+
+
+def test_batch_pre_game_ratings() -> None:
+    ratings, tournaments, _ = compute_ratings(TOURNAMENTS)
+    result = replay_batch(encode_history(TOURNAMENTS))
+
+    games = [game for tournament in tournaments for game in tournament.games]
+    assert result.white_ratings.tolist() == [game.white_rating for game in games]
+    assert result.black_ratings.tolist() == [game.black_rating for game in games]
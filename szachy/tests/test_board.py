@@ -0,0 +1,64 @@
+import pytest
+
+from szachy.board import START_FEN, Board, IllegalMoveError, perft, replay
+from szachy.types import GameData, Termination
+from szachy.validate import validate_game
+
+KIWIPETE = 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1'
+
+
+def test_perft() -> None:
+    assert [perft(Board(), depth) for depth in range(1, 4)] == [20, 400, 8902]
+    assert [perft(Board(KIWIPETE), depth) for depth in range(1, 3)] == [48, 2039]
+    assert perft(Board('8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1'), 3) == 2812
+
+
+def test_fen_round_trip() -> None:
+    assert Board().fen() == START_FEN
+    assert Board(KIWIPETE).fen() == KIWIPETE
+    assert replay('1. e4').fen() == 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1'
+
+    with pytest.raises(ValueError):
+        Board('rnbqkbnr/pppppppp/8/8 w KQkq - 0 1')
+
+
+def test_push_pop() -> None:
+    board = Board(KIWIPETE)
+    for move in board.legal_moves():
+        board.push(move)
+        assert board.hash == Board(board.fen()).hash
+        board.pop()
+        assert board.fen() == KIWIPETE
+        assert board.hash == Board(KIWIPETE).hash
+
+
+def test_zobrist_transpositions() -> None:
+    assert replay('1. Nf3 Nf6 2. Nc3 Nc6').hash == replay('1. Nc3 Nc6 2. Nf3 Nf6').hash
+    assert replay('1. e4 e5').hash == Board('rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq e6 0 2').hash
+    assert replay('1. e4 e5').hash != replay('1. e4 e5 2. Ke2 Ke7 3. Ke1 Ke8').hash
+
+
+def test_replay() -> None:
+    assert replay("1. f3 e5 2. g4 Qh4#").is_checkmate()
+    assert replay('1. e4 e5 2. Nf3 Nc6 3. Bc4 Nf6 4. O-O Be7 5. Re1 O-O').fen().startswith(
+        'r1bq1rk1/ppppbppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQR1K1 w'
+    )
+    assert replay('1. e4 a6 2. e5 d5 3. exd6').fen().startswith('rnbqkbnr/1pp1pppp/p2P4/8')
+    assert Board('7k/5Q2/6K1/8/8/8/8/8 b - - 0 1').is_stalemate()
+    assert replay('1... b1=Q+', Board('8/8/8/8/8/8/1p6/5K1k b - - 0 1')).is_check()
+
+    with pytest.raises(IllegalMoveError, match='ply 3'):
+        replay('1. e4 e5 2. Ke3')
+    with pytest.raises(IllegalMoveError, match='ambiguous'):
+        replay('1. Ne4', Board('k7/8/8/8/8/2N3N1/8/K7 w - - 0 1'))
+
+
+def test_validate_game() -> None:
+    def game(pgn: str, score: int, termination: Termination) -> GameData:
+        return GameData(1, 'A', 'B', pgn, score, termination, None)
+
+    assert validate_game(game('1. f3 e5 2. g4 Qh4# 0-1', 0, Termination.CHECKMATE)) is None
+    assert validate_game(game('1. f3 e5 2. g4 Qh4# 0-1', 0, Termination.RESIGNATION)) is not None
+    assert validate_game(game('1. f3 e5 2. g4 Qh4# 0-1', 2, Termination.CHECKMATE)) is not None
+    assert validate_game(game('1. e4 e5 1-0', 2, Termination.CHECKMATE)) is not None
+    assert validate_game(game('1. e4 e5 1-0', 2, Termination.RESIGNATION)) is None
@@ -0,0 +1,61 @@
+import asyncio
+import gzip
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from szachy.cache import ResponseCache, choose_encoding
+
+
+def test_choose_encoding() -> None:
+    bodies = {'identity': b'x' * 100, 'gzip': b'x' * 20, 'br': b'x' * 10}
+
+    assert choose_encoding('', bodies) == 'identity'
+    assert choose_encoding('gzip', bodies) == 'gzip'
+    assert choose_encoding('gzip, deflate, br', bodies) == 'br'
+    assert choose_encoding('gzip, br;q=0', bodies) == 'gzip'
+    assert choose_encoding('*', bodies) == 'br'
+    assert choose_encoding('br', {'identity': b'x', 'gzip': b'x'}) == 'identity'
+
+
+def test_etags_and_not_modified() -> None:
+    cache = ResponseCache()
+    body = 'zażółć gęślą jaźń ' * 100
+
+    async def handler(request: web.Request) -> web.Response:
+        return cache.respond(request, 1, 'page', 'text/html', lambda: body)
+
+    async def search(request: web.Request) -> web.StreamResponse:
+        return await cache.stream(request, 1, ('search', request.query['q']), 'text/html', lambda: [body], cache=False)
+
+    app = web.Application()
+    app.router.add_get('/', handler)
+    app.router.add_get('/search', search)
+
+    async def run() -> None:
+        async with TestClient(TestServer(app)) as client:
+            identity = await client.get('/', headers={'Accept-Encoding': 'identity'})
+            assert await identity.text() == body
+            compressed = await client.get('/', headers={'Accept-Encoding': 'gzip'}, auto_decompress=False)
+            assert compressed.headers['Content-Encoding'] == 'gzip'
+            assert gzip.decompress(await compressed.read()).decode() == body
+
+            # Different bodies, different strong validators.
+            assert identity.headers['ETag'] != compressed.headers['ETag']
+            assert compressed.headers['ETag'] == identity.headers['ETag'][:-1] + '-gzip"'
+
+            for etag in (identity.headers['ETag'], compressed.headers['ETag'], '*'):
+                response = await client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+                assert response.status == 304
+                assert response.headers['ETag'] == compressed.headers['ETag']
+
+            response = await client.get('/', headers={'If-None-Match': '"stale"'})
+            assert response.status == 200
+
+            # Pages for user input are only streamed.
+            response = await client.get('/search', params={'q': 'e4'})
+            assert await response.text() == body
+            assert 'ETag' not in response.headers
+            assert cache._lookup(1, ('search', 'e4')) is None
+
+    asyncio.run(run())
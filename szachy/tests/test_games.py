@@ -0,0 +1,42 @@
+import numpy as np
+
+from szachy.chess import compute_ratings
+from szachy.database import TOURNAMENTS
+from szachy.games import GameTable, player_column
+from szachy.types import Termination
+
+
+def test_game_table() -> None:
+    table = GameTable(capacity=1)
+    table.append(7, 'Anna', 400, 'Bartek', 500, '1. e4 e5 1/2-1/2', 1, Termination.DRAW, None)
+    table.append(8, 'Bartek', 510, 'Żaneta', 390, '1. d4 1-0', 2, Termination.RESIGNATION, 123456789012)
+    table.compact()
+    table.append(9, 'Żaneta', 380, 'Anna', 405, '1. c4 0-1', 0, Termination.TIMEOUT, None)
+
+    games = table.games()
+    assert len(games) == 3 and table.players == ['Anna', 'Bartek', 'Żaneta']
+    second = games[1]
+    assert (second.gid, second.white, second.white_rating, second.black, second.black_rating) == (8, 'Bartek', 510, 'Żaneta', 390)
+    assert (second.pgn, second.score, second.termination, second.chess_com_embed) == ('1. d4 1-0', 2, Termination.RESIGNATION, 123456789012)
+    assert games[0].chess_com_embed is None
+    assert [game.gid for game in games[1:]] == [8, 9] and games[-1].pgn == '1. c4 0-1'
+
+    rated = table.with_ratings(np.array([1, 2, 3]), np.array([4, 5, 6]))
+    assert [(game.white_rating, game.black_rating) for game in rated.games()] == [(1, 4), (2, 5), (3, 6)]
+    assert [game.pgn for game in rated.games()] == [game.pgn for game in games]
+    assert games[0] == table.games()[0] and games[0] != rated.games()[0]
+    rated = table.with_ratings(np.array([40000, 2, 3]), np.array([4, 5, -40000]))
+    assert (rated.games()[0].white_rating, rated.games()[2].black_rating) == (40000, -40000)
+
+    ids = {'Żaneta': 0, 'Anna': 1}
+    assert player_column([games[:1], games[2:]], 'white', ids).tolist() == [1, 0]
+    assert player_column([games], 'black', ids).tolist() == [-1, 0, 1]
+
+
+def test_replayed_games() -> None:
+    _, tournaments, _ = compute_ratings(TOURNAMENTS)
+    for data, tournament in zip(TOURNAMENTS, tournaments):
+        assert [(game.gid, game.white, game.black, game.pgn, game.score, game.termination, game.chess_com_embed) for game in tournament.games] == [
+            (game.gid, game.white, game.black, game.pgn, game.score, game.termination, game.chess_com_embed) for game in data.games
+        ]
+        assert all(game.white_rating == tournament.initial_ratings[game.white] for game in tournament.games)
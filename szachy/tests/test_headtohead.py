@@ -0,0 +1,40 @@
+from itertools import combinations
+
+from szachy.chess import compute_ratings
+from szachy.database import TOURNAMENTS
+from szachy.headtohead import HeadToHeadIndex
+
+
+def test_head_to_head() -> None:
+    ratings, tournaments, total_scores = compute_ratings(TOURNAMENTS)
+    index = HeadToHeadIndex(tournaments)
+
+    for player, opponent in combinations(ratings, 2):
+        games = [
+            (tid, game)
+            for tid, tournament in enumerate(tournaments)
+            for game in tournament.games
+            if {game.white, game.black} == {player, opponent}
+        ]
+        meetings = index.meetings(player, opponent)
+        assert [meeting.gid for meeting in meetings] == [game.gid for _, game in games]
+        assert [(meeting.tid, meeting.white_rating, meeting.black_rating) for meeting in meetings] == [
+            (tid, game.white_rating, game.black_rating) for tid, game in games
+        ]
+        assert index.meetings(opponent, player) == meetings
+
+        record = index.head_to_head(player, opponent)
+        scores = [game.score if game.white == player else 2 - game.score for _, game in games]
+        assert (record.games, record.wins, record.draws, record.losses) == (len(games), scores.count(2), scores.count(1), scores.count(0))
+        assert record.white_games == sum(game.white == player for _, game in games)
+
+        reverse = index.head_to_head(opponent, player)
+        assert (reverse.wins, reverse.losses, reverse.white_games) == (record.losses, record.wins, record.black_games)
+
+    for player in ratings:
+        opponents = index.opponents(player)
+        assert sum(record.games for record in opponents) == total_scores[player].games_played
+        assert opponents == sorted(opponents, key=lambda record: -record.games)
+        assert all(record == index.head_to_head(player, record.opponent) for record in opponents)
+
+    assert 'Nikt' not in index
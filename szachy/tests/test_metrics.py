@@ -0,0 +1,36 @@
+import os
+import tempfile
+
+from szachy.metrics import Metrics, SlowRequestProfiler
+
+
+def test_prometheus() -> None:
+    metrics = Metrics()
+    metrics.observe_request('/gra/{gid}', 'GET', 200, 0.003)
+    metrics.observe_request('/gra/{gid}', 'GET', 200, 0.3)
+    with metrics.time('view', 'Quoted "view"'):
+        pass
+
+    text = metrics.prometheus()
+    assert 'szachy_request_duration_seconds_bucket{route="/gra/{gid}",method="GET",status="200",le="0.0025"} 0' in text
+    assert 'szachy_request_duration_seconds_bucket{route="/gra/{gid}",method="GET",status="200",le="0.005"} 1' in text
+    assert 'szachy_request_duration_seconds_bucket{route="/gra/{gid}",method="GET",status="200",le="+Inf"} 2' in text
+    assert 'szachy_request_duration_seconds_count{route="/gra/{gid}",method="GET",status="200"} 2' in text
+    assert 'szachy_phase_duration_seconds_count{phase="view",name="Quoted \\"view\\""} 1' in text
+
+
+def test_slow_request_profiler() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'slow.folded')
+        profiler = SlowRequestProfiler(path, threshold=1.0)
+        profiler.samples.extend([(0.5, ('a', 'b')), (1.5, ('a', 'b')), (2.0, ('a', 'c')), (3.5, ('a', 'b'))])
+
+        profiler.request_finished('GET /', 1.0, 1.5)
+        profiler.write_slow_requests()
+        assert not os.path.exists(path)
+
+        profiler.request_finished('GET /', 1.0, 3.0)
+        assert not os.path.exists(path)
+        profiler.write_slow_requests()
+        with open(path) as file:
+            assert sorted(file) == ['GET /;a;b 1\n', 'GET /;a;c 1\n']
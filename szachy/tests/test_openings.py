@@ -0,0 +1,40 @@
+from datetime import date
+
+from szachy.database import TOURNAMENTS
+from szachy.openings import explore, update_opening_tree
+from szachy.store import Store
+from szachy.types import TournamentData
+
+
+def _root_games(store: Store) -> int:
+    _, moves = explore(store, [])
+    return sum(move.games for move in moves)
+
+
+def test_opening_tree() -> None:
+    store = Store(':memory:')
+    store.replay_ratings()
+    assert update_opening_tree(store) == 56
+    assert update_opening_tree(store) == 0
+    assert _root_games(store) == 56
+
+    _, moves = explore(store, ['e4'])
+    (e4,) = [move for move in explore(store, [])[1] if move.san == 'e4']
+    assert sum(move.games for move in moves) == e4.games
+    assert e4.white_wins + e4.draws + e4.black_wins == e4.games
+    assert e4.mean_rating > 0
+
+
+def test_opening_tree_rebuilt_after_replace() -> None:
+    store = Store(':memory:')
+    store.replay_ratings()
+    update_opening_tree(store)
+
+    tid = store.find_tournament(date(2022, 11, 20), 'Rezydencja J. Szachego')
+    assert tid is not None
+    corrected = TOURNAMENTS[2].games[:-1]
+    store.replace_tournament(tid, TournamentData(date(2022, 11, 20), 'Rezydencja J. Szachego', corrected))
+    store.replay_ratings()
+
+    assert update_opening_tree(store) == 55
+    assert _root_games(store) == 55
@@ -0,0 +1,80 @@
+from itertools import combinations
+from typing import Dict, FrozenSet, Tuple
+import random
+
+import pytest
+
+from szachy.chess import compute_ratings
+from szachy.database import TOURNAMENTS
+from szachy.matching import max_weight_matching
+from szachy.pairing import main, pair_rounds, round_robin
+
+
+def _brute_force_weight(n: int, weights: Dict[Tuple[int, int], int]) -> int:
+    def best(free: FrozenSet[int]) -> int:
+        if not free:
+            return 0
+        i = min(free)
+        rest = free - {i}
+        result = best(rest)
+        for j in rest:
+            if (i, j) in weights:
+                result = max(result, weights[i, j] + best(rest - {j}))
+        return result
+
+    return best(frozenset(range(n)))
+
+
+def test_max_weight_matching() -> None:
+    rng = random.Random(0)
+    for _ in range(200):
+        n = rng.randint(2, 8)
+        weights = {(i, j): rng.randint(-5, 20) for i, j in combinations(range(n), 2) if rng.random() < 0.6}
+        if not weights:
+            continue
+        mate = max_weight_matching([(i, j, w) for (i, j), w in weights.items()])
+
+        assert all(mate[mate[i]] == i for i in range(len(mate)) if mate[i] != -1)
+        total = sum(weights[i, mate[i]] for i in range(len(mate)) if i < mate[i])
+        assert total == _brute_force_weight(n, weights)
+
+
+def test_round_robin() -> None:
+    players = [f'Gracz {i}' for i in range(7)]
+    rounds = round_robin(players, {})
+
+    assert len(rounds) == 7
+    games = [(pairing.white, pairing.black) for round_ in rounds for pairing in round_.pairings]
+    assert len(games) == 21
+    assert {frozenset(game) for game in games} == {frozenset(pair) for pair in combinations(players, 2)}
+    assert sorted(round_.bye for round_ in rounds if round_.bye is not None) == players
+    for player in players:
+        white = sum(game[0] == player for game in games)
+        black = sum(game[1] == player for game in games)
+        assert abs(white - black) <= 1
+
+
+def test_pair_rounds() -> None:
+    ratings, tournaments, _ = compute_ratings(TOURNAMENTS)
+    players = sorted(ratings)[:7] + ['Nowy gracz']
+    rounds = pair_rounds(players[:-1], ratings, tournaments, rounds=3)
+
+    byes = [round_.bye for round_ in rounds]
+    assert None not in byes and len(set(byes)) == 3
+    planned = set()
+    for round_ in rounds:
+        assert round_.bye is not None
+        paired = [player for pairing in round_.pairings for player in (pairing.white, pairing.black)]
+        assert sorted(paired + [round_.bye]) == sorted(players[:-1])
+        for pairing in round_.pairings:
+            assert frozenset((pairing.white, pairing.black)) not in planned
+            planned.add(frozenset((pairing.white, pairing.black)))
+
+    [round_] = pair_rounds(players, ratings, tournaments)
+    assert round_.bye is None and len(round_.pairings) == 4
+
+
+def test_main_ignores_repeated_players(capsys: pytest.CaptureFixture[str]) -> None:
+    main(['--database', ':memory:', '--round-robin', 'Anna', 'Bartek', 'Anna'])
+
+    assert capsys.readouterr().out.splitlines()[1:] == ['  Anna - Bartek (50%)']
@@ -0,0 +1,69 @@
+from datetime import date
+
+from szachy.importer import import_pgn
+from szachy.pgn import parse_pgn
+from szachy.store import Store
+from szachy.types import Termination
+
+PGN = '''\ufeff[Event "Liga"]
+[Site "Wałbrzych"]
+[Date "2023.03.05"]
+[White "Riczart Czaczfejf"]
+[Black "Pion Forward"]
+[Result "1-0"]
+
+1. e4 {[%clk 0:09:58]} e5 2. Qh5 (2. Nf3 Nc6) Nc6 3. Bc4 Nf6?? $4
+4. Qxf7# 1-0
+
+[Event "Liga"]
+[Site "Wałbrzych"]
+[Date "2023.03.05"]
+[White "Pion Forward"]
+[Black "Riczart Czaczfejf"]
+[Result "1/2-1/2"]
+[Termination "Game drawn by agreement"]
+
+1. d4 d5 1/2-1/2
+
+[Event "Liga"]
+[Date "????.??.??"]
+[White "A"]
+[Black "B"]
+[Result "*"]
+
+1. e4 *
+'''
+
+
+def test_parse_pgn() -> None:
+    first, second, third = parse_pgn(PGN.splitlines())
+
+    assert first.white == 'Riczart Czaczfejf'
+    assert first.movetext == '1. e4 e5 2. Qh5 Nc6 3. Bc4 Nf6?? 4. Qxf7# 1-0'
+    assert first.score == 2
+    assert first.termination == Termination.CHECKMATE
+    assert first.date == date(2023, 3, 5)
+
+    assert second.score == 1
+    assert second.termination == Termination.DRAW
+
+    assert third.score is None
+    assert third.date is None
+
+
+def test_import_pgn() -> None:
+    store = Store(':memory:')
+    stats = import_pgn(store, PGN.splitlines(), batch_size=1)
+    assert (stats.imported, stats.skipped) == (2, 1)
+
+    tournament = [*store.iter_tournaments()][-1]
+    assert tournament.location == 'Wałbrzych'
+    assert [game.gid for game in tournament.games] == [57, 58]
+    assert [game.score for game in tournament.games] == [2, 1]
+
+    # Importing the same file again adds nothing.
+    revision = store.revision()
+    stats = import_pgn(store, PGN.splitlines())
+    assert (stats.imported, stats.skipped, stats.duplicates) == (0, 1, 2)
+    assert [*store.iter_tournaments()][-1] == tournament
+    assert store.revision() == revision
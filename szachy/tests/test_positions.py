@@ -0,0 +1,31 @@
+from szachy.board import START_FEN
+from szachy.importer import import_pgn
+from szachy.positions import find_games, update_position_index
+from szachy.store import Store
+
+AFTER_E4 = 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1'
+
+
+def test_find_games() -> None:
+    store = Store(':memory:')
+    assert update_position_index(store) == 56
+    assert update_position_index(store) == 0
+
+    result = find_games(store, START_FEN)
+    assert result.total == 56
+    assert all(match.ply == 0 for match in result.games)
+
+    result = find_games(store, AFTER_E4)
+    assert 0 < result.total < 56
+    assert all(match.ply == 1 for match in result.games)
+    assert sum(result.scores.values()) == len(result.games)
+
+
+def test_index_updated_after_import() -> None:
+    store = Store(':memory:')
+    update_position_index(store)
+    before = find_games(store, AFTER_E4).total
+
+    import_pgn(store, ['[Date "2023.03.05"]', '[Site "X"]', '[Result "1-0"]', '1. e4 e5 1-0'])
+    assert update_position_index(store) == 1
+    assert find_games(store, AFTER_E4).total == before + 1
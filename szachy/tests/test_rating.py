@@ -0,0 +1,49 @@
+import numpy as np
+
+from szachy.chess import compute_ratings
+from szachy.database import TOURNAMENTS
+from szachy.rating import GLICKO_SCALE, INITIAL_DEVIATION, EloEngine, Glicko2Engine, _rating_period
+from szachy.timeline import Timelines
+
+
+def test_rating_period() -> None:
+    # The example from Glickman's description of Glicko-2: a 1500 player with
+    # a deviation of 200 beats a 1400 one and loses to 1550 and 1700 ones.
+    mu = (np.array([1500.0, 1400.0, 1550.0, 1700.0]) - 1500) / GLICKO_SCALE
+    phi = np.array([200.0, 30.0, 100.0, 300.0]) / GLICKO_SCALE
+    sigma = np.full(4, 0.06)
+    me = np.array([0, 0, 0, 1, 2, 3])
+    opponent = np.array([1, 2, 3, 0, 0, 0])
+    score = np.array([1.0, 0.0, 0.0, 0.0, 1.0, 1.0])
+
+    new_mu, new_phi, new_sigma, _ = _rating_period(mu, phi, sigma, me, opponent, score, 0.5)
+    assert round(1500 + GLICKO_SCALE * new_mu[0], 2) == 1464.05
+    assert round(GLICKO_SCALE * new_phi[0], 2) == 151.52
+    assert round(new_sigma[0], 5) == 0.06
+
+
+def test_engines() -> None:
+    ratings, tournaments, total_scores = compute_ratings(TOURNAMENTS)
+
+    elo = EloEngine().rate(ratings, tournaments)
+    assert elo.ratings is ratings and elo.tournaments is tournaments and not elo.deviations
+
+    glicko = Glicko2Engine().rate(ratings, tournaments)
+    assert glicko.ratings.keys() == ratings.keys() == glicko.deviations.keys()
+    assert all(0 < deviation < INITIAL_DEVIATION for deviation in glicko.deviations.values())
+
+    # Ratings chain through the tournaments like Elo ones.
+    timelines = Timelines(glicko.tournaments)
+    for player, rating in glicko.ratings.items():
+        events = timelines.events(player)
+        assert events[-1].rating_after == rating
+        assert all(a.rating_after == b.rating_before for a, b in zip(events, events[1:]))
+    for tournament, rated in zip(tournaments, glicko.tournaments):
+        assert [game.gid for game in tournament.games] == [game.gid for game in rated.games]
+        if not rated.ranked:
+            assert all(score.adjustment == 0 for score in rated.scores.values())
+
+    # The more games, the lower the deviation, for otherwise similar players.
+    most_active = max(total_scores, key=lambda player: total_scores[player].games_played)
+    least_active = min(total_scores, key=lambda player: total_scores[player].games_played)
+    assert glicko.deviations[most_active] < glicko.deviations[least_active]
@@ -0,0 +1,67 @@
+from collections import defaultdict
+from itertools import product
+
+import numpy as np
+
+from szachy.chess import K_FACTOR, MINIMUM_RATING, Score, elo_adjust_rating, elo_expected_score
+from szachy.simulation import _rank_counts, simulate
+
+
+def test_simulate() -> None:
+    ratings = {'Anna': 900, 'Bartek': 400, 'Cezary': 110, 'Dorota': 500}
+    games = [('Anna', 'Cezary'), ('Cezary', 'Bartek'), ('Bartek', 'Anna')]
+    draw_rate = 0.3
+
+    # Exact distribution of ratings after the tournament, by enumerating all
+    # results and replaying them as replay_tournament would.
+    exact: defaultdict[str, defaultdict[int, float]] = defaultdict(lambda: defaultdict(float))
+    for results in product((0, 1, 2), repeat=len(games)):
+        scores: defaultdict[str, Score] = defaultdict(Score)
+        probability = 1.0
+        for (white, black), result in zip(games, results):
+            expected = elo_expected_score(ratings[white], ratings[black])
+            draw = draw_rate * 2 * min(expected / 2, 1 - expected / 2)
+            probability *= [1 - expected / 2 - draw / 2, draw, expected / 2 - draw / 2][result]
+            scores[white].actual += result
+            scores[black].actual += 2 - result
+            scores[white].expected += expected
+            scores[black].expected += 2 - expected
+        for player, score in scores.items():
+            exact[player][elo_adjust_rating(ratings[player], score)] += probability
+
+    simulation = simulate(games, ratings, 200000, draw_rate, seed=0)
+
+    assert simulation.participants == ['Anna', 'Cezary', 'Bartek']
+    for player in simulation.participants:
+        sampled = simulation.rating_probabilities(player, ratings[player])
+        assert set(sampled) <= set(exact[player])
+        for rating, probability in exact[player].items():
+            assert abs(sampled.get(rating, 0) - probability) < 0.01
+        assert min(sampled) >= MINIMUM_RATING
+        assert max(sampled) - ratings[player] <= 2 * K_FACTOR
+
+    assert simulation.rank_probabilities('Anna') == {1: 1.0}
+    assert 'Dorota' not in simulation.participants
+    assert abs(sum(simulation.rank_probabilities('Dorota').values()) - 1) < 1e-9
+
+    parallel = simulate(games, ratings, 200000, draw_rate, seed=0, processes=2)
+    assert (parallel.rank_counts == simulation.rank_counts).all()
+    assert (parallel.adjustment_counts == simulation.adjustment_counts).all()
+
+
+def test_rank_counts() -> None:
+    # Few distinct ratings, so that participants tie with each other and with
+    # the others.
+    rng = np.random.default_rng(0)
+    ratings = rng.integers(100, 110, 30)
+    participants = rng.permutation(30)[:8]
+    adjusted = rng.integers(98, 112, (500, 8))
+
+    expected = np.zeros((30, 30), dtype=np.int64)
+    for simulation in adjusted:
+        final = ratings.copy()
+        final[participants] = simulation
+        for player, rating in enumerate(final):
+            expected[player, len(set(final[final > rating]))] += 1
+
+    assert (_rank_counts(ratings, participants, adjusted) == expected).all()
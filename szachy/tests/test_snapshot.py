@@ -0,0 +1,100 @@
+from pathlib import Path
+
+import pytest
+
+from szachy.chess import compute_ratings
+from szachy.database import TOURNAMENTS
+from szachy.snapshot import HEADER, load_snapshot, main, replay_with_snapshot, write_snapshot
+from szachy.store import Store
+from szachy.headtohead import HeadToHeadIndex
+from szachy.timeline import Timelines
+
+
+def test_snapshot_round_trip(tmp_path: Path) -> None:
+    path = str(tmp_path / 'szachy.snapshot')
+    ratings, tournaments, total_scores = compute_ratings(TOURNAMENTS)
+    write_snapshot(path, 7, 3, ratings, tournaments, total_scores)
+
+    snapshot = load_snapshot(path, 7, 3)
+    assert snapshot is not None
+    (loaded_ratings, loaded_tournaments, loaded_total_scores), indexes = snapshot
+
+    assert [*loaded_ratings.items()] == [*ratings.items()]
+    assert loaded_tournaments == tournaments
+    for loaded, tournament in zip(loaded_tournaments, tournaments):
+        assert loaded.initial_ratings == tournament.initial_ratings
+        assert [
+            (score.games_played, score.actual, score.expected, score.adjustment) for score in loaded.scores.values()
+        ] == [
+            (score.games_played, score.actual, score.expected, score.adjustment) for score in tournament.scores.values()
+        ]
+    assert {
+        player: (score.wins, score.draws, score.losses) for player, score in loaded_total_scores.items()
+    } == {
+        player: (score.wins, score.draws, score.losses) for player, score in total_scores.items() if score.games_played
+    }
+
+    # Built from the snapshot's score columns instead of Score objects, and
+    # mapped from the snapshot as written.
+    timelines, head_to_head = Timelines(tournaments), HeadToHeadIndex(tournaments)
+    for loaded_timelines in (Timelines(loaded_tournaments), indexes.timelines):
+        assert all(loaded_timelines.events(player) == timelines.events(player) for player in ratings)
+    for player in ratings:
+        assert indexes.head_to_head.opponents(player) == head_to_head.opponents(player)
+        for opponent in ratings:
+            if opponent != player:
+                assert indexes.head_to_head.meetings(player, opponent) == head_to_head.meetings(player, opponent)
+
+
+def test_stale_or_corrupt_snapshot(tmp_path: Path) -> None:
+    path = tmp_path / 'szachy.snapshot'
+    assert load_snapshot(str(path), 7, 1) is None
+
+    write_snapshot(str(path), 7, 1, *compute_ratings(TOURNAMENTS))
+    assert load_snapshot(str(path), 7, 1) is not None
+    assert load_snapshot(str(path), 7, 2) is None
+    assert load_snapshot(str(path), 8, 1) is None
+
+    assert load_snapshot(str(tmp_path), 7, 1) is None  # Not readable as a file
+
+    # Only checked when asked to, loading does not read the whole file.
+    data = bytearray(path.read_bytes())
+    data[HEADER.size + len(data) // 2] ^= 1
+    path.write_bytes(bytes(data))
+    assert load_snapshot(str(path), 7, 1, verify=True) is None
+
+
+def test_snapshot_rebuilt_when_stale(tmp_path: Path) -> None:
+    path = str(tmp_path / 'szachy.snapshot')
+    store = Store(':memory:')
+    database_id, revision = store.database_id(), store.revision()
+
+    (ratings, tournaments, _), _ = replay_with_snapshot(store, path, revision)
+    assert load_snapshot(path, database_id, revision) is not None
+    assert load_snapshot(path, database_id, revision + 1) is None
+
+    (ratings, tournaments, _), _ = replay_with_snapshot(store, path, revision + 1)
+    assert load_snapshot(path, database_id, revision + 1) is not None
+    assert tournaments == store.replay_ratings()[1]
+    assert [tournament.tid for tournament in tournaments] == [tournament.tid for tournament in store.replay_ratings()[1]]
+
+    # A recreated database starts over from the same revision.
+    other = Store(':memory:')
+    assert other.database_id() != database_id
+    assert load_snapshot(path, other.database_id(), revision + 1) is None
+
+
+def test_verify(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    database = str(tmp_path / 'szachy.db')
+    Store(database).close()
+    with pytest.raises(SystemExit):
+        main(['--database', database, '--verify'])
+
+    main(['--database', database])
+    main(['--database', database, '--verify'])
+    assert 'is valid' in capsys.readouterr().out
+
+    store = Store(database)
+    assert store.unindexed_games(1) == []
+    assert store.unexplored_games(1) == []
+    store.close()
@@ -0,0 +1,131 @@
+from datetime import date
+from pathlib import Path
+import subprocess
+import sys
+
+from szachy.chess import compute_ratings
+from szachy.database import TOURNAMENTS
+from szachy.store import Store
+from szachy.types import GameData, Termination, TournamentData
+
+
+def test_literals_not_imported() -> None:
+    # Building them is the cost of importing szachy.database, which only the
+    # first opening of a store should pay.
+    code = 'import sys, szachy.store, szachy.web; print("szachy.database" in sys.modules)'
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    assert output == 'False\n'
+
+
+def test_migration_preserves_history() -> None:
+    store = Store(':memory:')
+    assert [*store.iter_tournaments()] == TOURNAMENTS
+
+
+def test_fingerprints_of_older_stores(tmp_path: Path) -> None:
+    database = str(tmp_path / 'szachy.db')
+    store = Store(database)
+    store.connection.execute('DELETE FROM game_fingerprints')
+    store.connection.execute('PRAGMA user_version = 6')
+    store.connection.commit()
+    store.close()
+
+    store = Store(database)
+    tournament = TOURNAMENTS[0]
+    assert store.add_games((tournament.date, tournament.location, True, game) for game in tournament.games) == 0
+
+
+def test_ratings_from_store() -> None:
+    store = Store(':memory:')
+    ratings, tournaments, total_scores = compute_ratings(store.iter_tournaments())
+    expected_ratings, expected_tournaments, _ = compute_ratings(TOURNAMENTS)
+
+    assert ratings == expected_ratings
+    assert [t.games for t in tournaments] == [t.games for t in expected_tournaments]
+
+
+def test_tournaments_ordered_by_date() -> None:
+    store = Store(':memory:')
+    store.add_tournament(TournamentData(
+        date=date(2000, 1, 1),
+        location='Wałbrzych',
+        games=[GameData(1000, 'A', 'B', '1. e4 1-0', 2, Termination.RESIGNATION, None)],
+    ))
+
+    first = next(store.iter_tournaments())
+    assert first.location == 'Wałbrzych'
+    assert first.games[0].white == 'A'
+
+
+def _assert_same_results(store: Store) -> None:
+    ratings, tournaments, total_scores = store.replay_ratings()
+    expected_ratings, expected_tournaments, expected_total_scores = compute_ratings(store.iter_tournaments())
+
+    assert [*ratings.items()] == [*expected_ratings.items()]
+    assert tournaments == expected_tournaments
+    assert [
+        (player, score.wins, score.draws, score.losses)
+        for player, score in total_scores.items()
+    ] == [
+        (player, score.wins, score.draws, score.losses)
+        for player, score in expected_total_scores.items()
+    ]
+    for tournament, expected_tournament in zip(tournaments, expected_tournaments):
+        assert [
+            (player, score.expected, score.adjustment)
+            for player, score in tournament.scores.items()
+        ] == [
+            (player, score.expected, score.adjustment)
+            for player, score in expected_tournament.scores.items()
+        ]
+
+
+def test_incremental_replay_matches_full_replay() -> None:
+    store = Store(':memory:')
+    _assert_same_results(store)
+    _assert_same_results(store)
+
+    store.add_tournament(TournamentData(
+        date=date(2023, 3, 5),
+        location='Wałbrzych',
+        games=[GameData(1000, 'Pion Forward', 'Nowy Gracz', '1. e4 1-0', 2, Termination.RESIGNATION, None)],
+    ))
+    _assert_same_results(store)
+
+    tid = store.find_tournament(date(2022, 11, 20), 'Rezydencja J. Szachego')
+    assert tid is not None
+    corrected = TOURNAMENTS[2].games[:-1]
+    store.replace_tournament(tid, TournamentData(date(2022, 11, 20), 'Rezydencja J. Szachego', corrected))
+    _assert_same_results(store)
+
+
+def test_replay_only_touches_suffix() -> None:
+    store = Store(':memory:')
+    store.replay_ratings()
+
+    store.add_tournament(TournamentData(
+        date=date(2023, 3, 5),
+        location='Wałbrzych',
+        games=[GameData(1000, 'Pion Forward', 'Nowy Gracz', '1. e4 1-0', 2, Termination.RESIGNATION, None)],
+    ))
+    (missing,) = store.connection.execute(
+        'SELECT COUNT(*) FROM tournaments WHERE tid NOT IN (SELECT tid FROM checkpoints)'
+    ).fetchone()
+    assert missing == 1
+
+
+def test_checkpoints_grow_with_games() -> None:
+    store = Store(':memory:')
+    for day in range(1, 21):
+        store.add_tournament(TournamentData(
+            date=date(2023, 4, day),
+            location='Wałbrzych',
+            games=[GameData(1000 + day, f'Gracz {day}', f'Gracz {day + 1}', '1. e4 1-0', 2, Termination.RESIGNATION, None)],
+        ))
+    _assert_same_results(store)
+
+    # Only the players of each tournament, not everyone rated so far.
+    query = 'SELECT COUNT(*) FROM scores UNION ALL SELECT COUNT(*) FROM games'
+    score_rows, games = (count for (count,) in store.connection.execute(query))
+    assert score_rows <= 2 * games
+    assert not store.connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'checkpoint_players'").fetchall()
@@ -0,0 +1,24 @@
+from szachy.chess import compute_ratings
+from szachy.database import TOURNAMENTS
+from szachy.timeline import Timelines
+
+
+def test_timelines() -> None:
+    ratings, tournaments, total_scores = compute_ratings(TOURNAMENTS)
+    timelines = Timelines(tournaments)
+
+    for player, rating in ratings.items():
+        events = timelines.events(player)
+        assert [event.tid for event in events] == [
+            tid for tid, tournament in enumerate(tournaments) if player in tournament.scores
+        ]
+        assert events[-1].rating_after == rating
+        assert all(a.rating_after == b.rating_before for a, b in zip(events, events[1:]))
+        assert sum(len(event.gids) for event in events) == total_scores[player].games_played
+
+        for event in events:
+            tournament = tournaments[event.tid]
+            assert event.date == tournament.date
+            assert event.gids == [game.gid for game in tournament.games if player in (game.white, game.black)]
+
+    assert 'Nikt' not in timelines
@@ -1,4 +1,24 @@
-from szachy.web import _abbreviate_name, _format_score
+from pathlib import Path
+from typing import Awaitable, Callable, Hashable, Iterable
+import asyncio
+import datetime
+import gc
+import gzip
+import os
+import signal
+import tempfile
+import time
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+import pytest
+
+from szachy import web as web_module
+from szachy.bench import LegacyPlannerView, synthetic_results
+from szachy.rating import EloEngine
+from szachy.store import Store
+from szachy.types import GameData, Termination, TournamentData
+from szachy.web import STARTUP_TIMINGS, League, PlannerView, _abbreviate_name, _bytecode_cache, _fork_workers, _format_score, make_app
 
 
 def test_abbreviate_name() -> None:
@@ -17,3 +37,310 @@ def test_format_score() -> None:
     assert _format_score(6) == '3'
     assert _format_score(1237940039285380274899124224) == '618970019642690137449562112'
     assert _format_score(1237940039285380274899124225) == '618970019642690137449562112½'
+
+
+def test_planner_matches_legacy() -> None:
+    ratings, tournaments = synthetic_results(30, 2000, games_per_tournament=7)
+    planner = PlannerView(ratings, tournaments)
+    legacy = LegacyPlannerView(ratings, tournaments)
+
+    assert planner.initials == legacy.initials
+    assert planner.least_played == legacy.least_played
+    assert planner.unpaired_games == legacy.unpaired_games
+    assert [*planner.names_and_probabilities] == [*legacy.names_and_probabilities]
+
+
+def test_tournaments_until() -> None:
+    league = League(Store(':memory:'), EloEngine())
+    dates = [tournament.date for tournament in league.tournaments]
+
+    assert league.tournaments_until(dates[0] - datetime.timedelta(days=1)) == 0
+    assert league.tournaments_until(dates[0]) == dates.count(dates[0])
+    assert league.tournaments_until(dates[-1]) == len(dates)
+
+
+def test_failed_workers_reported() -> None:
+    def fail() -> None:
+        raise OSError('address in use')
+
+    handler = signal.getsignal(signal.SIGTERM)
+    try:
+        assert _fork_workers(lambda: None, 2) == 0
+        assert _fork_workers(fail, 2) == 2
+    finally:
+        signal.signal(signal.SIGTERM, handler)
+        gc.unfreeze()
+
+
+def _exit_on_sigterm() -> None:
+    signal.signal(signal.SIGTERM, lambda signum, frame: os._exit(0))
+
+
+def test_failed_workers_restarted(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(web_module, 'WORKER_GRACE_SECONDS', 0)
+    starts = tmp_path / 'starts'
+
+    def serve() -> None:
+        _exit_on_sigterm()
+        with open(starts, 'a') as file:
+            file.write('start\n')
+        if starts.read_text().count('start') == 1:
+            raise OSError('crashed')
+        # Stop the parent once started again.
+        os.kill(os.getppid(), signal.SIGTERM)
+        time.sleep(60)
+
+    handler = signal.getsignal(signal.SIGTERM)
+    try:
+        assert _fork_workers(serve, 1) == 1
+    finally:
+        signal.signal(signal.SIGTERM, handler)
+        gc.unfreeze()
+    assert starts.read_text().count('start') == 2
+
+
+def test_workers_restarted_after_reload(tmp_path: Path) -> None:
+    starts = tmp_path / 'starts'
+    generation = 0
+    batches = 0
+
+    def serve() -> None:
+        _exit_on_sigterm()
+        with open(starts, 'a') as file:
+            file.write(f'{generation}\n')
+        time.sleep(60)
+
+    def reload_league() -> bool:
+        nonlocal generation
+        started = starts.read_text().split() if starts.exists() else []
+        if generation == 0 and len(started) == 2:
+            generation = 1
+            return True
+        if started.count('1') == 2:
+            os.kill(os.getpid(), signal.SIGTERM)
+        return False
+
+    def index_batch() -> bool:
+        nonlocal batches
+        batches += 1
+        return batches < 3
+
+    handler = signal.getsignal(signal.SIGTERM)
+    try:
+        assert _fork_workers(serve, 2, 0.01, reload_league, index_batch) == 0
+    finally:
+        signal.signal(signal.SIGTERM, handler)
+        gc.unfreeze()
+    # Both workers were replaced once, and the parent indexed until it ran out
+    # of games and again after reloading.
+    assert sorted(starts.read_text().split()) == ['0', '0', '1', '1']
+    assert batches == 4
+
+
+def test_app_outside_package(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # Templates come from the package wherever the server is started, and
+    # their bytecode goes to a temporary directory if the package is read-only.
+    monkeypatch.chdir(tmp_path)
+
+    def read_only(name: str, exist_ok: bool = False) -> None:
+        raise PermissionError(name)
+
+    monkeypatch.setattr(os, 'makedirs', read_only)
+    assert Path(_bytecode_cache().directory).parent == Path(tempfile.gettempdir())
+
+    app = make_app(':memory:')
+    assert {'templates', 'store', 'history', 'lookups'} <= app[STARTUP_TIMINGS].keys()
+    assert all(seconds >= 0 for seconds in app[STARTUP_TIMINGS].values())
+
+    async def test(client: TestClient[web.Request, web.Application]) -> None:
+        response = await client.get('/')
+        assert response.status == 200
+        assert '<html>' in await response.text()
+
+    _serve(app, test)
+    assert [*tmp_path.iterdir()] == []
+
+
+def _serve(app: web.Application, test: Callable[[TestClient[web.Request, web.Application]], Awaitable[None]]) -> None:
+    async def run() -> None:
+        async with TestClient(TestServer(app)) as client:
+            await test(client)
+
+    asyncio.run(run())
+
+
+def test_streamed_pages() -> None:
+    app = make_app(':memory:')
+
+    async def test(client: TestClient[web.Request, web.Application]) -> None:
+        # A miss is sent in chunks as it is rendered, without a validator.
+        player = f"/gracz/{(await (await client.get('/api/ranking')).json())[0]['player']}"
+        response = await client.get(player, headers={'Accept-Encoding': 'identity'})
+        assert response.status == 200
+        assert response.headers['Transfer-Encoding'] == 'chunked'
+        assert 'ETag' not in response.headers and 'Content-Encoding' not in response.headers
+        chunks = [chunk async for chunk, end in response.content.iter_chunks() if chunk]
+        assert len(chunks) > 1
+        streamed = b''.join(chunks)
+
+        # Then it is served from the cache, whole and with an ETag.
+        response = await client.get(player, headers={'Accept-Encoding': 'identity'})
+        assert 'Transfer-Encoding' not in response.headers
+        assert int(response.headers['Content-Length']) == len(streamed)
+        assert await response.read() == streamed
+        response = await client.get(player, headers={'Accept-Encoding': 'identity', 'If-None-Match': response.headers['ETag']})
+        assert response.status == 304
+
+        # Flushing every chunk through the compressor leaves a valid stream.
+        response = await client.get('/debiuty', headers={'Accept-Encoding': 'gzip'}, auto_decompress=False)
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'ETag' not in response.headers
+        compressed = await response.read()
+        response = await client.get('/debiuty', headers={'Accept-Encoding': 'identity'})
+        assert 'ETag' in response.headers
+        assert gzip.decompress(compressed) == await response.read()
+
+    _serve(app, test)
+
+
+def test_links_quote_slashes(tmp_path: Path) -> None:
+    database = str(tmp_path / 'szachy.db')
+    store = Store(database)
+    store.add_tournament(TournamentData(
+        date=datetime.date(2000, 1, 1),
+        location='Szachownica Testowa',
+        games=[GameData(100000, 'Gracz A/B', 'Gracz C', '1. e4 1-0', 2, Termination.RESIGNATION, None)],
+    ))
+    store.close()
+    app = make_app(database)
+
+    async def test(client: TestClient[web.Request, web.Application]) -> None:
+        assert '/gracz/Gracz%20A%2FB"' in await (await client.get('/')).text()
+        response = await client.get('/gracz/Gracz%20A%2FB')
+        assert response.status == 200
+        page = await response.text()
+        assert '/bilans/Gracz%20A%2FB/Gracz%20C"' in page
+        response = await client.get('/bilans/Gracz%20A%2FB/Gracz%20C')
+        assert response.status == 200
+        assert '/gracz/Gracz%20A%2FB"' in await response.text()
+
+    _serve(app, test)
+
+
+def test_metrics_only_when_enabled() -> None:
+    async def hidden(client: TestClient[web.Request, web.Application]) -> None:
+        assert (await client.get('/metrics')).status == 404
+
+    async def served(client: TestClient[web.Request, web.Application]) -> None:
+        response = await client.get('/metrics')
+        assert response.status == 200
+        assert 'szachy_request_duration_seconds' in await response.text()
+
+    _serve(make_app(':memory:'), hidden)
+    _serve(make_app(':memory:', serve_metrics=True), served)
+
+
+def test_reload(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    database = str(tmp_path / 'szachy.db')
+    Store(database).close()
+    app = make_app(database, reload=0.01)
+
+    # Requests for the index wait for a signal after taking the league.
+    entered, release = asyncio.Event(), asyncio.Event()
+    stream = League.stream
+
+    async def paused_stream(league: League, request: web.Request, key: Hashable, render: Callable[[], Iterable[str]]) -> web.StreamResponse:
+        entered.set()
+        await release.wait()
+        return await stream(league, request, key, render)
+
+    monkeypatch.setattr(League, 'stream', paused_stream)
+
+    async def test(client: TestClient[web.Request, web.Application]) -> None:
+        in_flight = asyncio.create_task(client.get('/'))
+        await entered.wait()
+
+        store = Store(database)
+        store.add_tournament(TournamentData(
+            date=datetime.date(2100, 1, 1),
+            location='Szachownica Testowa',
+            games=[GameData(100000, 'Nowy Gracz', 'Inny Gracz', '1. e4 1-0', 2, Termination.RESIGNATION, None)],
+        ))
+        store.close()
+
+        for _ in range(500):
+            response = await client.get('/api/ranking')
+            if any(record['player'] == 'Nowy Gracz' for record in await response.json()):
+                break
+            await asyncio.sleep(0.01)
+        else:
+            raise AssertionError('the new revision was not loaded')
+
+        release.set()
+        response = await in_flight
+        assert response.status == 200
+        assert 'Szachownica Testowa' not in await response.text()
+
+        response = await client.get('/')
+        assert 'Szachownica Testowa' in await response.text()
+
+    _serve(app, test)
+
+
+def test_indexes_built_in_background(tmp_path: Path) -> None:
+    database = str(tmp_path / 'szachy.db')
+    store = Store(database)
+    store.add_tournament(TournamentData(
+        date=datetime.date(2000, 1, 1),
+        location='Szachownica Testowa',
+        games=[GameData(100000, 'Gracz A', 'Gracz B', '1. e4 1-0', 2, Termination.RESIGNATION, None)],
+    ))
+    app = make_app(database)
+    # Starting the app leaves the indexes alone.
+    assert store.unindexed_games(1)
+    assert store.unexplored_games(1)
+    store.close()
+
+    async def test(client: TestClient[web.Request, web.Application]) -> None:
+        for _ in range(500):
+            response = await client.get('/pozycja', params={'fen': 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1'})
+            assert response.status == 200
+            if '/gra/100000"' in await response.text():
+                break
+            await asyncio.sleep(0.01)
+        else:
+            raise AssertionError('the game was not indexed')
+
+        assert (await client.get('/pozycja', params={'fen': 'not a position'})).status == 400
+
+        store = Store(database)
+        for _ in range(500):
+            if not store.unexplored_games(1):
+                break
+            await asyncio.sleep(0.01)
+        else:
+            raise AssertionError('the games were not added to the opening tree')
+        store.close()
+        assert '>e5<' in await (await client.get('/debiuty', params={'ruchy': 'e4'})).text()
+        assert (await client.get('/debiuty', params={'ruchy': 'e5'})).status == 400
+
+    _serve(app, test)
+
+
+def test_tournament_ids_stable() -> None:
+    store = Store(':memory:')
+    league = League(store, EloEngine())
+    last = league.tournaments[-1]
+    assert last.tid is not None
+
+    store.add_tournament(TournamentData(
+        date=datetime.date(2000, 1, 1),
+        location='Szachownica Testowa',
+        games=[GameData(100000, 'Nowy Gracz', 'Inny Gracz', '1. e4 1-0', 2, Termination.RESIGNATION, None)],
+    ))
+    league = League(store, EloEngine())
+    assert league.tournaments[0].location == 'Szachownica Testowa'
+    assert league.tournament_by_id(last.tid).location == last.location
+    assert league.tournament_by_id(last.tid).date == last.date
+    with pytest.raises(KeyError):
+        league.tournament_by_id(-1)
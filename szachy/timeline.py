@@ -0,0 +1,167 @@
+"""
+Per-player rating history, precomputed from replayed tournaments.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Sequence, Tuple
+import datetime
+
+import numpy as np
+import numpy.typing as npt
+
+from szachy.chess import InitialRatings, ScoreColumns, Scores, Tournament
+from szachy.games import player_column
+
+
+@dataclass(frozen=True)
+class PlayerEvent:
+    """
+    A player's participation in a single tournament.
+    """
+    tid: int  # Index into the chronological list of tournaments
+    date: datetime.date
+    rating_before: int
+    rating_after: int
+    adjustment: int
+    games_played: int
+    actual: int  # Doubled score, as in Score.actual
+    gids: List[int]
+
+
+class Timelines:
+    """
+    Events of all players as flat arrays grouped by player id.
+
+    Events of player i are those in range(offsets[i], offsets[i + 1]), in
+    chronological order, and the ids of the games of event j are in
+    gids[game_offsets[j]:game_offsets[j + 1]].
+    """
+    ARRAYS = ('dates', 'offsets', 'tids', 'ratings_before', 'adjustments', 'games_played', 'actual', 'gids', 'game_offsets')
+
+    def __init__(self, tournaments: Sequence[Tournament]) -> None:
+        self.player_ids: Dict[str, int] = {}
+        self.dates = np.array([tournament.date for tournament in tournaments], dtype='datetime64[D]')
+
+        # One event per player of every tournament. Scores over shared
+        # columns are gathered from them at once, others are read one by one.
+        parts: List[Tuple[npt.NDArray[np.int64], ...]] = []
+        ranges: Dict[int, Tuple[ScoreColumns, List[Tuple[int, int, int]]]] = {}  # Tournament id and rows by columns
+        for tid, tournament in enumerate(tournaments):
+            scores, initial_ratings = tournament.scores, tournament.initial_ratings
+            if isinstance(scores, Scores) and isinstance(initial_ratings, InitialRatings) and scores.columns is initial_ratings.columns:
+                ranges.setdefault(id(scores.columns), (scores.columns, []))[1].append((tid, scores.start, scores.stop))
+            else:
+                events = [
+                    (self.player_ids.setdefault(player, len(self.player_ids)), tid, initial_ratings[player], score.adjustment, score.games_played, score.actual)
+                    for player, score in scores.items()
+                ]
+                parts.append(tuple(np.array(column, dtype=np.int64) for column in zip(*events)) if events else ())
+
+        for columns, tournament_rows in ranges.values():
+            tids, starts, stops = (np.array(values, dtype=np.int64) for values in zip(*tournament_rows))
+            counts = stops - starts
+            rows = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            players = columns.player[rows]
+            ids = np.array([self.player_ids.get(player, -1) for player in columns.players], dtype=np.int64)
+            unique, first = np.unique(players, return_index=True)
+            for pid in unique[np.argsort(first)].tolist():
+                if ids[pid] < 0:
+                    ids[pid] = self.player_ids[columns.players[pid]] = len(self.player_ids)
+            parts.append((
+                ids[players],
+                np.repeat(tids, counts),
+                columns.initial_rating[rows].astype(np.int64),
+                columns.adjustment[rows].astype(np.int64),
+                columns.games_played[rows].astype(np.int64),
+                columns.actual[rows].astype(np.int64),
+            ))
+
+        pids, tids, ratings_before, adjustments, games_played, actual = (
+            np.concatenate([np.empty(0, dtype=np.int64), *(part[i] for part in parts if part)])
+            for i in range(6)
+        )
+
+        # Grouped by player, in chronological order within every player.
+        order = np.argsort(pids * len(tournaments) + tids)
+        self.offsets: npt.NDArray[np.intp] = np.searchsorted(pids[order], np.arange(len(self.player_ids) + 1))
+        self.tids = tids[order].astype(np.int32)
+        self.ratings_before = ratings_before[order].astype(np.int32)
+        self.adjustments = adjustments[order].astype(np.int32)
+        self.games_played = games_played[order].astype(np.int32)
+        self.actual = actual[order].astype(np.int32)
+
+        # Both sides of every game in order, keyed like the events by player
+        # and tournament: a stable sort groups them the same way.
+        game_lists = [tournament.games for tournament in tournaments]
+        lengths = np.array([len(games) for games in game_lists], dtype=np.intp)
+        game_pids = np.stack((
+            player_column(game_lists, 'white', self.player_ids),
+            player_column(game_lists, 'black', self.player_ids),
+        ), axis=1).ravel().astype(np.int64)
+        game_tids = np.repeat(np.arange(len(game_lists), dtype=np.int64), 2 * lengths)
+        game_gids = np.repeat(np.concatenate([np.empty(0, dtype=np.int64), *(games.column('gid') for games in game_lists)]), 2)
+        game_keys = game_pids * len(game_lists) + game_tids
+        game_order = np.argsort(game_keys, kind='stable')
+        self.gids = game_gids[game_order]
+
+        event_keys = pids[order] * len(game_lists) + self.tids
+        sorted_game_keys = game_keys[game_order]
+        self.game_offsets: npt.NDArray[np.intp] = np.append(
+            np.searchsorted(sorted_game_keys, event_keys),
+            len(sorted_game_keys),
+        ).astype(np.intp)
+
+    @classmethod
+    def from_arrays(cls, players: List[str], arrays: Mapping[str, npt.NDArray[Any]]) -> 'Timelines':
+        """
+        Timelines over existing arrays, such as those of a snapshot, named as
+        in ARRAYS. Players are in order of their ids.
+        """
+        timelines = cls.__new__(cls)
+        timelines.player_ids = {player: i for i, player in enumerate(players)}
+        for name in cls.ARRAYS:
+            setattr(timelines, name, arrays[name])
+        return timelines
+
+    def __contains__(self, player: str) -> bool:
+        return player in self.player_ids
+
+    def event_range(self, player: str) -> range:
+        """
+        Indices of the player's events. Raises KeyError.
+        """
+        pid = self.player_ids[player]
+        return range(int(self.offsets[pid]), int(self.offsets[pid + 1]))
+
+    def events(self, player: str) -> List[PlayerEvent]:
+        """
+        The player's events in chronological order. Raises KeyError.
+        """
+        events = self.event_range(player)
+        if not events:
+            return []
+
+        first, last = events.start, events.stop
+        game_bounds = self.game_offsets[first:last + 1].tolist()
+        gids = self.gids[game_bounds[0]:game_bounds[-1]].tolist()
+        base = game_bounds[0]
+
+        return [
+            PlayerEvent(
+                tid=tid,
+                date=date,
+                rating_before=rating,
+                rating_after=rating + adjustment,
+                adjustment=adjustment,
+                games_played=games_played,
+                actual=actual,
+                gids=gids[game_bounds[i] - base:game_bounds[i + 1] - base],
+            )
+            for i, (tid, date, rating, adjustment, games_played, actual) in enumerate(zip(
+                self.tids[first:last].tolist(),
+                self.dates[self.tids[first:last]].tolist(),
+                self.ratings_before[first:last].tolist(),
+                self.adjustments[first:last].tolist(),
+                self.games_played[first:last].tolist(),
+                self.actual[first:last].tolist(),
+            ))
+        ]
@@ -0,0 +1,36 @@
+"""
+Games and tournaments as plain data, shared by the literals in szachy.database,
+the store and the rating code. Kept apart from the literals, so that importing
+these types does not build them.
+"""
+from dataclasses import dataclass
+from datetime import date
+from enum import Enum
+from typing import List, Optional
+
+
+class Termination(Enum):
+    RESIGNATION = 1
+    CHECKMATE = 2
+    STALEMATE = 3
+    DRAW = 4  # Agreement, repetition and other draws without a stalemate
+    TIMEOUT = 5
+
+
+@dataclass(frozen=True, slots=True)
+class GameData:
+    gid: int
+    white: str
+    black: str
+    pgn: str
+    score: int  # Doubled to avoid floats (0 - Black wins, 1 - draw, 2 - White wins)
+    termination: Termination
+    chess_com_embed: Optional[int]  # FIXME: move elsewhere (and automate)
+
+
+@dataclass(frozen=True)
+class TournamentData:
+    date: date
+    location: str
+    games: List[GameData]
+    ranked: bool = True
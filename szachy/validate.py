@@ -0,0 +1,71 @@
+"""
+Replay all stored games and check them against the rules.
+
+Usage: python -m szachy validate [--database PATH]
+
+Reports games with illegal moves and games whose recorded termination or score
+does not match the final position. Exits with status 1 if any are found.
+"""
+from typing import Iterable, Iterator, List, Optional, Tuple
+import argparse
+import sys
+import time
+
+from szachy.board import IllegalMoveError, replay
+from szachy.store import Store
+from szachy.types import GameData, Termination, TournamentData
+
+
+def validate_game(game: GameData) -> Optional[str]:
+    """
+    Description of what is wrong with the game, None if nothing is.
+    """
+    try:
+        board = replay(game.pgn)
+    except IllegalMoveError as error:
+        return str(error)
+
+    if board.is_checkmate():
+        if game.termination != Termination.CHECKMATE:
+            return f'recorded as {game.termination.name.lower()}, but the final position is checkmate'
+        loser_score = 0 if board.turn == 0 else 2
+        if game.score != loser_score:
+            return 'score does not match the checkmate'
+    elif board.is_stalemate():
+        if game.termination != Termination.STALEMATE:
+            return f'recorded as {game.termination.name.lower()}, but the final position is stalemate'
+        if game.score != 1:
+            return 'score does not match the stalemate'
+    elif game.termination in (Termination.CHECKMATE, Termination.STALEMATE):
+        return f'recorded as {game.termination.name.lower()}, but the final position is not'
+
+    return None
+
+
+def validate(tournaments: Iterable[TournamentData]) -> Iterator[Tuple[GameData, str]]:
+    for tournament in tournaments:
+        for game in tournament.games:
+            problem = validate_game(game)
+            if problem is not None:
+                yield game, problem
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m szachy validate')
+    parser.add_argument('--database', type=str, default='szachy.db')
+    args = parser.parse_args(argv)
+
+    store = Store(args.database)
+    (game_count,) = store.connection.execute('SELECT COUNT(*) FROM games').fetchone()
+
+    start = time.perf_counter()
+    problems = 0
+    for game, problem in validate(store.iter_tournaments()):
+        print(f'gra #{game.gid} ({game.white} vs {game.black}): {problem}')
+        problems += 1
+    elapsed = time.perf_counter() - start
+    store.close()
+
+    print(f'{game_count} games, {problems} problems ({game_count / elapsed:.0f} games/s)')
+    if problems:
+        sys.exit(1)
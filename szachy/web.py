@@ -1,12 +1,64 @@
 import argparse
-from collections import defaultdict
-from typing import Dict, List, Tuple
+import asyncio
+import datetime
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from importlib import resources
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Set, Tuple, TypeVar, Union
 
 from aiohttp import web
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, PackageLoader, Template
+import numpy as np
 
-from szachy.chess import Game, Score, Tournament, compute_ratings, compute_ranking, elo_expected_score
-from szachy.database import Termination
+from szachy import api
+from szachy.assets import IMMUTABLE, Assets
+from szachy.cache import ResponseCache
+from szachy.chess import Score, Tournament, compute_ranking, elo_expected_scores
+from szachy.games import Game, player_column
+from szachy.headtohead import HeadToHead, HeadToHeadIndex, Meeting
+from szachy.metrics import Metrics, SlowRequestProfiler
+from szachy.openings import MAX_PLY, OpeningMove, explore, update_opening_tree
+from szachy.pairing import pair_rounds, round_robin
+from szachy.positions import PositionMatch, PositionResult, find_games, update_position_index
+from szachy.rating import ENGINES, EloEngine, RatingEngine
+from szachy.snapshot import Indexes, replay_with_snapshot
+from szachy.store import Store, StoreReader
+from szachy.timeline import PlayerEvent, Timelines
+from szachy.types import Termination
+
+TOURNAMENTS_PER_PAGE = 10  # On the index, newest first
+
+# Seconds spent on each step of make_app, in order.
+STARTUP_TIMINGS: web.AppKey[Dict[str, float]] = web.AppKey('startup_timings')
+
+# For the parent of forked workers, which reloads and indexes for them. Build
+# a league if the store changed, returning whether it did, and add a batch of
+# games to the indexes, returning whether there were any.
+RELOAD_LEAGUE: web.AppKey[Callable[[], bool]] = web.AppKey('reload_league')
+INDEX_BATCH: web.AppKey[Callable[[], bool]] = web.AppKey('index_batch')
+
+# Pages are sent in chunks as they are rendered, the header at once.
+FIRST_CHUNK_SIZE = 1024
+STREAM_CHUNK_SIZE = 16 * 1024
+
+# Games indexed at a time by the server, which stops in between when shut down.
+INDEX_BATCH_SIZE = 1000
+
+# Forked workers exiting sooner than that are not started again.
+WORKER_GRACE_SECONDS = 1.0
+# How often the parent of forked workers checks on them when it has nothing
+# else to do.
+WORKER_POLL_SECONDS = 0.1
+
+T = TypeVar('T')
 
 
 def _abbreviate_name(name: str) -> str:
@@ -14,6 +66,11 @@ def _abbreviate_name(name: str) -> str:
     return ''.join(f'{part[0]}. ' for part in parts[:-1]) + parts[-1]
 
 
+def _path_segment(value: str) -> str:
+    # Unlike urlencode, also quotes '/', which would split the segment in two.
+    return urllib.parse.quote(value, safe='')
+
+
 def _make_initials(name: str) -> str:
     parts = name.split(' ')
     return ''.join(f'{part[0]}. ' for part in parts)
@@ -24,7 +81,7 @@ def _format_score(score: int) -> str:
 
 
 class GameView:
-    def __init__(self, game: Game) -> None:
+    def __init__(self, game: Union[Game, PositionMatch]) -> None:
         self.gid = game.gid
         self.white = _abbreviate_name(game.white)
         self.black = _abbreviate_name(game.black)
@@ -70,150 +127,993 @@ class GameDetailedView(GameView):
             Termination.RESIGNATION: 'rezygnacja',
             Termination.CHECKMATE: 'szach mat',
             Termination.STALEMATE: 'pat',
+            Termination.DRAW: 'remis',
+            Termination.TIMEOUT: 'przekroczenie czasu',
         }[game.termination]
 
         self.chess_com_embed = game.chess_com_embed
         self.pgn = game.pgn
 
 
+class PositionView:
+    def __init__(self, fen: str, result: PositionResult) -> None:
+        self.fen = fen
+        self.total = result.total
+        self.scores = [
+            (label, count, f'{100 * count / result.total:.0f}' if result.total else '0')
+            for label, count in [
+                ('1-0', result.scores.get(2, 0)),
+                ('½-½', result.scores.get(1, 0)),
+                ('0-1', result.scores.get(0, 0)),
+            ]
+        ]
+        self.games = [
+            (
+                GameView(match),
+                f'{match.ply // 2 + 1}.' if match.ply % 2 == 0 else f'{match.ply // 2}...',
+            )
+            for match in result.games
+        ]
+
+
+class OpeningsView:
+    def __init__(self, path: List[str], moves: List[OpeningMove]) -> None:
+        # (SAN, path up to and including the move) for links to every prefix.
+        self.breadcrumbs = [(san, ','.join(path[:i + 1])) for i, san in enumerate(path)]
+        self.total = sum(move.games for move in moves)
+        self.moves = [
+            (
+                move.san,
+                ','.join([*path, move.san]),
+                move.games,
+                f'{100 * move.white_wins / move.games:.0f}',
+                f'{100 * move.draws / move.games:.0f}',
+                f'{100 * move.black_wins / move.games:.0f}',
+                f'{move.mean_rating:.0f}',
+            )
+            for move in moves
+        ]
+
+
+class PlayerView:
+    CHART_WIDTH = 600
+    CHART_HEIGHT = 200
+    CHART_MARGIN = 40
+
+    def __init__(self, name: str, events: List[PlayerEvent], tournaments: List[Tournament]) -> None:
+        self.name = name
+        self.rating = events[-1].rating_after if events else None
+        self.events = [
+            (
+                event.date,
+                tournaments[event.tid].location,
+                event.rating_before,
+                ScoreView(tournaments[event.tid].scores[name], tournaments[event.tid].ranked),
+                event.rating_after,
+                event.gids,
+            )
+            for event in reversed(events)
+        ]
+
+        # Rating after every tournament against its date, starting from the
+        # rating before the first one.
+        days = [event.date.toordinal() for event in events]
+        ratings = [event.rating_after for event in events]
+        if events:
+            days.insert(0, days[0] - 1)
+            ratings.insert(0, events[0].rating_before)
+
+        self.min_rating = min(ratings, default=0)
+        self.max_rating = max(ratings, default=0)
+        self.first_date = events[0].date if events else None
+        self.last_date = events[-1].date if events else None
+
+        width = self.CHART_WIDTH - 2 * self.CHART_MARGIN
+        height = self.CHART_HEIGHT - 2 * self.CHART_MARGIN
+        day_span = max(1, days[-1] - days[0]) if days else 1
+        rating_span = max(1, self.max_rating - self.min_rating)
+        self.points = ' '.join(
+            f'{self.CHART_MARGIN + width * (day - days[0]) / day_span:.1f},'
+            f'{self.CHART_MARGIN + height * (self.max_rating - rating) / rating_span:.1f}'
+            for day, rating in zip(days, ratings)
+        )
+
+
+class HeadToHeadView:
+    def __init__(self, record: HeadToHead, meetings: List[Meeting], tournaments: List[Tournament]) -> None:
+        self.record = record
+        self.meetings = [
+            (
+                meeting.date,
+                tournaments[meeting.tid].location,
+                meeting.white,
+                meeting.white_rating,
+                meeting.black,
+                meeting.black_rating,
+                {0: '0-1', 1: '½-½', 2: '1-0'}[meeting.score],
+                meeting.gid,
+            )
+            for meeting in reversed(meetings)
+        ]
+
+
 class PlannerView:
     def __init__(self, ratings: Dict[str, int], tournaments: List[Tournament]) -> None:
         players = [*ratings.keys()]
+        player_ids = {player: i for i, player in enumerate(players)}
         names = [*map(_abbreviate_name, players)]
         self.initials = [*map(_make_initials, players)]
 
-        game_counts: Dict[str, int] = defaultdict(int)
-        for tournament in tournaments:
-            for game in tournament.games:
-                game_counts[game.white] += 1
-                game_counts[game.black] += 1
+        white = player_column((tournament.games for tournament in tournaments), 'white', player_ids)
+        black = player_column((tournament.games for tournament in tournaments), 'black', player_ids)
 
+        game_counts = np.bincount(white, minlength=len(players)) + np.bincount(black, minlength=len(players))
         self.least_played = [
             (player, count)
-            for rank, player, count in compute_ranking(game_counts, lambda x: -x)
+            for rank, player, count in compute_ranking(dict(zip(players, game_counts.tolist())), lambda x: -x)
         ]
 
-        def probability(a: str, a_rating: int, b: str, b_rating: int) -> str:
-            if a == b:
-                return ''
+        rating_array = np.fromiter(ratings.values(), dtype=np.float64, count=len(players))
 
-            score = elo_expected_score(a_rating, b_rating)
-            return f'{50 * score:.0f}'
+        def probability_rows() -> Iterator[List[str]]:
+            # One row at a time, so the full matrix is never held in memory.
+            for i, rating in enumerate(rating_array):
+                percentages = np.rint(50 * elo_expected_scores(rating, rating_array)).astype(np.int64)
+                row = [*map(str, percentages.tolist())]
+                row[i] = ''
+                yield row
 
-        probability_matrix = [
-            [
-                probability(a, a_rating, b, b_rating)
-                for b, b_rating in ratings.items()
-            ]
-            for a, a_rating in ratings.items()
+        self.names_and_probabilities = zip(names, probability_rows())
+
+        color_counts = np.zeros((len(players), len(players)), dtype=np.int32)
+        np.add.at(color_counts, (white, black), 1)
+        np.add.at(color_counts, (black, white), -1)
+
+        unpaired = color_counts > 0
+        rows, columns = np.nonzero(unpaired)
+        self.unpaired_games: List[Tuple[str, str, int]] = [
+            (names[i], names[j], count)
+            for i, j, count in zip(rows.tolist(), columns.tolist(), color_counts[unpaired].tolist())
         ]
-        self.names_and_probabilities = zip(names, probability_matrix)
-
-        color_counts = [[0 for b in ratings] for a in ratings]
-        for tournament in tournaments:
-            for game in tournament.games:
-                i = players.index(game.white)
-                j = players.index(game.black)
-                color_counts[i][j] += 1
-                color_counts[j][i] -= 1
-
-        self.unpaired_games: List[Tuple[str, str, int]] = []
-        for i, row in enumerate(color_counts):
-            for j, count in enumerate(row):
-                if count <= 0:
+
+
+def _bytecode_cache() -> FileSystemBytecodeCache:
+    """
+    Cache of compiled templates next to them, like __pycache__ for modules,
+    or in a temporary directory if the package is read-only. Entries are
+    checked against the template source, so edits are picked up.
+    """
+    directory = str(resources.files('szachy') / 'templates' / '__pycache__')
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError:
+        return FileSystemBytecodeCache()
+    if not os.access(directory, os.W_OK):
+        return FileSystemBytecodeCache()
+    return FileSystemBytecodeCache(directory)
+
+
+def _fork_workers(
+    serve: Callable[[], None],
+    workers: int,
+    reload: float = 0,
+    reload_league: Callable[[], bool] = lambda: False,
+    index_batch: Callable[[], bool] = lambda: False,
+) -> int:
+    """
+    Run serve in the given number of forked processes until they are stopped,
+    returning how many times one failed. A failing worker prints its traceback
+    and exits with status 1, the others keep serving.
+
+    Workers leaving without being asked to are started again, unless they did
+    so within WORKER_GRACE_SECONDS of starting: those would most likely fail
+    again, for instance on a port in use. In the meantime the parent keeps the
+    store indexed a batch at a time with index_batch, which returns whether
+    there were any games to index, and with reload it calls reload_league that
+    often, in seconds. When that built a league from a changed store, the
+    workers are replaced one at a time by ones forked with it.
+
+    Objects allocated so far are moved out of reach of the garbage collector
+    before every fork. Collections would otherwise write to the headers of
+    every object they traverse, turning the pages shared with the parent into
+    private copies in each worker. Reference counting still writes to the
+    headers of the objects a request touches, so only the bulk of the state
+    stays shared: the game, timeline and head-to-head arrays and the PGN
+    buffer, whose contents are not Python objects, and the bodies of cached
+    responses beyond their first page.
+    """
+    started: Dict[int, float] = {}  # Of the running workers
+    retiring: Set[int] = set()  # Asked to stop, to be replaced
+    outdated: Set[int] = set()  # Forked before the last reload, to be retired
+    stopping = False
+    indexing = True
+    next_reload = time.monotonic() + reload
+    failed = 0
+
+    def spawn() -> None:
+        gc.freeze()
+        # Until the worker has dropped the handler of the parent, a SIGTERM
+        # would run it there.
+        signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGTERM})
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGTERM})
+            status = 0
+            try:
+                serve()
+            except BaseException:
+                traceback.print_exc()
+                status = 1
+            finally:
+                sys.stderr.flush()
+                os._exit(status)
+        started[pid] = time.monotonic()
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGTERM})
+
+    def reap(pid: int, status: int) -> None:
+        nonlocal failed
+        uptime = time.monotonic() - started.pop(pid)
+        code = os.waitstatus_to_exitcode(status)
+        if code != 0:
+            failed += 1
+            reason = f'signal {-code}' if code < 0 else f'status {code}'
+            print(f'Worker {pid} exited with {reason}', file=sys.stderr)
+        if pid in retiring:
+            retiring.discard(pid)
+        elif not stopping and uptime >= WORKER_GRACE_SECONDS:
+            print(f'Restarting worker {pid}', file=sys.stderr)
+            spawn()
+
+    def terminate(signum: int, frame: object) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in started:
+            os.kill(pid, signal.SIGTERM)
+
+    for _ in range(workers):
+        spawn()
+    signal.signal(signal.SIGTERM, terminate)
+
+    while started:
+        try:
+            if outdated and not retiring and not stopping:
+                pid = outdated.pop()
+                if pid in started:
+                    spawn()
+                    retiring.add(pid)
+                    os.kill(pid, signal.SIGTERM)
+                continue
+
+            waiting = stopping or not (indexing or retiring or reload > 0)
+            pid, status = os.waitpid(-1, 0 if waiting else os.WNOHANG)
+            if pid != 0:
+                reap(pid, status)
+            elif indexing:
+                try:
+                    indexing = index_batch()
+                except Exception:
+                    traceback.print_exc()
+                    indexing = False
+            elif reload > 0 and time.monotonic() >= next_reload and not retiring:
+                next_reload = time.monotonic() + reload
+                start = time.perf_counter()
+                try:
+                    reloaded = reload_league()
+                except Exception:
+                    traceback.print_exc()
                     continue
-                self.unpaired_games.append((
-                    names[i],
-                    names[j],
-                    count,
-                ))
+                if reloaded:
+                    # The previous league is only kept alive by the workers
+                    # now, the collector may have it in the parent.
+                    gc.unfreeze()
+                    print(f'Reloaded in {time.perf_counter() - start:.2f} s, restarting workers')
+                    outdated = {*started} - retiring
+                    indexing = True
+            else:
+                time.sleep(WORKER_POLL_SECONDS)
+        except KeyboardInterrupt:
+            # Ctrl+C reaches the whole process group, the workers shut down
+            # on their own.
+            stopping = True
+    return failed
 
 
-def main() -> None:
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--host', type=str, default='127.0.0.1')
-    parser.add_argument('--port', type=int, default=8080)
-    parser.add_argument('--webroot', type=str, default='')
-    args = parser.parse_args()
+class League:
+    """
+    Everything pages are rendered from, computed from one revision of the
+    store, and the cache of rendered pages. Never modified once built: a reload
+    builds a new instance and swaps it in.
+    """
+    def __init__(self, store: Store, engine: RatingEngine, snapshot: Optional[str] = None) -> None:
+        # Read before replaying, a change made in between is then picked up
+        # by the next reload instead of being missed.
+        self.timings: Dict[str, float] = {}  # Seconds spent on each step of building
+        start = time.perf_counter()
+
+        def lap(step: str) -> None:
+            nonlocal start
+            now = time.perf_counter()
+            self.timings[step] = now - start
+            start = now
+
+        self.version = store.revision()
+        indexes: Optional[Indexes] = None
+        if snapshot is None:
+            elo_ratings, elo_tournaments, self.total_scores = store.replay_ratings()
+        else:
+            (elo_ratings, elo_tournaments, self.total_scores), indexes = replay_with_snapshot(store, snapshot, self.version)
+        lap('history')
+
+        self.engine = engine
+        history = engine.rate(elo_ratings, elo_tournaments)
+        self.ratings = history.ratings
+        self.tournaments = history.tournaments
+        self.deviations = history.deviations
+        # Those of the snapshot are of the Elo ratings, and only of use if the
+        # engine kept them.
+        self._indexes = indexes if self.tournaments is elo_tournaments else None
+
+        self.cache = ResponseCache()
+
+        ranked_ratings = {
+            player: rating
+            for player, rating in self.ratings.items()
+            if engine.established(history, player, self.total_scores[player])
+        }
+
+        self.elo_ranking = [*compute_ranking(ranked_ratings, lambda rating: rating)]
+
+        unranked_ratings = {
+            player: rating
+            for player, rating in self.ratings.items()
+            if player not in ranked_ratings
+        }
+
+        self.unranked_listing = [
+            (player, rating)
+            for rank, player, rating in
+            compute_ranking(unranked_ratings, lambda rating: rating)
+        ]
+        lap('ratings')
+
+        # Tournament ids are indices into the chronological list. Games are
+        # looked up by gid in arrays sorted by it, holding the tournament id and
+        # the position within the tournament of each.
+        lengths = np.array([len(tournament.games) for tournament in self.tournaments], dtype=np.intp)
+        gids = np.concatenate([np.empty(0, dtype=np.int64), *(tournament.games.column('gid') for tournament in self.tournaments)])
+        tids = np.repeat(np.arange(len(self.tournaments)), lengths)
+        positions = np.arange(len(gids)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        order = np.argsort(gids, kind='stable')
+        self.sorted_gids = gids[order]
+        self.game_tids = tids[order]
+        self.game_positions = positions[order]
 
-    webroot = args.webroot
+        # Date of every tournament as an ordinal, in the order of the list.
+        self.tournament_dates = np.array([tournament.date.toordinal() for tournament in self.tournaments], dtype=np.int64)
+
+        # Tournaments by their id in the store, which unlike their position in
+        # the list does not change when an earlier one is added.
+        store_tids = np.array([tournament.tid for tournament in self.tournaments], dtype=np.int64)
+        self.tid_order = np.argsort(store_tids)
+        self.sorted_tids = store_tids[self.tid_order]
+        lap('lookups')
+
+    @cached_property
+    def timelines(self) -> Timelines:
+        """
+        From the snapshot, or built on first use.
+        """
+        return Timelines(self.tournaments) if self._indexes is None else self._indexes.timelines
+
+    @cached_property
+    def head_to_head(self) -> HeadToHeadIndex:
+        """
+        From the snapshot, or built on first use.
+        """
+        return HeadToHeadIndex(self.tournaments) if self._indexes is None else self._indexes.head_to_head
+
+    def tournaments_until(self, date: datetime.date) -> int:
+        """
+        Number of tournaments held on or before the date.
+        """
+        return int(np.searchsorted(self.tournament_dates, date.toordinal(), side='right'))
+
+    def tournament_by_id(self, tid: int) -> Tournament:
+        """
+        The tournament with the given id in the store. Raises KeyError.
+        """
+        i = int(np.searchsorted(self.sorted_tids, tid))
+        if i == len(self.sorted_tids) or self.sorted_tids[i] != tid:
+            raise KeyError(tid)
+        return self.tournaments[int(self.tid_order[i])]
+
+    def game_at(self, i: int) -> Tuple[int, Game]:
+        """
+        Tournament id and game of the i-th game in order of gids.
+        """
+        tid = int(self.game_tids[i])
+        return tid, self.tournaments[tid].games[int(self.game_positions[i])]
+
+    def game(self, gid: int) -> Tuple[int, Game]:
+        """
+        Tournament id and game with the given gid. Raises KeyError.
+        """
+        i = int(np.searchsorted(self.sorted_gids, gid))
+        if i == len(self.sorted_gids) or self.sorted_gids[i] != gid:
+            raise KeyError(gid)
+        return self.game_at(i)
+
+    def respond(self, request: web.Request, key: Hashable, content_type: str, render: Callable[[], str]) -> web.Response:
+        return self.cache.respond(request, self.version, key, content_type, render)
+
+    async def stream(self, request: web.Request, key: Hashable, render: Callable[[], Iterable[str]], cache: bool = True) -> web.StreamResponse:
+        return await self.cache.stream(request, self.version, key, 'text/html', render, cache)
+
+
+def _load_league(path: str, engine: RatingEngine, snapshot: Optional[str]) -> League:
+    """
+    League built from a new connection to the store. Runs in a background
+    thread.
+    """
+    store = Store(path)
+    try:
+        return League(store, engine, snapshot)
+    finally:
+        store.close()
+
+
+def _index_batch(store: Store) -> bool:
+    """
+    Add a batch of games to the position index, or once it is complete to the
+    opening tree, returning whether there were any.
+    """
+    return bool(update_position_index(store, INDEX_BATCH_SIZE, 1) or update_opening_tree(store, MAX_PLY, INDEX_BATCH_SIZE, 1))
+
+
+def make_app(
+    database: str,
+    webroot: str = '',
+    reload: float = 0,
+    profiler: Optional[SlowRequestProfiler] = None,
+    engine: Optional[RatingEngine] = None,
+    snapshot: Optional[str] = None,
+    serve_metrics: bool = False,
+    indexing: bool = True,
+) -> web.Application:
+    """
+    The application serving the league from the given store, computing
+    everything it needs up front. With reload, the store is checked for changes
+    that often, in seconds. Ratings are Elo unless another engine is given.
+    With a snapshot path, the replayed history is mapped from the snapshot
+    there, which is rebuilt whenever it is stale. Metrics are only served at
+    /metrics with serve_metrics, they are not for the public. Without indexing,
+    games are left out of the position index and the opening tree for the
+    caller to add.
+    """
+    if engine is None:
+        engine = EloEngine()
+
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
 
     routes = web.RouteTableDef()
-    routes.static(f'{webroot}/static', 'static')
+    routes.static(f'{webroot}/static', str(resources.files('szachy') / 'static'))
+    assets = Assets(webroot)
 
-    environment = Environment(loader=FileSystemLoader('templates/'), autoescape=True)
-    tpl_header_footer = environment.get_template('header_footer.html')
+    environment = Environment(loader=PackageLoader('szachy'), bytecode_cache=_bytecode_cache(), autoescape=True)
+    environment.globals.update(asset_url=assets.url, asset_srcset=assets.srcset, asset_variants=assets.variants_of)
+    environment.filters['path_segment'] = _path_segment
     tpl_index = environment.get_template('index.html')
     tpl_game = environment.get_template('game.html')
     tpl_style = environment.get_template('style.css')
     tpl_planner = environment.get_template('planner.html')
+    tpl_position = environment.get_template('position.html')
+    tpl_openings = environment.get_template('openings.html')
+    tpl_player = environment.get_template('player.html')
+    tpl_head_to_head = environment.get_template('headtohead.html')
+    timings['templates'] = time.perf_counter() - start
 
-    ratings, tournaments, total_scores = compute_ratings()
+    metrics = Metrics()
 
-    ranked_ratings = {
-        player: rating
-        for player, rating in ratings.items()
-        if total_scores[player].games_played >= 10
-    }
+    def render_page(template: Template, **context: Any) -> Iterator[str]:
+        """
+        The page in chunks of about STREAM_CHUNK_SIZE characters, each rendered
+        when asked for, so only rendering is timed and not sending. The first
+        one is flushed early, it holds the header.
+        """
+        pieces: List[str] = []
+        size = 0
+        limit = FIRST_CHUNK_SIZE
+        seconds = 0.0
+        start = time.perf_counter()
+        for piece in template.generate(webroot=webroot, rating_label=engine.label, **context):
+            pieces.append(piece)
+            size += len(piece)
+            if size >= limit:
+                seconds += time.perf_counter() - start
+                yield ''.join(pieces)
+                start = time.perf_counter()
+                pieces = []
+                size = 0
+                limit = STREAM_CHUNK_SIZE
+        seconds += time.perf_counter() - start
+        metrics.observe_phase('render', template.name or '?', seconds)
+        yield ''.join(pieces)
 
-    elo_ranking = [*compute_ranking(ranked_ratings, lambda rating: rating)]
+    start = time.perf_counter()
+    store = Store(database)
+    timings['store'] = time.perf_counter() - start
+    pid = os.getpid()
+    # Handlers take a reference to the current league once and use only that,
+    # so a reload swapping it in the meantime cannot mix two revisions.
+    current = League(store, engine, snapshot)
+    # Position and opening queries run in a background thread over a read-only
+    # connection of their own, opened by open_reader. An in-memory store cannot
+    # be opened twice, it is indexed up front and queried over its only
+    # connection.
+    reader: Optional[StoreReader] = None
+    query_executor: Optional[ThreadPoolExecutor] = None
+    if database == ':memory:':
+        update_position_index(store)
+        update_opening_tree(store)
 
-    unranked_ratings = {
-        player: rating
-        for player, rating in ratings.items()
-        if total_scores[player].games_played < 10
-    }
+    async def query(run: Callable[[Union[Store, StoreReader]], T]) -> T:
+        if reader is None or query_executor is None:
+            return run(store)
+        return await asyncio.get_running_loop().run_in_executor(query_executor, run, reader)
 
-    unranked_listing = [
-        (player, rating)
-        for rank, player, rating in
-        compute_ranking(unranked_ratings, lambda rating: rating)
-    ]
+    def render_index(league: League, stop: int) -> Iterator[str]:
+        """
+        The index with the page of tournaments before the stop-th, newest
+        first. The ranking is only shown with the newest ones.
+        """
+        count = len(league.tournaments)
+        start = max(0, stop - TOURNAMENTS_PER_PAGE)
+        with metrics.time('view', 'TournamentView'):
+            tournament_summaries = [TournamentView(league.tournaments[tid]) for tid in reversed(range(start, stop))]
+        return render_page(
+            tpl_index,
+            latest=stop == count,
+            elo_ranking=league.elo_ranking,
+            unranked_listing=league.unranked_listing,
+            deviations=league.deviations,
+            total_scores=league.total_scores,
+            tournaments=tournament_summaries,
+            first_number=start + 1,
+            last_number=stop,
+            tournament_count=count,
+            newer=None if stop == count else min(count, stop + TOURNAMENTS_PER_PAGE),
+            older=start if start > 0 else None,
+            first_date=league.tournaments[0].date if count else None,
+            last_date=league.tournaments[-1].date if count else None,
+        )
+
+    def render_planner(league: League, attending: Tuple[str, ...] = (), rounds: int = 1, all_play_all: bool = False) -> Iterator[str]:
+        # Probabilities are computed lazily and so counted as rendering.
+        with metrics.time('view', 'PlannerView'):
+            view = PlannerView(league.ratings, league.tournaments)
+        with metrics.time('view', 'pairing'):
+            if all_play_all:
+                pairings = round_robin(attending, league.ratings)
+            else:
+                pairings = pair_rounds(attending, league.ratings, league.tournaments, rounds)
+        return render_page(
+            tpl_planner,
+            planner=view,
+            players=sorted(league.ratings),
+            attending=attending,
+            rounds=rounds,
+            all_play_all=all_play_all,
+            pairings=pairings,
+        )
 
-    games_by_gid = {
-        game.gid: game
-        for tournament in tournaments
-        for game in tournament.games
-    }
+    def render_style() -> str:
+        return tpl_style.render(webroot=webroot)
 
     @routes.get(webroot)
     @routes.get(f'{webroot}/')
-    async def index(request: web.Request) -> web.Response:
-        tournament_summaries = [*map(TournamentView, tournaments)]
-        content = tpl_index.render(
-            webroot=webroot,
-            elo_ranking=elo_ranking,
-            unranked_listing=unranked_listing,
-            total_scores=total_scores,
-            tournaments=tournament_summaries,
-        )
-        text = tpl_header_footer.render(webroot=webroot, content=content)
-        return web.Response(text=text, content_type='text/html')
+    async def index(request: web.Request) -> web.StreamResponse:
+        """
+        Tournaments before the przed-th, or those up to the date in data, a
+        page at a time. Without either, the newest ones.
+        """
+        league = current
+        count = len(league.tournaments)
+        try:
+            if 'data' in request.query:
+                stop = league.tournaments_until(datetime.date.fromisoformat(request.query['data']))
+            else:
+                stop = int(request.query.get('przed', count))
+        except ValueError:
+            raise web.HTTPBadRequest
+        if stop > count:
+            stop = count
+        elif stop <= 0:
+            stop = min(count, TOURNAMENTS_PER_PAGE)  # The oldest page, before the first tournament
+
+        return await league.stream(request, ('index', stop), lambda: render_index(league, stop))
 
     @routes.get(f'{webroot}/gra/{{gid}}')
-    async def game_details(request: web.Request) -> web.Response:
+    async def game_details(request: web.Request) -> web.StreamResponse:
+        league = current
         try:
-            game = games_by_gid[int(request.match_info['gid'])]
+            _, game = league.game(int(request.match_info['gid']))
         except ValueError:
             raise web.HTTPBadRequest
         except KeyError:
             raise web.HTTPNotFound
 
-        content = tpl_game.render(webroot=webroot, game=GameDetailedView(game))
-        text = tpl_header_footer.render(webroot=webroot, content=content)
-        return web.Response(text=text, content_type='text/html')
+        def render() -> Iterator[str]:
+            with metrics.time('view', 'GameDetailedView'):
+                view = GameDetailedView(game)
+            return render_page(tpl_game, game=view)
+
+        return await league.stream(request, ('game', game.gid), render)
+
+    @routes.get(f'{webroot}/gracz/{{name}}')
+    async def player(request: web.Request) -> web.StreamResponse:
+        league = current
+        name = request.match_info['name']
+        if name not in league.timelines:
+            raise web.HTTPNotFound
+
+        def render() -> Iterator[str]:
+            with metrics.time('view', 'PlayerView'):
+                view = PlayerView(name, league.timelines.events(name), league.tournaments)
+            return render_page(
+                tpl_player,
+                player=view,
+                deviation=league.deviations.get(name),
+                opponents=league.head_to_head.opponents(name),
+            )
+
+        return await league.stream(request, ('player', name), render)
+
+    @routes.get(f'{webroot}/bilans/{{player}}/{{opponent}}')
+    async def head_to_head(request: web.Request) -> web.StreamResponse:
+        league = current
+        player, opponent = request.match_info['player'], request.match_info['opponent']
+        if player not in league.head_to_head or opponent not in league.head_to_head or player == opponent:
+            raise web.HTTPNotFound
+
+        def render() -> Iterator[str]:
+            with metrics.time('view', 'HeadToHeadView'):
+                view = HeadToHeadView(
+                    league.head_to_head.head_to_head(player, opponent),
+                    league.head_to_head.meetings(player, opponent),
+                    league.tournaments,
+                )
+            return render_page(tpl_head_to_head, head_to_head=view)
+
+        return await league.stream(request, ('head_to_head', player, opponent), render)
 
     @routes.get(f'{webroot}/planer')
-    async def planner(request: web.Request) -> web.Response:
-        content = tpl_planner.render(webroot=webroot, planner=PlannerView(ratings, tournaments))
-        text = tpl_header_footer.render(webroot=webroot, content=content)
-        return web.Response(text=text, content_type='text/html')
+    async def planner(request: web.Request) -> web.StreamResponse:
+        league = current
+        attending = tuple(dict.fromkeys(request.query.getall('gracz', [])))
+        all_play_all = request.query.get('system') == 'kolowy'
+        try:
+            rounds = int(request.query.get('rundy', '1'))
+        except ValueError:
+            raise web.HTTPBadRequest
+        if not 1 <= rounds <= 50:
+            raise web.HTTPBadRequest
+
+        # Pages for user input (attendance, positions, move sequences) are not
+        # cached, there are too many of them.
+        return await league.stream(
+            request,
+            ('planner', attending, rounds, all_play_all),
+            lambda: render_planner(league, attending, rounds, all_play_all),
+            cache=not attending,
+        )
+
+    @routes.get(f'{webroot}/pozycja')
+    async def position(request: web.Request) -> web.StreamResponse:
+        league = current
+        fen = request.query.get('fen', '').strip()
+        if not fen:
+            def render_form() -> Iterator[str]:
+                return render_page(tpl_position, position=None)
+
+            return await league.stream(request, 'position', render_form)
+
+        try:
+            result = await query(lambda connection: find_games(connection, fen))
+        except ValueError:
+            raise web.HTTPBadRequest
+
+        def render() -> Iterator[str]:
+            with metrics.time('view', 'PositionView'):
+                view = PositionView(fen, result)
+            return render_page(tpl_position, position=view)
+
+        return await league.stream(request, ('position', fen), render, cache=False)
+
+    @routes.get(f'{webroot}/debiuty')
+    async def openings(request: web.Request) -> web.StreamResponse:
+        league = current
+        path = [san for san in request.query.get('ruchy', '').split(',') if san]
+        try:
+            board, moves = await query(lambda connection: explore(connection, path))
+        except ValueError:
+            raise web.HTTPBadRequest
+
+        def render() -> Iterator[str]:
+            with metrics.time('view', 'OpeningsView'):
+                view = OpeningsView(path, moves)
+            return render_page(tpl_openings, openings=view, fen=board.fen())
+
+        return await league.stream(request, ('openings', tuple(path)), render, cache=not path)
+
+    def next_page(request: web.Request, cursor: Optional[int]) -> Optional[str]:
+        if cursor is None:
+            return None
+        return str(request.rel_url.update_query(po=cursor))
+
+    @routes.get(f'{webroot}/api/ranking')
+    async def api_ranking(request: web.Request) -> web.Response:
+        league = current
+
+        def render() -> str:
+            ranked = {player for _, player, _ in league.elo_ranking}
+            return api.dumps(api.ranking_records(league.ratings, league.total_scores, ranked.__contains__, league.deviations))
+
+        return league.respond(request, ('api', 'ranking'), 'application/json', render)
+
+    @routes.get(f'{webroot}/api/turnieje')
+    async def api_tournaments(request: web.Request) -> web.StreamResponse:
+        league = current
+        cursor, limit = api.parse_page(request)
+        indices, next_cursor = api.page(league.sorted_tids, cursor, limit)
+        records = (api.tournament_record(league.tournaments[int(league.tid_order[i])]) for i in indices)
+        return await api.stream_ndjson(request, records, next_page(request, next_cursor))
+
+    @routes.get(f'{webroot}/api/turnieje/{{tid}}')
+    async def api_tournament(request: web.Request) -> web.Response:
+        league = current
+        try:
+            tournament = league.tournament_by_id(int(request.match_info['tid']))
+        except ValueError:
+            raise web.HTTPBadRequest
+        except KeyError:
+            raise web.HTTPNotFound
+
+        def render() -> str:
+            return api.dumps(api.tournament_record(tournament))
+
+        return league.respond(request, ('api', 'tournament', tournament.tid), 'application/json', render)
+
+    @routes.get(f'{webroot}/api/gry')
+    async def api_games(request: web.Request) -> web.StreamResponse:
+        league = current
+        cursor, limit = api.parse_page(request)
+        indices, next_cursor = api.page(league.sorted_gids, cursor, limit)
+        records = (
+            api.game_record(game, league.tournaments[tid])
+            for tid, game in map(league.game_at, indices)
+        )
+        return await api.stream_ndjson(request, records, next_page(request, next_cursor))
+
+    @routes.get(f'{webroot}/api/gry/{{gid}}')
+    async def api_game(request: web.Request) -> web.Response:
+        league = current
+        try:
+            tid, game = league.game(int(request.match_info['gid']))
+        except ValueError:
+            raise web.HTTPBadRequest
+        except KeyError:
+            raise web.HTTPNotFound
+
+        def render() -> str:
+            return api.dumps(api.game_record(game, league.tournaments[tid]))
+
+        return league.respond(request, ('api', 'game', game.gid), 'application/json', render)
+
+    @routes.get(f'{webroot}/api/gracze/{{name}}')
+    async def api_player(request: web.Request) -> web.StreamResponse:
+        league = current
+        player = request.match_info['name']
+        if player not in league.timelines:
+            raise web.HTTPNotFound
+
+        cursor, limit = api.parse_page(request)
+        events = league.timelines.events(player)
+        keys = [api.chronological_key(league.tournaments[event.tid]) for event in events]
+        indices, next_cursor = api.page(keys, cursor, limit)
+        records = api.player_records((events[i] for i in indices), league.tournaments)
+        return await api.stream_ndjson(request, records, next_page(request, next_cursor))
+
+    @routes.get(f'{webroot}/api/bilans/{{player}}/{{opponent}}')
+    async def api_head_to_head(request: web.Request) -> web.Response:
+        league = current
+        player, opponent = request.match_info['player'], request.match_info['opponent']
+        if player not in league.head_to_head or opponent not in league.head_to_head or player == opponent:
+            raise web.HTTPNotFound
+
+        def render() -> str:
+            return api.dumps(api.head_to_head_record(
+                league.head_to_head.head_to_head(player, opponent),
+                league.head_to_head.meetings(player, opponent),
+                league.tournaments,
+            ))
+
+        return league.respond(request, ('api', 'head_to_head', player, opponent), 'application/json', render)
+
+    if serve_metrics:
+        @routes.get(f'{webroot}/metrics')
+        async def metrics_endpoint(request: web.Request) -> web.Response:
+            return web.Response(text=metrics.prometheus(), content_type='text/plain', headers={'Cache-Control': 'no-cache'})
 
     @routes.get(f'{webroot}/style.css')
     async def style(request: web.Request) -> web.Response:
-        text = tpl_style.render(webroot=webroot)
-        return web.Response(text=text, content_type='text/css')
+        return current.respond(request, 'style', 'text/css', render_style)
+
+    @routes.get(f'{webroot}/assets/{{name}}')
+    async def built_asset(request: web.Request) -> web.FileResponse:
+        """
+        Built assets, named after their content and so cached for good.
+        """
+        try:
+            path = assets.path(request.match_info['name'])
+        except KeyError:
+            raise web.HTTPNotFound
+        return web.FileResponse(path, headers={'Cache-Control': IMMUTABLE})
 
-    app = web.Application()
+    async def reopen_store(app: web.Application) -> None:
+        # SQLite connections must not be used across a fork, every forked
+        # worker opens its own.
+        nonlocal store
+        if os.getpid() != pid:
+            store = Store(database)
+
+    async def open_reader(app: web.Application) -> AsyncIterator[None]:
+        nonlocal reader, query_executor
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(1) as executor:
+            reader = await loop.run_in_executor(executor, StoreReader, database)
+            query_executor = executor
+            yield
+            query_executor = None
+            await loop.run_in_executor(executor, reader.close)
+            reader = None
+
+    async def index_store(app: web.Application) -> AsyncIterator[None]:
+        """
+        Add games to the position index and the opening tree in a background
+        thread with a connection of its own, once the league is built at
+        startup and after every reload. The importer indexes the positions of
+        the games it adds, but their ratings, which the opening tree counts,
+        are only known once a league built from them has replayed them. Pages
+        show the games once they are added.
+        """
+        async def index() -> None:
+            indexed_version = None
+            while True:
+                league = current
+                if league.version != indexed_version:
+                    try:
+                        while await loop.run_in_executor(executor, _index_batch, indexer):
+                            pass
+                    except Exception:
+                        traceback.print_exc()
+                    else:
+                        indexed_version = league.version
+                if reload <= 0:
+                    return
+                await asyncio.sleep(reload)
+
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(1) as executor:
+            indexer = await loop.run_in_executor(executor, Store, database)
+            task = asyncio.create_task(index())
+            yield
+            task.cancel()
+            await loop.run_in_executor(executor, indexer.close)
+
+    async def watch_store(app: web.Application) -> AsyncIterator[None]:
+        """
+        Poll the store for a new revision and swap in a league built from it.
+
+        Polls only read the revision over a read-only connection. The league
+        is built in a background thread with its own connection, requests keep
+        being served from the previous one in the meantime.
+        """
+        async def watch() -> None:
+            nonlocal current
+            while True:
+                await asyncio.sleep(reload)
+                start = time.perf_counter()
+                try:
+                    if await loop.run_in_executor(executor, revision_reader.revision) == current.version:
+                        continue
+                    league = await loop.run_in_executor(executor, _load_league, database, engine, snapshot)
+                except Exception:
+                    traceback.print_exc()
+                    continue
+                current = league
+                print(f'Reloaded revision {league.version} in {time.perf_counter() - start:.2f} s')
+
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(1) as executor:
+            revision_reader = await loop.run_in_executor(executor, StoreReader, database)
+            task = asyncio.create_task(watch())
+            yield
+            task.cancel()
+            await loop.run_in_executor(executor, revision_reader.close)
+
+    def reload_league() -> bool:
+        nonlocal current
+        if store.revision() == current.version:
+            return False
+        current = League(store, engine, snapshot)
+        return True
+
+    timings.update(current.timings)
+
+    app = web.Application(middlewares=[metrics.middleware(profiler)])
+    app[STARTUP_TIMINGS] = timings
+    app[RELOAD_LEAGUE] = reload_league
+    app[INDEX_BATCH] = lambda: _index_batch(store)
     app.add_routes(routes)
-    web.run_app(app, host=args.host, port=args.port)
+    if profiler is not None:
+        app.cleanup_ctx.append(profiler.run)
+    app.on_startup.append(reopen_store)
+    if database != ':memory:':
+        app.cleanup_ctx.append(open_reader)
+        if indexing:
+            app.cleanup_ctx.append(index_store)
+    if reload > 0:
+        app.cleanup_ctx.append(watch_store)
+    return app
+
+
+def main(import_seconds: Optional[float] = None) -> None:
+    """
+    Run the server. Startup times are logged with the time taken to import
+    this module if the caller measured it.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--webroot', type=str, default='')
+    parser.add_argument('--database', type=str, default='szachy.db')
+    parser.add_argument('--workers', type=int, default=1, help='server processes sharing the port')
+    parser.add_argument('--reload', type=float, default=0, metavar='SECONDS',
+                        help='check the database for changes this often and reload without a restart')
+    parser.add_argument('--metrics', action='store_true', help='serve Prometheus metrics at /metrics')
+    parser.add_argument('--profile-slow', type=float, default=0, metavar='SECONDS',
+                        help='sample stacks and dump them for requests slower than this')
+    parser.add_argument('--profile-output', type=str, default='slow_requests.folded')
+    parser.add_argument('--rating', choices=[*ENGINES], default='elo', help='rating system shown on the pages')
+    parser.add_argument('--snapshot', type=str, default=None, metavar='PATH',
+                        help='snapshot of the replayed history, defaults to the database path with .snapshot appended')
+    parser.add_argument('--no-snapshot', action='store_true', help='replay the history at startup instead')
+    args = parser.parse_args()
+
+    profiler = SlowRequestProfiler(args.profile_output, args.profile_slow) if args.profile_slow > 0 else None
+    snapshot = None if args.no_snapshot else args.snapshot or f'{args.database}.snapshot'
+    # Forked workers leave reloading and indexing to their parent.
+    forked = args.workers > 1
+    app = make_app(
+        args.database, args.webroot, 0 if forked else args.reload, profiler, ENGINES[args.rating], snapshot,
+        args.metrics, indexing=not forked,
+    )
+
+    startup_timings = app[STARTUP_TIMINGS]
+    timings = startup_timings if import_seconds is None else {'import': import_seconds, **startup_timings}
+    breakdown = ', '.join(f'{step} {1000 * seconds:.0f} ms' for step, seconds in timings.items())
+    print(f'Started in {sum(timings.values()):.2f} s ({breakdown})')
+
+    if not forked:
+        web.run_app(app, host=args.host, port=args.port)
+        return
+
+    def serve() -> None:
+        sock = socket.create_server((args.host, args.port), reuse_port=True)
+        web.run_app(app, sock=sock, print=None)
+
+    print(f'======== Running on http://{args.host}:{args.port} with {args.workers} workers ========')
+    if _fork_workers(serve, args.workers, args.reload, app[RELOAD_LEAGUE], app[INDEX_BATCH]):
+        sys.exit(1)